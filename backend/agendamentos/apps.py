@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class AgendamentosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'agendamentos'
+
+    def ready(self):
+        from . import calendario
+        from .models import Agendamento
+        # Cached month views (see agendamentos.calendario); bulk paths call invalidar() themselves
+        post_save.connect(calendario.invalidar, sender=Agendamento, dispatch_uid='agendamentos_calendario_save')
+        post_delete.connect(calendario.invalidar, sender=Agendamento, dispatch_uid='agendamentos_calendario_delete')
@@ -0,0 +1,88 @@
+"""
+Month view of the agenda: number of agendamentos per day and status.
+
+One GROUP BY (data, status) over the month, answered from the agendamento_data_status_idx
+index, turned into a payload of a few hundred bytes and cached per month. The cached
+months are dropped as a whole whenever an agendamento is saved or deleted (see
+AgendamentosConfig.ready), which is simpler and safer than working out which months an
+edit touched (an update may move an agendamento to another month).
+"""
+import calendar
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Agendamento, AgendamentoStatus
+
+CACHE_PREFIX = 'agendamentos:calendario'
+VERSAO_KEY = f'{CACHE_PREFIX}:versao'
+
+# Order of the counts in each day's list
+STATUS = [value for value, _ in AgendamentoStatus.choices]
+
+
+def _versao():
+    versao = cache.get(VERSAO_KEY)
+    if versao is None:
+        # Seeded with the clock, not 1, so an evicted version key cannot bring back
+        # months cached under an earlier version
+        versao = time.time_ns()
+        cache.add(VERSAO_KEY, versao, timeout=None)
+        versao = cache.get(VERSAO_KEY, versao)
+    return versao
+
+
+def _nova_versao():
+    try:
+        cache.incr(VERSAO_KEY)
+    except ValueError: # Not set yet, nothing cached under it
+        pass
+
+
+def invalidar(**kwargs):
+    """
+    Forget every cached month. Also a post_save/post_delete receiver for Agendamento.
+
+    Done right away and again on commit: a month read by another request before the
+    change committed would otherwise stay cached with the old counts.
+    """
+    _nova_versao()
+    transaction.on_commit(_nova_versao)
+
+
+def contar_mes(ano, mes):
+    """{'mes', 'status', 'dias': {date: [count per status, in STATUS order]}, 'totais'}, one query."""
+    inicio = datetime.date(ano, mes, 1)
+    fim = datetime.date(ano, mes, calendar.monthrange(ano, mes)[1])
+    dias = {}
+    totais = [0] * len(STATUS)
+    linhas = (
+        Agendamento.objects.filter(data__range=(inicio, fim))
+        .values_list('data', 'status').annotate(total=Count('*')).order_by()
+    )
+    for data, status, total in linhas:
+        indice = STATUS.index(status)
+        dias.setdefault(data.isoformat(), [0] * len(STATUS))[indice] = total
+        totais[indice] += total
+    return {
+        'mes': f'{ano:04d}-{mes:02d}',
+        'status': STATUS,
+        'dias': dict(sorted(dias.items())),
+        'totais': dict(zip(STATUS, totais)),
+    }
+
+
+def calendario_mes(ano, mes):
+    """contar_mes() through the cache, unless AGENDA_CALENDARIO_CACHE_SEGUNDOS is 0."""
+    if settings.AGENDA_CALENDARIO_CACHE_SEGUNDOS <= 0:
+        return contar_mes(ano, mes)
+    chave = f'{CACHE_PREFIX}:{_versao()}:{ano:04d}-{mes:02d}'
+    dados = cache.get(chave)
+    if dados is None:
+        dados = contar_mes(ano, mes)
+        cache.set(chave, dados, settings.AGENDA_CALENDARIO_CACHE_SEGUNDOS)
+    return dados
@@ -0,0 +1,94 @@
+"""
+Slot availability for the agenda.
+
+The working day is split into slots of AGENDA_GRANULARIDADE_MINUTOS between
+AGENDA_HORA_INICIO and AGENDA_HORA_FIM (the last bookable time). For each day the booked
+slots are kept as a bitmap, an int with bit i set when slot i is taken, so a date range
+costs one query for the bookings and a few integer operations per day.
+"""
+import datetime
+
+from django.conf import settings
+
+from .models import Agendamento
+
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def _parse_hora(value):
+    return value if isinstance(value, datetime.time) else datetime.time.fromisoformat(value)
+
+
+class Agenda:
+    """Business hours, open weekdays and holidays, read from settings unless given."""
+
+    def __init__(self, hora_inicio=None, hora_fim=None, granularidade=None, dias_semana=None, feriados=None):
+        self.hora_inicio = _parse_hora(hora_inicio or settings.AGENDA_HORA_INICIO)
+        self.hora_fim = _parse_hora(hora_fim or settings.AGENDA_HORA_FIM)
+        self.granularidade = granularidade or settings.AGENDA_GRANULARIDADE_MINUTOS
+        self.dias_semana = frozenset(settings.AGENDA_DIAS_SEMANA if dias_semana is None else dias_semana)
+        feriados = settings.AGENDA_FERIADOS if feriados is None else feriados
+        self.feriados = frozenset(
+            f if isinstance(f, datetime.date) else datetime.date.fromisoformat(f.strip()) for f in feriados if f
+        )
+        if self.granularidade <= 0:
+            raise ValueError("A granularidade deve ser positiva.")
+        inicio = _minutos(self.hora_inicio)
+        self.slots = [
+            datetime.time(m // 60, m % 60)
+            for m in range(inicio, _minutos(self.hora_fim) + 1, self.granularidade)
+        ]
+        self.mascara_dia = (1 << len(self.slots)) - 1 # Every slot of an open day
+
+    def horario_permitido(self, hora):
+        """True if `hora` is within business hours."""
+        return self.hora_inicio <= hora <= self.hora_fim
+
+    def dia_aberto(self, data):
+        return data.weekday() in self.dias_semana and data not in self.feriados
+
+    def slot(self, hora):
+        """Index of the slot containing `hora`, or None outside business hours."""
+        if not self.horario_permitido(hora):
+            return None
+        return (_minutos(hora) - _minutos(self.hora_inicio)) // self.granularidade
+
+    def ocupacao(self, inicio, fim):
+        """
+        {date: bitmap of booked slots} for the days between `inicio` and `fim`, in one query.
+        Cancelled agendamentos count too: the (data, hora) unique constraint still holds them.
+        """
+        ocupados = {}
+        for data, hora in Agendamento.objects.filter(data__range=(inicio, fim)).values_list('data', 'hora'):
+            indice = self.slot(hora)
+            if indice is not None:
+                ocupados[data] = ocupados.get(data, 0) | (1 << indice)
+        return ocupados
+
+    def livres(self, inicio, fim):
+        """Yield (date, bitmap of free slots) for every day between `inicio` and `fim`."""
+        ocupados = self.ocupacao(inicio, fim)
+        data = inicio
+        while data <= fim:
+            if self.dia_aberto(data):
+                yield data, self.mascara_dia & ~ocupados.get(data, 0)
+            else:
+                yield data, 0
+            data += datetime.timedelta(days=1)
+
+    def horarios(self, mascara):
+        """Slot start times set in `mascara`."""
+        return [self.slots[i] for i in range(len(self.slots)) if mascara >> i & 1]
+
+    def disponibilidade(self, inicio, fim):
+        """Free slots per day, ready to be serialized."""
+        return [
+            {
+                'data': data,
+                'aberto': self.dia_aberto(data),
+                'livres': [hora.strftime('%H:%M') for hora in self.horarios(mascara)],
+            }
+            for data, mascara in self.livres(inicio, fim)
+        ]
@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import json
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from agendamentos.models import Agendamento
+from agendamentos.views import AgendamentoViewSet
+from pacientes.models import Endereco, Paciente
+from usuarios.models import CustomUser, UserRole
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire N parallel POST /api/agendamentos/ at the same slot and report how many succeed "
+        "(exactly one should) and the latency under contention. Works on the configured "
+        "database with committed rows, removed at the end; use a database that supports "
+        "concurrent writers (PostgreSQL) for meaningful numbers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=16, help='Parallel requests per round.')
+        parser.add_argument('--rounds', type=int, default=5, help='Slots contended, one after the other.')
+        parser.add_argument('--idempotency', action='store_true',
+                            help='Send every request of a round with the same Idempotency-Key (retries).')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        n = options['requests']
+        marker = uuid.uuid4().hex[:8]
+        user = CustomUser.objects.create_user(username=f'bench-{marker}', password=None, role=UserRole.SECRETARIA)
+        endereco = Endereco.objects.create(cep='00000-000', uf='SP', cidade='Benchmark', logradouro='Rua Benchmark', bairro='Centro')
+        pacientes = [
+            Paciente.objects.create(
+                cpf=f"{marker}{i:03d}", nome=f"Benchmark {i}", nascimento='1990-01-01', celular='11900000000',
+                email=f"bench-{marker}-{i}@example.com", endereco_residencial=endereco,
+            )
+            for i in range(n)
+        ]
+        data = datetime.date.today() + datetime.timedelta(days=3650) # Far from real bookings
+        try:
+            rounds = [
+                self._round(user, pacientes, data, datetime.time(8 + r % 10, 0), options['idempotency'])
+                for r in range(options['rounds'])
+            ]
+        finally:
+            Agendamento.objects.filter(paciente__in=pacientes).delete()
+            Paciente.objects.filter(pk__in=[p.pk for p in pacientes]).delete()
+            endereco.delete()
+            user.delete()
+
+        latencies = sorted(ms for r in rounds for ms in r['latencies_ms'])
+        statuses = {}
+        for r in rounds:
+            for code, count in r['statuses'].items():
+                statuses[code] = statuses.get(code, 0) + count
+        result = {
+            'requests': n,
+            'rounds': len(rounds),
+            'successes_per_round': [r['statuses'].get(201, 0) for r in rounds],
+            'booked_per_round': [r['booked'] for r in rounds],
+            'statuses': statuses,
+            'p50_ms': statistics.median(latencies),
+            'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'max_ms': latencies[-1],
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        self.stdout.write(f"{n} parallel requests x {len(rounds)} slots ({connection.vendor})")
+        self.stdout.write(f"successes per slot: {result['successes_per_round']}, statuses: {statuses}")
+        self.stdout.write(f"agendamentos created per slot: {result['booked_per_round']}")
+        self.stdout.write(f"latency p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, max {result['max_ms']:.1f} ms")
+
+    def _round(self, user, pacientes, data, hora, idempotency):
+        barrier = threading.Barrier(len(pacientes))
+        key = uuid.uuid4().hex
+        factory = APIRequestFactory()
+        view = AgendamentoViewSet.as_view({'post': 'create'})
+
+        def book(paciente):
+            headers = {'HTTP_IDEMPOTENCY_KEY': key} if idempotency else {}
+            payload = {'paciente_id': (pacientes[0] if idempotency else paciente).pk, 'data': data.isoformat(), 'hora': hora.isoformat()}
+            request = factory.post('/api/agendamentos/', payload, format='json', **headers)
+            force_authenticate(request, user=user)
+            barrier.wait()
+            start = time.perf_counter()
+            try:
+                response = view(request)
+                return response.status_code, (time.perf_counter() - start) * 1000
+            finally:
+                connection.close() # Each thread has its own connection
+
+        with ThreadPoolExecutor(max_workers=len(pacientes)) as executor:
+            results = list(executor.map(book, pacientes))
+        statuses = {}
+        for code, _ in results:
+            statuses[code] = statuses.get(code, 0) + 1
+        return {
+            'statuses': statuses,
+            'latencies_ms': [ms for _, ms in results],
+            'booked': Agendamento.objects.filter(data=data, hora=hora).count(),
+        }
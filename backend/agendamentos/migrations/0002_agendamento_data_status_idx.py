@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamentos', '0001_initial'),
+        ('pacientes', '0005_paciente_cpf_digitos_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['data', 'status'], name='agendamento_data_status_idx'),
+        ),
+    ]
@@ -23,6 +23,10 @@ class Agendamento(TimeStampedModel):
     class Meta:
         ordering = ['data', 'hora']
         unique_together = [['paciente', 'data', 'hora'], ['data', 'hora']] # Prevent patient double booking and general double booking if only one professional context
+        indexes = [
+            # Covers the per-day, per-status counts of the month view (agendamentos.calendario)
+            models.Index(fields=['data', 'status'], name='agendamento_data_status_idx'),
+        ]
 
     def __str__(self):
         return f"Agendamento para {self.paciente.nome} em {self.data} às {self.hora}"
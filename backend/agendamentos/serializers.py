@@ -2,10 +2,25 @@ from rest_framework import serializers
 from .models import Agendamento, AgendamentoStatus
 from pacientes.models import Paciente, Endereco
 from pacientes.serializers import EnderecoSerializer # For address updates
-from django.db import transaction
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from core.exceptions import Conflict
+from core.fieldsets import SparseFieldsetSerializerMixin
+from .disponibilidade import Agenda
+from .serie import Frequencia
 import datetime
 
-class AgendamentoSerializer(serializers.ModelSerializer):
+def validar_horario(value):
+    # Rule: Datas entre 08h e 17h apenas (AGENDA_HORA_INICIO e AGENDA_HORA_FIM)
+    agenda = Agenda()
+    if not agenda.horario_permitido(value):
+        raise serializers.ValidationError(
+            f"Agendamentos devem ser entre {agenda.hora_inicio:%H:%M} e {agenda.hora_fim:%H:%M}."
+        )
+    return value
+
+
+class AgendamentoSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     paciente_id = serializers.PrimaryKeyRelatedField(
         queryset=Paciente.objects.all(),
         source='paciente',
@@ -40,52 +55,38 @@ class AgendamentoSerializer(serializers.ModelSerializer):
             'endereco_residencial_cidade', 'endereco_residencial_uf',
         ]
         read_only_fields = ['criado_em', 'atualizado_em', 'criado_por_username', 'modificado_por_username']
+        # Default of the list action (see core.fieldsets)
+        list_fields = ['id', 'paciente_nome', 'data', 'hora', 'status']
+        # No UniqueTogetherValidator queries: the unique constraints are enforced by the
+        # database on insert/update and a violation becomes a 409 (see _save_agendamento).
+        validators = []
 
     def validate_hora(self, value):
-        # Rule: Datas entre 08h e 17h apenas
-        if not (datetime.time(8, 0) <= value <= datetime.time(17, 0)):
-            raise serializers.ValidationError("Agendamentos devem ser entre 08:00 e 17:00.")
-        return value
-
-    def validate(self, data):
-        # Rule: Sem conflito de horários
-        # unique_together in model handles this for (<paciente>, data, hora) and (data, hora)
-        # This validation is an additional check, especially for updates.
-
-        paciente = data.get('paciente') # This will be the Paciente instance from paciente_id
-        data_ag = data.get('data')
-        hora_ag = data.get('hora')
-
-        # On create
-        if not self.instance:
-            # Check for patient conflict
-            if Agendamento.objects.filter(paciente=paciente, data=data_ag, hora=hora_ag).exists():
-                raise serializers.ValidationError(
-                    {"detail": f"Paciente já possui um agendamento para {data_ag} às {hora_ag}."}
-                )
-            # Check for general conflict (assuming single professional context)
-            if Agendamento.objects.filter(data=data_ag, hora=hora_ag).exists():
-                raise serializers.ValidationError(
-                    {"detail": f"Já existe um agendamento para {data_ag} às {hora_ag}."}
-                )
-        # On update
-        else:
-            # Check for patient conflict (excluding self)
-            if Agendamento.objects.filter(paciente=paciente, data=data_ag, hora=hora_ag).exclude(pk=self.instance.pk).exists():
-                raise serializers.ValidationError(
-                    {"detail": f"Paciente já possui outro agendamento para {data_ag} às {hora_ag}."}
-                )
-            # Check for general conflict (excluding self)
-            if Agendamento.objects.filter(data=data_ag, hora=hora_ag).exclude(pk=self.instance.pk).exists():
-                raise serializers.ValidationError(
-                    {"detail": f"Já existe outro agendamento para {data_ag} às {hora_ag}."}
-                )
-
-        # Rule: Dados do cliente não podem ser alterados na tela de agendamento.
-        # This is handled by using paciente_id (PK) for write and paciente_nome for read.
-        # The address update is an exception to this rule as per "Endereço pode ser atualizado."
-
-        return data
+        return validar_horario(value)
+
+    def _save_agendamento(self, agendamento, **kwargs):
+        """
+        Insert or update `agendamento`, relying on the (data, hora) and (paciente, data, hora)
+        unique constraints instead of checking first: a concurrent booking of the same slot
+        makes exactly one of the requests succeed, the others get a 409. The savepoint keeps
+        the lock scope to the single statement.
+        """
+        try:
+            with transaction.atomic():
+                agendamento.save(**kwargs)
+        except IntegrityError:
+            # Only on the failure path: find out who holds the slot for the message
+            ocupante = Agendamento.objects.filter(data=agendamento.data, hora=agendamento.hora).exclude(
+                pk=agendamento.pk).values_list('paciente_id', flat=True).first()
+            if ocupante is None:
+                raise
+            outro = "outro " if self.instance else "um "
+            if ocupante == agendamento.paciente_id:
+                detail = f"Paciente já possui {outro}agendamento para {agendamento.data} às {agendamento.hora}."
+            else:
+                detail = f"Já existe {outro}agendamento para {agendamento.data} às {agendamento.hora}."
+            raise Conflict(detail)
+        return agendamento
 
     def _update_paciente_endereco(self, paciente, validated_data):
         # Helper to update paciente's residential address if fields are provided
@@ -150,8 +151,7 @@ class AgendamentoSerializer(serializers.ModelSerializer):
             if request and hasattr(request, 'user') and request.user.is_authenticated:
                 validated_data['criado_por'] = request.user
 
-            agendamento = Agendamento.objects.create(**validated_data)
-            return agendamento
+            return self._save_agendamento(Agendamento(**validated_data), force_insert=True)
 
     def update(self, instance, validated_data):
         with transaction.atomic():
@@ -191,5 +191,48 @@ class AgendamentoSerializer(serializers.ModelSerializer):
             for attr, value in validated_data.items():
                 setattr(instance, attr, value)
 
-            instance.save()
-            return instance
+            return self._save_agendamento(instance)
+
+
+class DisponibilidadeQuerySerializer(serializers.Serializer):
+    """Query parameters of the availability endpoint."""
+    inicio = serializers.DateField(required=False)
+    fim = serializers.DateField(required=False)
+    granularidade = serializers.IntegerField(required=False, min_value=5, max_value=240)
+
+    def validate(self, data):
+        data.setdefault('inicio', datetime.date.today())
+        data.setdefault('fim', data['inicio'] + datetime.timedelta(days=13))
+        if data['fim'] < data['inicio']:
+            raise serializers.ValidationError({"fim": "A data final deve ser igual ou posterior à inicial."})
+        if (data['fim'] - data['inicio']).days >= settings.AGENDA_DISPONIBILIDADE_MAX_DIAS:
+            raise serializers.ValidationError(
+                {"fim": f"O intervalo pode ter no máximo {settings.AGENDA_DISPONIBILIDADE_MAX_DIAS} dias."}
+            )
+        return data
+
+
+class CalendarioQuerySerializer(serializers.Serializer):
+    """Query parameters of the month view: ?mes=YYYY-MM, default the current month."""
+    mes = serializers.RegexField(r'^\d{4}-(0[1-9]|1[0-2])$', required=False, error_messages={
+        'invalid': "Use o formato AAAA-MM.",
+    })
+
+    def validate(self, data):
+        mes = data.get('mes') or datetime.date.today().strftime('%Y-%m')
+        data['ano'], data['mes'] = (int(parte) for parte in mes.split('-'))
+        return data
+
+
+class AgendamentoSerieSerializer(serializers.Serializer):
+    """Input of a recurring series: `quantidade` occurrences from `data_inicio` at `hora`."""
+    paciente_id = serializers.PrimaryKeyRelatedField(queryset=Paciente.objects.all(), source='paciente', label="ID do Paciente")
+    data_inicio = serializers.DateField()
+    hora = serializers.TimeField()
+    frequencia = serializers.ChoiceField(choices=Frequencia.choices, default=Frequencia.SEMANAL)
+    quantidade = serializers.IntegerField(min_value=1, max_value=104)
+    observacoes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    tudo_ou_nada = serializers.BooleanField(default=False, help_text="Não cria nada se alguma ocorrência conflitar.")
+
+    def validate_hora(self, value):
+        return validar_horario(value)
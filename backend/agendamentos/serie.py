@@ -0,0 +1,82 @@
+"""
+Recurring series of agendamentos (e.g. a weekly session), booked with one conflict query
+and one bulk INSERT instead of a POST per occurrence.
+"""
+import calendar
+import datetime
+
+from django.db import transaction
+
+from core.signals import post_bulk_create
+from . import calendario
+from .disponibilidade import Agenda
+from .models import Agendamento
+
+
+class Frequencia:
+    SEMANAL = 'SEMANAL'
+    QUINZENAL = 'QUINZENAL'
+    MENSAL = 'MENSAL'
+
+    choices = [(SEMANAL, 'Semanal'), (QUINZENAL, 'Quinzenal'), (MENSAL, 'Mensal')]
+
+
+def _somar_meses(data, meses):
+    # Same day of the month, or the month's last day when it is shorter (31/01 -> 28/02)
+    ano, mes = divmod(data.month - 1 + meses, 12)
+    ano, mes = data.year + ano, mes + 1
+    return data.replace(year=ano, month=mes, day=min(data.day, calendar.monthrange(ano, mes)[1]))
+
+
+def ocorrencias(inicio, frequencia, quantidade):
+    """Dates of the `quantidade` occurrences of a series starting on `inicio`."""
+    if frequencia == Frequencia.MENSAL:
+        return [_somar_meses(inicio, i) for i in range(quantidade)]
+    passo = datetime.timedelta(days=14 if frequencia == Frequencia.QUINZENAL else 7)
+    return [inicio + passo * i for i in range(quantidade)]
+
+
+def criar_serie(paciente, hora, datas, criado_por=None, observacoes=None, tudo_ou_nada=False):
+    """
+    Book `paciente` at `hora` on each of `datas`. Returns (created agendamentos, conflicts),
+    conflicts being a list of {'data', 'hora', 'motivo'}. Days the agenda is closed are
+    skipped as conflicts too. With `tudo_ou_nada`, nothing is created if anything
+    conflicts.
+
+    Queries: one for the taken slots, one INSERT, one to read the created rows back.
+    """
+    agenda = Agenda()
+    conflitos = []
+    livres = []
+    ocupados = dict(Agendamento.objects.filter(data__in=datas, hora=hora).values_list('data', 'paciente_id'))
+    for data in datas:
+        if not agenda.dia_aberto(data):
+            conflitos.append({'data': data, 'hora': hora, 'motivo': 'dia_fechado'})
+        elif data in ocupados:
+            motivo = 'paciente_ja_agendado' if ocupados[data] == paciente.pk else 'horario_ocupado'
+            conflitos.append({'data': data, 'hora': hora, 'motivo': motivo})
+        else:
+            livres.append(data)
+    if not livres or (tudo_ou_nada and conflitos):
+        return [], conflitos
+
+    with transaction.atomic():
+        # ignore_conflicts: a slot taken since the query above is skipped, not an error;
+        # the read-back below tells which rows were actually inserted.
+        Agendamento.objects.bulk_create(
+            [Agendamento(paciente=paciente, data=data, hora=hora, observacoes=observacoes, criado_por=criado_por)
+             for data in livres],
+            ignore_conflicts=True,
+        )
+        calendario.invalidar() # bulk_create sends no post_save
+        criados = list(
+            Agendamento.objects.filter(paciente=paciente, data__in=livres, hora=hora)
+            .select_related('paciente', 'criado_por', 'modificado_por').order_by('data')
+        )
+        post_bulk_create.send(sender=Agendamento, instances=criados)
+        perdidos = set(livres) - {a.data for a in criados}
+        conflitos.extend({'data': data, 'hora': hora, 'motivo': 'horario_ocupado'} for data in sorted(perdidos))
+        if tudo_ou_nada and perdidos:
+            transaction.set_rollback(True)
+            return [], sorted(conflitos, key=lambda c: c['data'])
+    return criados, sorted(conflitos, key=lambda c: c['data'])
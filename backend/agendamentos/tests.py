@@ -1,10 +1,17 @@
 from django.urls import reverse
 from rest_framework import status
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
 from rest_framework.test import APITestCase
 from .models import Agendamento, AgendamentoStatus
+from .serie import Frequencia, ocorrencias
 from pacientes.models import Paciente, Endereco
 from usuarios.models import CustomUser, UserRole
+from io import StringIO
 import datetime
+import json
 
 class AgendamentoAPITests(APITestCase):
     @classmethod
@@ -59,13 +66,8 @@ class AgendamentoAPITests(APITestCase):
             'hora': '14:00:00'
         }
         response = self.client.post(self.agendamento_url, data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST) # Due to unique_together or serializer validation
-        # Check for specific error messages related to conflict
-        self.assertTrue('detail' in response.data and "Paciente já possui um agendamento" in response.data['detail']
-                        or 'non_field_errors' in response.data # Model's unique_together
-                        or ('paciente_id' in response.data and any("conflito" in error for error in response.data['paciente_id']))
-                        , response.data
-                       )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT) # Raised by the unique constraint
+        self.assertIn("Paciente já possui um agendamento", response.data['detail'])
 
 
     def test_create_agendamento_conflict_general_time(self):
@@ -84,10 +86,70 @@ class AgendamentoAPITests(APITestCase):
             'hora': '11:00:00'
         }
         response = self.client.post(self.agendamento_url, data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-        self.assertTrue('detail' in response.data and "Já existe um agendamento para" in response.data['detail']
-                        or 'non_field_errors' in response.data, response.data)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn("Já existe um agendamento para", response.data['detail'])
+
+
+    def test_idempotency_key_replays_the_first_response(self):
+        data = {'paciente_id': self.paciente.pk, 'data': (datetime.date.today() + datetime.timedelta(days=4)).isoformat(), 'hora': '09:00:00'}
+        first = self.client.post(self.agendamento_url, data, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED, first.data)
+        retry = self.client.post(self.agendamento_url, data, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(Agendamento.objects.count(), 1)
+
+        other = self.client.post(self.agendamento_url, {**data, 'hora': '10:00:00'}, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(other.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        # A failed request does not burn its key
+        conflict = self.client.post(self.agendamento_url, data, format='json', HTTP_IDEMPOTENCY_KEY='retry-2')
+        self.assertEqual(conflict.status_code, status.HTTP_409_CONFLICT)
+        Agendamento.objects.all().delete()
+        self.assertEqual(self.client.post(self.agendamento_url, data, format='json', HTTP_IDEMPOTENCY_KEY='retry-2').status_code, status.HTTP_201_CREATED)
+
+    def test_weekly_series_books_52_weeks_in_a_few_queries(self):
+        hoje = datetime.date.today()
+        inicio = hoje + datetime.timedelta(days=7 - hoje.weekday()) # Next Monday
+        other_endereco = Endereco.objects.create(cep='99999-001', uf='RJ', cidade='Outra', logradouro='Rua', numero='1', bairro='B')
+        other = Paciente.objects.create(cpf='987.654.321-11', nome='Outro', endereco_residencial=other_endereco, nascimento='1990-01-01', email='o@example.com', celular='12345678901')
+        Agendamento.objects.create(paciente=other, data=inicio + datetime.timedelta(weeks=3), hora='14:00:00')
+        feriado = inicio + datetime.timedelta(weeks=10)
+
+        url = reverse('agendamento-serie')
+        payload = {'paciente_id': self.paciente.pk, 'data_inicio': inicio.isoformat(), 'hora': '14:00', 'quantidade': 52}
+        # Paciente, taken slots, savepoint, INSERT, read-back, dashboard counters (one INSERT
+        # of the missing ones, one UPDATE), release
+        with override_settings(AGENDA_FERIADOS=[feriado.isoformat()]), self.assertNumQueries(8):
+            response = self.client.post(url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(len(response.data['criados']), 50)
+        self.assertEqual(
+            [(c['data'], c['motivo']) for c in response.data['conflitos']],
+            [(inicio + datetime.timedelta(weeks=3), 'horario_ocupado'), (feriado, 'dia_fechado')],
+        )
+        self.assertEqual(Agendamento.objects.filter(paciente=self.paciente).count(), 50)
+        self.assertEqual(response.data['criados'][0]['criado_por_username'], self.secretaria_user.username)
+
+        # Everything taken now: nothing to book
+        response = self.client.post(url, {**payload, 'quantidade': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual({c['motivo'] for c in response.data['conflitos']}, {'paciente_ja_agendado'})
 
+    def test_monthly_series_and_all_or_nothing(self):
+        self.assertEqual(
+            ocorrencias(datetime.date(2027, 1, 31), Frequencia.MENSAL, 3),
+            [datetime.date(2027, 1, 31), datetime.date(2027, 2, 28), datetime.date(2027, 3, 31)],
+        )
+        hoje = datetime.date.today()
+        inicio = hoje + datetime.timedelta(days=7 - hoje.weekday())
+        Agendamento.objects.create(paciente=self.paciente, data=inicio + datetime.timedelta(weeks=2), hora='09:00:00')
+        payload = {'paciente_id': self.paciente.pk, 'data_inicio': inicio.isoformat(), 'hora': '09:00', 'quantidade': 4,
+                   'frequencia': 'QUINZENAL', 'tudo_ou_nada': True}
+        response = self.client.post(reverse('agendamento-serie'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Agendamento.objects.count(), 1)
 
     def test_update_paciente_address_via_agendamento(self):
         ag_data = {
@@ -115,3 +177,160 @@ class AgendamentoAPITests(APITestCase):
         ag = Agendamento.objects.get(pk=response.data['id'])
         self.assertEqual(ag.modificado_por, None)
         self.assertEqual(ag.criado_por, self.secretaria_user)
+
+    def test_list_agendamentos_paginated_by_data_hora(self):
+        base = datetime.date.today() + datetime.timedelta(days=10)
+        for day, hora in [(1, '09:00:00'), (0, '15:00:00'), (0, '09:00:00'), (2, '08:00:00')]:
+            Agendamento.objects.create(paciente=self.paciente, data=base + datetime.timedelta(days=day), hora=hora)
+        expected = list(Agendamento.objects.order_by('data', 'hora').values_list('id', flat=True))
+
+        seen = []
+        url = f"{self.agendamento_url}?page_size=3"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(a['id'] for a in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+    def test_disponibilidade_bitmaps_over_sixty_days_in_one_query(self):
+        hoje = datetime.date.today()
+        segunda = hoje + datetime.timedelta(days=7 - hoje.weekday())
+        terca = segunda + datetime.timedelta(days=1)
+        Agendamento.objects.create(paciente=self.paciente, data=segunda, hora='08:00:00')
+        Agendamento.objects.create(paciente=self.paciente, data=segunda, hora='10:15:00') # Inside the 10:00 slot
+        Agendamento.objects.create(paciente=self.paciente, data=segunda, hora='11:00:00', status=AgendamentoStatus.CANCELADO)
+
+        url = reverse('agendamento-disponibilidade')
+        params = {'inicio': segunda.isoformat(), 'fim': (segunda + datetime.timedelta(days=59)).isoformat()}
+        with override_settings(AGENDA_FERIADOS=[terca.isoformat()]), self.assertNumQueries(1):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(len(response.data['dias']), 60)
+
+        dias = {dia['data']: dia for dia in response.data['dias']}
+        livres = dias[segunda]['livres']
+        self.assertEqual(livres[:3], ['08:30', '09:00', '09:30'])
+        self.assertNotIn('10:00', livres)
+        self.assertNotIn('11:00', livres) # Cancelled bookings still hold the (data, hora) slot
+        self.assertEqual(livres[-1], '17:00')
+        self.assertEqual(dias[terca], {'data': terca, 'aberto': False, 'livres': []}) # Holiday
+        self.assertFalse(dias[segunda + datetime.timedelta(days=5)]['aberto']) # Saturday
+        self.assertEqual(len(dias[segunda + datetime.timedelta(days=2)]['livres']), 19)
+
+        response = self.client.get(url, {**params, 'granularidade': 60})
+        self.assertEqual(response.data['dias'][0]['livres'][:2], ['09:00', '12:00'])
+
+    def test_disponibilidade_rejects_invalid_ranges(self):
+        url = reverse('agendamento-disponibilidade')
+        hoje = datetime.date.today()
+        response = self.client.get(url, {'inicio': hoje.isoformat(), 'fim': (hoje - datetime.timedelta(days=1)).isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {'inicio': hoje.isoformat(), 'fim': (hoje + datetime.timedelta(days=365)).isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_export_streams_csv_and_ndjson_with_list_filters(self):
+        base = datetime.date(2024, 3, 4)
+        for day, hora, st in [(0, '09:00:00', 'EM_ANDAMENTO'), (0, '08:00:00', 'CONCLUIDO'),
+                              (1, '10:00:00', 'CONCLUIDO'), (40, '10:00:00', 'CONCLUIDO')]:
+            Agendamento.objects.create(paciente=self.paciente, data=base + datetime.timedelta(days=day), hora=hora, status=st)
+        url = reverse('agendamento-exportar')
+        params = {'status': 'CONCLUIDO', 'data__lte': '2024-03-31', 'campos': 'data,hora,paciente_nome'}
+
+        with self.settings(EXPORT_CHUNK_SIZE=1):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.streaming)
+            self.assertEqual(response['Content-Disposition'], 'attachment; filename="agendamentos.csv"')
+            linhas = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(linhas, [
+            'data,hora,paciente_nome',
+            '2024-03-04,08:00:00,Paciente Ag',
+            '2024-03-05,10:00:00,Paciente Ag',
+        ])
+
+        response = self.client.get(url, {**params, 'formato': 'ndjson', 'ordering': '-data'})
+        registros = [json.loads(linha) for linha in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([r['data'] for r in registros], ['2024-03-05', '2024-03-04'])
+        self.assertEqual(set(registros[0]), {'data', 'hora', 'paciente_nome'})
+
+        response = self.client.get(url, {'campos': 'data,senha'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(AGENDA_CALENDARIO_CACHE_SEGUNDOS=300)
+    def test_calendario_counts_per_day_and_status_cached_per_month(self):
+        cache.clear()
+        for data, hora, st in [('2024-03-04', '08:00:00', 'EM_ANDAMENTO'), ('2024-03-04', '09:00:00', 'EM_ANDAMENTO'),
+                               ('2024-03-04', '10:00:00', 'CANCELADO'), ('2024-03-20', '08:00:00', 'CONCLUIDO'),
+                               ('2024-02-01', '08:00:00', 'CONCLUIDO')]:
+            Agendamento.objects.create(paciente=self.paciente, data=data, hora=hora, status=st)
+        url = reverse('agendamento-calendario')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'mes': '2024-03'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(response.data['status'], ['EM_ANDAMENTO', 'CONCLUIDO', 'CANCELADO'])
+        self.assertEqual(response.data['dias'], {'2024-03-04': [2, 0, 1], '2024-03-20': [0, 1, 0]})
+        self.assertEqual(response.data['totais'], {'EM_ANDAMENTO': 2, 'CONCLUIDO': 1, 'CANCELADO': 1})
+        self.assertLess(len(response.content), 300)
+        with self.assertNumQueries(0): # Cached
+            self.client.get(url, {'mes': '2024-03'})
+
+        # Moving an agendamento to another month refreshes both months
+        ag = Agendamento.objects.get(data=datetime.date(2024, 3, 20))
+        self.client.patch(f"{self.agendamento_url}{ag.pk}/", {'data': '2024-02-20'}, format='json')
+        self.assertEqual(self.client.get(url, {'mes': '2024-03'}).data['dias'], {'2024-03-04': [2, 0, 1]})
+        self.assertEqual(self.client.get(url, {'mes': '2024-02'}).data['totais']['CONCLUIDO'], 2)
+
+        self.assertEqual(self.client.get(url, {'mes': '2024-13'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        with self.settings(AGENDA_CALENDARIO_CACHE_SEGUNDOS=0), self.assertNumQueries(2): # Not cached
+            self.client.get(url, {'mes': '2024-03'})
+            self.client.get(url, {'mes': '2024-03'})
+
+    def test_conditional_get_follows_paciente(self):
+        agendamento = Agendamento.objects.create(paciente=self.paciente, data=datetime.date.today(), hora='10:00')
+        params = {'paciente__id': self.paciente.pk}
+        etag = self.client.get(self.agendamento_url, params)['ETag']
+        response = self.client.get(self.agendamento_url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # paciente_nome is part of the representation
+        self.paciente.nome = 'Paciente Renomeado'
+        self.paciente.save()
+        response = self.client.get(self.agendamento_url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['paciente_nome'], 'Paciente Renomeado')
+
+        detail_url = reverse('agendamento-detail', kwargs={'pk': agendamento.pk})
+        etag = self.client.get(detail_url)['ETag']
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class AgendamentoConcurrencyTests(TransactionTestCase):
+    """Real concurrent requests: rows must be committed for the other threads to see them."""
+
+    def setUp(self):
+        # Checked here, not at import: only now is the test database (and its NAME) set up.
+        # SQLite test databases are in memory and lock whole tables across threads.
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Needs a database with concurrent writers")
+
+    def _run(self, *args):
+        out = StringIO()
+        call_command('benchmark_booking', '--requests', '6', '--rounds', '2', '--json', *args, stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_parallel_bookings_of_one_slot_exactly_one_succeeds(self):
+        result = self._run()
+        self.assertEqual(result['successes_per_round'], [1, 1])
+        self.assertEqual(result['booked_per_round'], [1, 1])
+        self.assertEqual(result['statuses'], {'201': 2, '409': 10})
+        self.assertGreater(result['p95_ms'], 0)
+
+    def test_parallel_retries_with_one_idempotency_key_book_once(self):
+        result = self._run('--idempotency')
+        self.assertEqual(result['booked_per_round'], [1, 1])
+        self.assertEqual(result['statuses'], {'201': 12})
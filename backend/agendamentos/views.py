@@ -1,10 +1,22 @@
-from rest_framework import viewsets, permissions, filters
+from rest_framework import viewsets, permissions, filters, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from core.conditional import ConditionalGetMixin
+from core.exportacao import ExportMixin
+from core.fieldsets import SparseFieldsetMixin
+from core.response_cache import ResponseCacheMixin
+from core.idempotency import IdempotentCreateMixin, run_idempotent
+from .calendario import calendario_mes
+from .disponibilidade import Agenda
 from .models import Agendamento
-from .serializers import AgendamentoSerializer
+from .serie import criar_serie, ocorrencias
+from .serializers import (
+    AgendamentoSerializer, AgendamentoSerieSerializer, CalendarioQuerySerializer, DisponibilidadeQuerySerializer,
+)
 from usuarios.permissions import IsSecretaria, IsProfissionalSaude
 from django_filters.rest_framework import DjangoFilterBackend
 
-class AgendamentoViewSet(viewsets.ModelViewSet):
+class AgendamentoViewSet(IdempotentCreateMixin, ResponseCacheMixin, ConditionalGetMixin, SparseFieldsetMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = Agendamento.objects.all().select_related('paciente', 'criado_por', 'modificado_por')
     serializer_class = AgendamentoSerializer
     permission_classes = [permissions.IsAuthenticated, (IsSecretaria | IsProfissionalSaude)]
@@ -18,6 +30,75 @@ class AgendamentoViewSet(viewsets.ModelViewSet):
     }
     search_fields = ['paciente__nome', 'observacoes'] # Search by patient name or observations
     ordering_fields = ['data', 'hora', 'paciente__nome', 'status']
+    ordering = ['data', 'hora', 'id'] # Default ordering, also the pagination keyset
+    # paciente_nome is rendered too, so the paciente's changes count for the ETag
+    conditional_timestamps = ('atualizado_em', 'paciente__atualizado_em')
+    response_cache_models = ('agendamentos.Agendamento', 'pacientes.Paciente')
+
+    # Columns of /api/agendamentos/exportar/ (see core.exportacao)
+    export_filename = 'agendamentos'
+    export_fields = {
+        'id': 'id',
+        'data': 'data',
+        'hora': 'hora',
+        'status': 'status',
+        'paciente_id': 'paciente_id',
+        'paciente_nome': 'paciente__nome',
+        'paciente_cpf': 'paciente__cpf',
+        'observacoes': 'observacoes',
+        'criado_em': 'criado_em',
+        'atualizado_em': 'atualizado_em',
+    }
+
+    @action(detail=False, methods=['get'])
+    def disponibilidade(self, request):
+        """
+        Free slots per day between ?inicio= and ?fim= (ISO dates, default: the next two
+        weeks), optionally at another ?granularidade= in minutes. One query for the range.
+        """
+        params = DisponibilidadeQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        agenda = Agenda(granularidade=params.validated_data.get('granularidade'))
+        inicio, fim = params.validated_data['inicio'], params.validated_data['fim']
+        return Response({
+            'inicio': inicio,
+            'fim': fim,
+            'granularidade_minutos': agenda.granularidade,
+            'dias': agenda.disponibilidade(inicio, fim),
+        })
+
+    @action(detail=False, methods=['get'])
+    def calendario(self, request):
+        """
+        Agendamentos per day and status in ?mes=YYYY-MM: "dias" maps each date with
+        agendamentos to its counts, in the order given by "status". One cached GROUP BY.
+        """
+        params = CalendarioQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return Response(calendario_mes(params.validated_data['ano'], params.validated_data['mes']))
+
+    @action(detail=False, methods=['post'])
+    def serie(self, request):
+        """
+        Book a recurring series (SEMANAL, QUINZENAL or MENSAL) in one transaction. Occurrences
+        whose slot is taken, or whose day is closed, are returned under "conflitos"; the
+        others are created unless tudo_ou_nada is set. 409 when nothing could be booked.
+        """
+        return run_idempotent(request, lambda: self._criar_serie(request))
+
+    def _criar_serie(self, request):
+        serializer = AgendamentoSerieSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+        criados, conflitos = criar_serie(
+            dados['paciente'], dados['hora'], ocorrencias(dados['data_inicio'], dados['frequencia'], dados['quantidade']),
+            criado_por=request.user, observacoes=dados.get('observacoes'), tudo_ou_nada=dados['tudo_ou_nada'],
+        )
+        body = {
+            'criados': self.get_serializer(criados, many=True).data,
+            'conflitos': conflitos,
+        }
+        return Response(body, status=status.HTTP_201_CREATED if criados else status.HTTP_409_CONFLICT)
 
     # To automatically set criado_por/modificado_por
     def perform_create(self, serializer):
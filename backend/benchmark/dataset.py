@@ -0,0 +1,219 @@
+"""
+Synthetic clinic for the benchmark suite, written with bulk INSERTs.
+
+`semear()` creates health professionals and a secretary, N pacientes with their
+addresses, a weekly series of agendamentos per paciente spread over the last `anos`
+years and the next few weeks, and an encrypted Consulta for every past agendamento that
+took place, chained through consulta_anterior as the API would. The same seed gives the
+same rows (relative to the current date), so runs of the suite on different versions
+compare like with like.
+
+The agenda books one paciente per (data, hora), so the number of agendamentos is capped
+by the open slots in the period: occurrences that land on a taken slot are skipped.
+"""
+import datetime
+import itertools
+import random
+
+from django.db import transaction
+from django.utils import timezone
+
+from agendamentos.disponibilidade import Agenda
+from agendamentos.models import Agendamento, AgendamentoStatus
+from consultas.models import Consulta, UltimaConsulta
+from core.signals import post_bulk_create
+from pacientes.models import Endereco, Paciente, normalize_cpf, normalize_phone
+from pacientes.search import build_search_document
+from usuarios.models import CustomUser, UserRole
+
+USERNAME_PREFIX = 'bench-'
+
+NOMES = ['José', 'Maria', 'João', 'Ana', 'Antônio', 'Francisca', 'Luís', 'Márcia', 'Sebastião', 'Lúcia',
+         'Carlos', 'Patrícia', 'Paulo', 'Aline', 'Pedro', 'Sandra', 'Lucas', 'Juliana', 'Marcos', 'Fernanda']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Conceição', 'Gonçalves', 'Araújo', 'Simões', 'Magalhães',
+              'Brandão', 'Pereira', 'Lima', 'Carvalho', 'Ferreira', 'Rodrigues', 'Almeida', 'Costa', 'Ribeiro']
+CIDADES = [('SP', 'São Paulo'), ('SP', 'Campinas'), ('RJ', 'Rio de Janeiro'), ('MG', 'Belo Horizonte'),
+           ('PR', 'Curitiba'), ('RS', 'Porto Alegre'), ('BA', 'Salvador'), ('PE', 'Recife')]
+BAIRROS = ['Centro', 'Jardim América', 'Vila Nova', 'Boa Vista', 'Santa Cecília', 'Liberdade', 'Bela Vista']
+PALAVRAS = ('paciente relata melhora do quadro sono irregular ansiedade dor lombar retorno em duas semanas '
+            'mantida a conduta orientado sobre exercícios evolução favorável queixa principal histórico '
+            'familiar sem intercorrências reavaliar medicação acompanhamento semanal').split()
+
+# Weeks ahead of today that still get (future, EM_ANDAMENTO) agendamentos
+SEMANAS_FUTURAS = 8
+# Share of past agendamentos that were cancelled instead of held
+TAXA_CANCELAMENTO = 0.1
+
+
+def _cpf(i):
+    digitos = f'{i:011d}'
+    return f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}'
+
+
+def gerar_texto(rng, tamanho):
+    """Clinical-looking text of about `tamanho` characters."""
+    palavras = []
+    total = 0
+    while total < tamanho:
+        palavra = rng.choice(PALAVRAS)
+        palavras.append(palavra)
+        total += len(palavra) + 1
+    return ' '.join(palavras)[:tamanho].capitalize() + '.'
+
+
+def _lotes(iterable, tamanho):
+    iterator = iter(iterable)
+    while lote := list(itertools.islice(iterator, tamanho)):
+        yield lote
+
+
+class Semeador:
+    """One run of the dataset generator; see semear()."""
+
+    def __init__(self, pacientes, anos, profissionais, tamanho_nota, seed, tamanho_lote):
+        self.n_pacientes = pacientes
+        self.anos = anos
+        self.n_profissionais = profissionais
+        self.tamanho_nota = tamanho_nota
+        self.tamanho_lote = tamanho_lote
+        self.rng = random.Random(seed)
+        self.agenda = Agenda()
+        self.hoje = timezone.localdate()
+        # Monday of the first week of the period
+        inicio = self.hoje - datetime.timedelta(days=365 * anos)
+        self.inicio = inicio - datetime.timedelta(days=inicio.weekday())
+        self.semanas = (self.hoje - self.inicio).days // 7 + SEMANAS_FUTURAS
+        self.dias_semana = sorted(self.agenda.dias_semana)
+        self.ocupados = set()
+        self.contagem = dict.fromkeys(('profissionais', 'pacientes', 'enderecos', 'agendamentos', 'consultas'), 0)
+
+    def executar(self):
+        if CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise ValueError("O banco já tem dados do benchmark; use um banco vazio.")
+        self.ocupados = set(Agendamento.objects.values_list('data', 'hora'))
+        self._usuarios()
+        for inicio in range(0, self.n_pacientes, self.tamanho_lote):
+            with transaction.atomic():
+                pacientes = self._pacientes(range(inicio, min(inicio + self.tamanho_lote, self.n_pacientes)))
+                agendamentos = self._agendamentos(pacientes)
+                self._consultas(agendamentos)
+        return self.contagem
+
+    def _usuarios(self):
+        usuarios = [
+            CustomUser(username=f'{USERNAME_PREFIX}profissional-{i}', role=UserRole.PROFISSIONAL_SAUDE)
+            for i in range(self.n_profissionais)
+        ]
+        usuarios.append(CustomUser(username=f'{USERNAME_PREFIX}secretaria', role=UserRole.SECRETARIA))
+        for usuario in usuarios:
+            usuario.set_unusable_password()
+        CustomUser.objects.bulk_create(usuarios)
+        self.profissionais = usuarios[:-1]
+        self.secretaria = usuarios[-1]
+        self.contagem['profissionais'] = len(self.profissionais)
+
+    def _pacientes(self, indices):
+        rng = self.rng
+        enderecos, pacientes = [], []
+        for i in indices:
+            uf, cidade = rng.choice(CIDADES)
+            endereco = Endereco(
+                cep=f'{rng.randrange(10000, 99999)}-{rng.randrange(1000):03d}', uf=uf, cidade=cidade,
+                logradouro=f'Rua {rng.choice(SOBRENOMES)}', numero=str(rng.randrange(1, 3000)), bairro=rng.choice(BAIRROS),
+            )
+            nome = f'{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}'
+            cpf, email = _cpf(i), f'paciente{i}@benchmark.example.com'
+            celular = f'119{rng.randrange(10 ** 8):08d}'
+            whatsapp = celular if rng.random() < 0.7 else ''
+            paciente = Paciente(
+                cpf=cpf, cpf_digitos=normalize_cpf(cpf), nome=nome, email=email, celular=celular, whatsapp=whatsapp,
+                celular_e164=normalize_phone(celular), whatsapp_e164=normalize_phone(whatsapp),
+                nascimento=datetime.date(rng.randrange(1940, 2015), rng.randrange(1, 13), rng.randrange(1, 29)),
+                endereco_residencial=endereco, busca=build_search_document(nome, cpf, email),
+                criado_por=self.secretaria,
+            )
+            enderecos.append(endereco)
+            pacientes.append(paciente)
+        Endereco.objects.bulk_create(enderecos)
+        Paciente.objects.bulk_create(pacientes)
+        post_bulk_create.send(sender=Paciente, instances=pacientes)
+        self.contagem['enderecos'] += len(enderecos)
+        self.contagem['pacientes'] += len(pacientes)
+        return pacientes
+
+    def _serie(self):
+        """(data, hora) of a weekly series of 4 to 26 sessions, free slots only."""
+        rng = self.rng
+        sessoes = rng.randrange(4, 27)
+        semana = rng.randrange(max(1, self.semanas - sessoes))
+        dia_semana = rng.choice(self.dias_semana)
+        hora = rng.choice(self.agenda.slots)
+        datas = []
+        for k in range(sessoes):
+            data = self.inicio + datetime.timedelta(weeks=semana + k, days=dia_semana)
+            if self.agenda.dia_aberto(data) and (data, hora) not in self.ocupados:
+                self.ocupados.add((data, hora))
+                datas.append(data)
+        return [(data, hora) for data in datas]
+
+    def _agendamentos(self, pacientes):
+        agendamentos = []
+        for paciente in pacientes:
+            for data, hora in self._serie():
+                if data >= self.hoje:
+                    status = AgendamentoStatus.EM_ANDAMENTO
+                elif self.rng.random() < TAXA_CANCELAMENTO:
+                    status = AgendamentoStatus.CANCELADO
+                else:
+                    status = AgendamentoStatus.CONCLUIDO
+                agendamentos.append(Agendamento(
+                    paciente=paciente, data=data, hora=hora, status=status, criado_por=self.secretaria,
+                ))
+        for lote in _lotes(agendamentos, 2000):
+            Agendamento.objects.bulk_create(lote)
+        post_bulk_create.send(sender=Agendamento, instances=agendamentos)
+        self.contagem['agendamentos'] += len(agendamentos)
+        return agendamentos
+
+    def _consultas(self, agendamentos):
+        # Each paciente is seen by one professional. The consultas are inserted by session
+        # number (every paciente's first, then every second, ...) so the previous consulta
+        # already has its PK when the next one points at it.
+        sessoes = {}
+        for agendamento in agendamentos:
+            if agendamento.status == AgendamentoStatus.CONCLUIDO:
+                sessoes.setdefault(agendamento.paciente_id, []).append(agendamento)
+        anterior = {}
+        for numero in itertools.count():
+            rodada = [(pid, lista[numero]) for pid, lista in sessoes.items() if len(lista) > numero]
+            if not rodada:
+                break
+            consultas = []
+            for paciente_id, agendamento in rodada:
+                consultas.append(Consulta(
+                    agendamento=agendamento,
+                    profissional_responsavel=self.profissionais[paciente_id % len(self.profissionais)],
+                    consulta_anterior=anterior.get(paciente_id),
+                    anotacoes_atuais=gerar_texto(self.rng, self.tamanho_nota),
+                    pontos_atencao=gerar_texto(self.rng, self.tamanho_nota // 10) if self.rng.random() < 0.5 else None,
+                ))
+            for consulta in consultas:
+                consulta.criado_por = consulta.profissional_responsavel
+            Consulta.objects.bulk_create(consultas)
+            post_bulk_create.send(sender=Consulta, instances=consultas)
+            anterior.update((consulta.agendamento.paciente_id, consulta) for consulta in consultas)
+            self.contagem['consultas'] += len(consultas)
+        # bulk_create skips Consulta.save(), which keeps UltimaConsulta up to date
+        UltimaConsulta.objects.bulk_create(
+            UltimaConsulta(paciente_id=paciente_id, consulta=consulta,
+                           data=consulta.agendamento.data, hora=consulta.agendamento.hora)
+            for paciente_id, consulta in anterior.items()
+        )
+
+
+def semear(pacientes=1000, anos=2, profissionais=5, tamanho_nota=1500, seed=42, tamanho_lote=1000):
+    """
+    Fill an empty database with the synthetic clinic. Returns the number of rows created
+    per kind: profissionais, pacientes, enderecos, agendamentos and consultas.
+    """
+    return Semeador(pacientes, anos, profissionais, tamanho_nota, seed, tamanho_lote).executar()
@@ -0,0 +1,157 @@
+import datetime
+import io
+import json
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from agendamentos.disponibilidade import Agenda
+from agendamentos.models import Agendamento, AgendamentoStatus
+from agendamentos.serializers import AgendamentoSerializer
+from benchmark.dataset import BAIRROS, CIDADES, NOMES, SOBRENOMES, gerar_texto
+from consultas.models import Consulta
+from consultas.serializers import ConsultaSerializer
+from core.parsers import ORJSONParser
+from core.renderers import ORJSONRenderer, orjson
+from pacientes.models import Endereco, Paciente
+from pacientes.serializers import PacienteSerializer
+from usuarios.models import CustomUser, UserRole
+
+PAYLOADS = ('pacientes', 'agendamentos', 'consultas', 'disponibilidade')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rendering and parsing API responses with the stdlib JSON renderer/parser and "
+        "the orjson ones (core.renderers, core.parsers). The payloads are pages of the real "
+        "serializers' output for in-memory rows, no database access."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50, help='Rows per page (the API page size).')
+        parser.add_argument('--repeat', type=int, default=200, help='Operations timed per engine and payload.')
+        parser.add_argument('--payloads', nargs='*', default=list(PAYLOADS), choices=PAYLOADS)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        engines = [('stdlib', JSONRenderer(), JSONParser())]
+        if orjson is not None:
+            engines.append(('orjson', ORJSONRenderer(), ORJSONParser()))
+
+        results = []
+        for payload in options['payloads']:
+            data = getattr(self, f'_{payload}')(rng, options['rows'])
+            for name, renderer, parser in engines:
+                body = renderer.render(data)
+                render_us = statistics.median(self._time(renderer.render, data, options['repeat']))
+                parse_us = statistics.median(self._time(lambda b: parser.parse(io.BytesIO(b)), body, options['repeat']))
+                results.append({
+                    'payload': payload,
+                    'engine': name,
+                    'bytes': len(body),
+                    'render_us': render_us,
+                    'parse_us': parse_us,
+                })
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'rows': options['rows'], 'repeat': options['repeat'], 'orjson': orjson is not None, 'results': results,
+            }, indent=2))
+            return
+        if orjson is None:
+            self.stdout.write("orjson is not installed: stdlib only.")
+        self.stdout.write(f"Median of {options['repeat']} operations on pages of {options['rows']} rows (us)")
+        self.stdout.write(f"{'payload':<16}{'engine':<8}{'bytes':>9}{'render':>10}{'parse':>10}")
+        for row in results:
+            self.stdout.write(
+                f"{row['payload']:<16}{row['engine']:<8}{row['bytes']:>9}{row['render_us']:>10.1f}{row['parse_us']:>10.1f}"
+            )
+
+    def _time(self, func, data, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(data)
+            timings.append((time.perf_counter() - start) * 1_000_000)
+        return timings
+
+    # Payloads, shaped like the paginated responses of the list endpoints
+
+    def _pagina(self, results):
+        return {'next': 'http://testserver/api/?cursor=cD0yMDI2LTEwLTE4', 'previous': None, 'results': results}
+
+    def _paciente(self, rng, i):
+        uf, cidade = rng.choice(CIDADES)
+        endereco = Endereco(
+            id=i, cep=f'{rng.randrange(10000, 99999)}-{rng.randrange(1000):03d}', uf=uf, cidade=cidade,
+            logradouro=f'Rua {rng.choice(SOBRENOMES)}', numero=str(rng.randrange(1, 3000)), bairro=rng.choice(BAIRROS),
+        )
+        celular = f'119{rng.randrange(10 ** 8):08d}'
+        agora = datetime.datetime.now(datetime.timezone.utc)
+        return Paciente(
+            id=i, cpf=f'{i:011d}', nome=f'{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}',
+            nascimento=datetime.date(rng.randrange(1940, 2015), rng.randrange(1, 13), rng.randrange(1, 29)),
+            email=f'paciente{i}@example.com', celular=celular, whatsapp=celular, whatsapp_e164=f'+55{celular}',
+            endereco_residencial=endereco, endereco_cobranca=endereco, criado_em=agora, atualizado_em=agora,
+            criado_por_id=1,
+        )
+
+    def _pacientes(self, rng, rows):
+        return self._pagina(PacienteSerializer([self._paciente(rng, i) for i in range(rows)], many=True).data)
+
+    def _agendamentos(self, rng, rows):
+        hoje = datetime.date.today()
+        agenda = Agenda()
+        agendamentos = [
+            Agendamento(
+                id=i, paciente=self._paciente(rng, i), data=hoje + datetime.timedelta(days=i // 8),
+                hora=agenda.slots[i % len(agenda.slots)], status=rng.choice(AgendamentoStatus.values),
+                observacoes=gerar_texto(rng, 80), criado_em=datetime.datetime.now(datetime.timezone.utc),
+                atualizado_em=datetime.datetime.now(datetime.timezone.utc), criado_por=CustomUser(username='secretaria'),
+            )
+            for i in range(rows)
+        ]
+        return self._pagina(AgendamentoSerializer(agendamentos, many=True).data)
+
+    def _consultas(self, rng, rows):
+        # Decrypted notes of about 1.5 kB, as the responsible professional sees them
+        profissional = CustomUser(id=1, username='profissional', role=UserRole.PROFISSIONAL_SAUDE)
+        consultas = []
+        for i in range(rows):
+            agendamento = Agendamento(
+                id=i, paciente=self._paciente(rng, i), data=datetime.date.today(), hora=Agenda().slots[0],
+            )
+            consultas.append(Consulta(
+                id=i, agendamento=agendamento, profissional_responsavel=profissional,
+                anotacoes_atuais=gerar_texto(rng, 1500), pontos_atencao=gerar_texto(rng, 150),
+                criado_em=datetime.datetime.now(datetime.timezone.utc),
+                atualizado_em=datetime.datetime.now(datetime.timezone.utc), criado_por=profissional,
+            ))
+        context = {'request': SimpleNamespace(user=profissional)}
+        return self._pagina(ConsultaSerializer(consultas, many=True, context=context).data)
+
+    def _disponibilidade(self, rng, rows):
+        # GET /api/agendamentos/disponibilidade/: native dates, rendered by the renderer itself
+        agenda = Agenda()
+        inicio = datetime.date.today()
+        dias = [inicio + datetime.timedelta(days=i) for i in range(rows)]
+        return {
+            'inicio': dias[0],
+            'fim': dias[-1],
+            'granularidade_minutos': agenda.granularidade,
+            'dias': [
+                {
+                    'data': data,
+                    'aberto': agenda.dia_aberto(data),
+                    'livres': [hora.strftime('%H:%M') for hora in agenda.horarios(rng.getrandbits(len(agenda.slots)))],
+                }
+                for data in dias
+            ],
+        }
+
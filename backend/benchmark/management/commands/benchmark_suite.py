@@ -0,0 +1,85 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from benchmark.suite import FORMATO, Suite, ambiente, comparar, contagem
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the API hot paths (patient list and search, agendamento and consulta creation, "
+        "note encryption, serialization) on the clinic created by semear_clinica. Results are "
+        "JSON; with --baseline they are compared to an earlier run and the command fails when "
+        "a case got slower than the tolerance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per case.')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed runs before each case.')
+        parser.add_argument('--casos', nargs='*', choices=Suite.casos(), help='Cases to run (default: all).')
+        parser.add_argument('--output', help='Also write the JSON results to this file.')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare with.')
+        parser.add_argument('--tolerancia', type=float, default=0.2,
+                            help='p50 growth over the baseline counted as a regression (0.2 = 20%%).')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The benchmark runs on SQLite only: use --settings=benchmark.settings.")
+        try:
+            suite = Suite(repeticoes=options['repeat'], aquecimento=options['warmup'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        resultado = {
+            'formato': FORMATO,
+            'data': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'ambiente': ambiente(),
+            'dataset': contagem(),
+            'repeticoes': options['repeat'],
+            'resultados': suite.run(options['casos']),
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo, indent=2)
+
+        regressoes = []
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as arquivo:
+                anterior = json.load(arquivo)
+            if anterior.get('formato') != FORMATO:
+                raise CommandError(f"Baseline has result format {anterior.get('formato')}, expected {FORMATO}.")
+            if anterior.get('dataset') != resultado['dataset']:
+                self.stderr.write("Warning: the baseline was measured on a different dataset.")
+            linhas = comparar(resultado, anterior, options['tolerancia'])
+            resultado['comparacao'] = [
+                {'caso': nome, 'p50_ms_antes': antes, 'p50_ms': agora, 'razao': razao, 'regressao': regressao}
+                for nome, antes, agora, razao, regressao in linhas
+            ]
+            regressoes = [linha[0] for linha in linhas if linha[4]]
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultado, indent=2))
+        else:
+            self._tabela(resultado)
+        if regressoes:
+            raise CommandError(f"Regressions over {options['tolerancia']:.0%}: {', '.join(regressoes)}")
+
+    def _tabela(self, resultado):
+        dataset = resultado['dataset']
+        self.stdout.write(
+            f"{dataset['pacientes']} pacientes, {dataset['agendamentos']} agendamentos, "
+            f"{dataset['consultas']} consultas; {resultado['repeticoes']} runs per case (ms)"
+        )
+        comparacao = {linha['caso']: linha for linha in resultado.get('comparacao', [])}
+        self.stdout.write(f"{'case':<26}{'p50':>9}{'p95':>9}{'p99':>9}{'baseline':>10}{'ratio':>8}")
+        for nome, resumo in resultado['resultados'].items():
+            if resumo is None:
+                self.stdout.write(f"{nome:<26}{'skipped (no data)':>27}")
+                continue
+            linha = f"{nome:<26}{resumo['p50_ms']:>9.3f}{resumo['p95_ms']:>9.3f}{resumo['p99_ms']:>9.3f}"
+            c = comparacao.get(nome)
+            if c and c['razao'] is not None:
+                linha += f"{c['p50_ms_antes']:>10.3f}{c['razao']:>8.2f}" + (' REGRESSION' if c['regressao'] else '')
+            self.stdout.write(linha)
@@ -0,0 +1,42 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from benchmark.dataset import semear
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill an empty SQLite database with a synthetic clinic for benchmark_suite: pacientes, "
+        "weekly agendamentos over several years and encrypted consultas, with bulk INSERTs. "
+        "Run it with --settings=benchmark.settings after migrate."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=1000, help='Number of pacientes.')
+        parser.add_argument('--anos', type=int, default=2, help='Years of agendamentos before today.')
+        parser.add_argument('--profissionais', type=int, default=5, help='Number of health professionals.')
+        parser.add_argument('--tamanho-nota', type=int, default=1500, help='Characters per consulta note.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same clinic.')
+        parser.add_argument('--lote', type=int, default=1000, help='Pacientes written per transaction.')
+        parser.add_argument('--json', action='store_true', help='Print the result as JSON.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The benchmark runs on SQLite only: use --settings=benchmark.settings.")
+        inicio = time.perf_counter()
+        try:
+            contagem = semear(
+                pacientes=options['pacientes'], anos=options['anos'], profissionais=options['profissionais'],
+                tamanho_nota=options['tamanho_nota'], seed=options['seed'], tamanho_lote=options['lote'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        segundos = time.perf_counter() - inicio
+
+        if options['json']:
+            self.stdout.write(json.dumps({**contagem, 'segundos': round(segundos, 3)}, indent=2))
+            return
+        self.stdout.write(', '.join(f"{n} {nome}" for nome, n in contagem.items()) + f" in {segundos:.1f} s")
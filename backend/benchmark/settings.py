@@ -0,0 +1,27 @@
+"""
+Settings for the benchmark suite: the project settings on a local SQLite file, so the
+benchmarks run anywhere, with no database server or network, and never against real data.
+
+    python manage.py migrate --settings=benchmark.settings
+    python manage.py semear_clinica --settings=benchmark.settings --pacientes 2000
+    python manage.py benchmark_suite --settings=benchmark.settings --output resultado.json
+"""
+import os
+
+# Only the database settings are required by core.settings without a default
+os.environ.setdefault('DJANGO_SECRET_KEY', 'benchmark-only-secret-key')
+for _name in ('DB_NAME', 'DB_USER', 'DB_PASSWORD', 'DB_HOST', 'DB_PORT'):
+    os.environ.setdefault(_name, '')
+
+from core.settings import *  # noqa: E402,F401,F403
+from decouple import config  # noqa: E402
+
+DEBUG = False # DEBUG keeps every query in memory and slows the ORM down
+ALLOWED_HOSTS = ['testserver', 'localhost']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': config('BENCHMARK_DB', default=str(BASE_DIR / 'benchmark.sqlite3')),
+    }
+}
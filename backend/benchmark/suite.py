@@ -0,0 +1,244 @@
+"""
+Timed hot paths of the API, run in-process against the database semear() filled.
+
+Each case calls the real view (APIRequestFactory, forced authentication, rendered
+response) or the real field/serializer code and reports the distribution of its
+timings in milliseconds. Writes run in a savepoint that is rolled back after every
+iteration, so each iteration sees the same data and the database is left as it was.
+"""
+import datetime
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import time
+
+import django
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from agendamentos.disponibilidade import Agenda
+from agendamentos.models import Agendamento, AgendamentoStatus
+from agendamentos.views import AgendamentoViewSet
+from consultas.models import Consulta, UltimaConsulta
+from consultas.serializers import ConsultaSerializer
+from consultas.views import ConsultaViewSet
+from core.fields import decrypt_value, encrypt_value
+from pacientes.models import Paciente
+from pacientes.serializers import PacienteSerializer
+from pacientes.views import PacienteViewSet
+from usuarios.models import CustomUser, UserRole
+from .dataset import SEMANAS_FUTURAS, USERNAME_PREFIX, gerar_texto
+
+# Version of the result format; bump it when the cases change meaning
+FORMATO = 2
+
+TERMOS_BUSCA = ['silva', 'conceicao', 'Magalhães Bra', 'ana', '000.000.01']
+
+
+def _resumo(timings):
+    ordenados = sorted(timings)
+    return {
+        'n': len(ordenados),
+        'min_ms': round(ordenados[0], 4),
+        'p50_ms': round(statistics.median(ordenados), 4),
+        'p95_ms': round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))], 4),
+        'p99_ms': round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.99))], 4),
+        'media_ms': round(statistics.fmean(ordenados), 4),
+    }
+
+
+class Suite:
+    """The benchmark cases. run() returns {case: summary} for the selected cases."""
+
+    def __init__(self, repeticoes=50, aquecimento=3):
+        self.repeticoes = repeticoes
+        self.aquecimento = aquecimento
+        self.factory = APIRequestFactory()
+        self.secretaria = CustomUser.objects.filter(role=UserRole.SECRETARIA).order_by('pk').first()
+        if self.secretaria is None or not Paciente.objects.exists():
+            raise ValueError("Banco sem dados: rode semear_clinica antes.")
+
+    @classmethod
+    def casos(cls):
+        return [nome[len('caso_'):] for nome in dir(cls) if nome.startswith('caso_')]
+
+    def run(self, casos=None):
+        resultados = {}
+        for nome in casos or self.casos():
+            timings = getattr(self, f'caso_{nome}')()
+            resultados[nome] = _resumo(timings) if timings else None
+        return resultados
+
+    def _medir(self, funcao, preparar=None, rollback=False):
+        """Time `funcao(preparado)`, after `aquecimento` untimed calls."""
+        timings = []
+        for i in range(self.aquecimento + self.repeticoes):
+            argumento = preparar() if preparar else None
+            with transaction.atomic():
+                inicio = time.perf_counter()
+                funcao(argumento)
+                duracao = (time.perf_counter() - inicio) * 1000
+                if rollback:
+                    transaction.set_rollback(True)
+            if i >= self.aquecimento:
+                timings.append(duracao)
+        return timings
+
+    def _chamar(self, view, metodo, path, usuario, dados=None, status_esperado=200):
+        request = getattr(self.factory, metodo)(path, dados, format='json' if metodo == 'post' else None)
+        force_authenticate(request, user=usuario)
+        response = view(request)
+        response.render()
+        if response.status_code != status_esperado:
+            raise AssertionError(f"{metodo.upper()} {path}: {response.status_code} {response.content[:200]!r}")
+        return response
+
+    # Cases, run in alphabetical order
+
+    def caso_agendamento_criar(self):
+        """POST /api/agendamentos/ on a free slot."""
+        view = AgendamentoViewSet.as_view({'post': 'create'})
+        paciente = Paciente.objects.order_by('pk').first()
+        inicio = datetime.date.today() + datetime.timedelta(weeks=SEMANAS_FUTURAS + 1)
+        data, livres = next((d, m) for d, m in Agenda().livres(inicio, inicio + datetime.timedelta(days=30)) if m)
+        hora = Agenda().horarios(livres)[0]
+        dados = {'paciente_id': paciente.pk, 'data': data.isoformat(), 'hora': hora.strftime('%H:%M')}
+        return self._medir(
+            lambda _: self._chamar(view, 'post', '/api/agendamentos/', self.secretaria, dados, 201), rollback=True,
+        )
+
+    def caso_agendamento_conflito(self):
+        """POST /api/agendamentos/ on a taken slot (409)."""
+        view = AgendamentoViewSet.as_view({'post': 'create'})
+        ocupado = Agendamento.objects.order_by('-data', 'hora').first()
+        paciente = Paciente.objects.exclude(pk=ocupado.paciente_id).order_by('pk').first()
+        dados = {'paciente_id': paciente.pk, 'data': ocupado.data.isoformat(), 'hora': ocupado.hora.strftime('%H:%M')}
+        return self._medir(
+            lambda _: self._chamar(view, 'post', '/api/agendamentos/', self.secretaria, dados, 409), rollback=True,
+        )
+
+    def caso_consulta_criar(self):
+        """POST /api/consultas/ for a paciente with previous consultas (previous-note lookup)."""
+        agendamento = Agendamento.objects.filter(
+            status=AgendamentoStatus.EM_ANDAMENTO, consulta__isnull=True,
+            paciente__in=UltimaConsulta.objects.values('paciente'),
+        ).order_by('pk').first()
+        if agendamento is None:
+            return None
+        profissional = UltimaConsulta.objects.select_related('consulta__profissional_responsavel').get(
+            pk=agendamento.paciente_id).consulta.profissional_responsavel
+        view = ConsultaViewSet.as_view({'post': 'create'})
+        dados = {
+            'agendamento_id': agendamento.pk,
+            'anotacoes_atuais': gerar_texto(random.Random(0), 1500),
+            'pontos_atencao': "Reavaliar em duas semanas.",
+            'concluir_consulta': True,
+        }
+        return self._medir(
+            lambda _: self._chamar(view, 'post', '/api/consultas/', profissional, dados, 201), rollback=True,
+        )
+
+    def caso_consultas_lista(self):
+        """GET /api/consultas/?fields= (first page, with the notes) as the first professional: decrypts a page of notes."""
+        profissional = CustomUser.objects.filter(role=UserRole.PROFISSIONAL_SAUDE).order_by('pk').first()
+        if profissional is None:
+            return None
+        view = ConsultaViewSet.as_view({'get': 'list'})
+        campos = {'fields': 'id,paciente_nome,data_agendamento,anotacoes_anteriores,anotacoes_atuais,pontos_atencao'}
+        return self._medir(lambda _: self._chamar(view, 'get', '/api/consultas/', profissional, campos))
+
+    def caso_cifra_decrypt(self):
+        """Decrypt one stored note (core.fields.decrypt_value)."""
+        stored = Consulta.objects.values_list('anotacoes_atuais', flat=True).order_by('pk').first()
+        if stored is None:
+            return None
+        stored = stored.ciphertext
+        return self._medir(lambda _: decrypt_value(stored))
+
+    def caso_cifra_encrypt(self):
+        """Encrypt one 1.5 kB note with the configured engine (core.fields.encrypt_value)."""
+        consulta = Consulta.objects.order_by('pk').first()
+        if consulta is None:
+            return None
+        # The scope of an existing data key, so no key is created outside a rollback
+        scope = Consulta._meta.get_field('anotacoes_atuais').get_key_scope(consulta)
+        nota = gerar_texto(random.Random(0), 1500)
+        return self._medir(lambda _: encrypt_value(nota, scope=scope))
+
+    def caso_pacientes_busca(self):
+        """GET /api/pacientes/?search=, cycling through name, accent and CPF terms."""
+        view = PacienteViewSet.as_view({'get': 'list'})
+        termos = iter(TERMOS_BUSCA * (self.aquecimento + self.repeticoes))
+        return self._medir(
+            lambda termo: self._chamar(view, 'get', '/api/pacientes/', self.secretaria, {'search': termo}),
+            preparar=lambda: next(termos),
+        )
+
+    def caso_pacientes_lista(self):
+        """GET /api/pacientes/ (first page, compact list fields)."""
+        view = PacienteViewSet.as_view({'get': 'list'})
+        return self._medir(lambda _: self._chamar(view, 'get', '/api/pacientes/', self.secretaria))
+
+    def caso_serializacao_consultas(self):
+        """ConsultaSerializer(many=True).data for 50 consultas freshly loaded (notes still encrypted)."""
+        consulta = Consulta.objects.order_by('pk').first()
+        if consulta is None:
+            return None
+        profissional = consulta.profissional_responsavel
+        request = self.factory.get('/api/consultas/')
+        request.user = profissional
+        queryset = Consulta.objects.select_related(
+            'agendamento__paciente', 'profissional_responsavel', 'criado_por', 'modificado_por', 'consulta_anterior',
+        ).filter(profissional_responsavel=profissional)
+        return self._medir(
+            lambda pagina: ConsultaSerializer(pagina, many=True, context={'request': request}).data,
+            preparar=lambda: list(queryset[:50]),
+        )
+
+    def caso_serializacao_pacientes(self):
+        """PacienteSerializer(many=True).data for 50 pacientes already loaded."""
+        queryset = Paciente.objects.select_related('endereco_residencial', 'endereco_cobranca').order_by('nome', 'id')
+        return self._medir(
+            lambda pagina: PacienteSerializer(pagina, many=True).data,
+            preparar=lambda: list(queryset[:50]),
+        )
+
+
+def ambiente():
+    """What the results depend on besides the code: versions, database, CPU."""
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'banco': connection.vendor,
+        'cpus': os.cpu_count(),
+        'plataforma': platform.platform(),
+    }
+
+
+def contagem():
+    """Rows in the dataset, to tell whether two results were measured on the same one."""
+    return {
+        'pacientes': Paciente.objects.count(),
+        'agendamentos': Agendamento.objects.count(),
+        'consultas': Consulta.objects.count(),
+        'profissionais': CustomUser.objects.filter(
+            role=UserRole.PROFISSIONAL_SAUDE, username__startswith=USERNAME_PREFIX).count(),
+    }
+
+
+def comparar(atual, anterior, tolerancia):
+    """
+    [(case, previous p50, current p50, ratio, regression?)] for the cases in both results;
+    a case regressed when its p50 grew by more than `tolerancia` (0.2 = 20 %).
+    """
+    linhas = []
+    for nome, resumo in atual['resultados'].items():
+        antes = anterior.get('resultados', {}).get(nome)
+        if not resumo or not antes:
+            continue
+        razao = resumo['p50_ms'] / antes['p50_ms'] if antes['p50_ms'] else None
+        linhas.append((nome, antes['p50_ms'], resumo['p50_ms'], razao, razao is not None and razao > 1 + tolerancia))
+    return linhas
@@ -0,0 +1,48 @@
+import io
+import json
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from agendamentos.models import Agendamento, AgendamentoStatus
+from consultas.models import Consulta, UltimaConsulta
+from dashboard.contadores import contar
+from dashboard.models import Contador
+from pacientes.models import Paciente
+
+
+class BenchmarkTests(TestCase):
+    def test_seed_and_run_suite(self):
+        saida = io.StringIO()
+        call_command('semear_clinica', pacientes=40, anos=1, profissionais=2, json=True, stdout=saida)
+        contagem = json.loads(saida.getvalue())
+        self.assertEqual(contagem['pacientes'], 40)
+        self.assertEqual(Paciente.objects.count(), 40)
+        self.assertEqual(
+            Consulta.objects.count(), Agendamento.objects.filter(status=AgendamentoStatus.CONCLUIDO).count(),
+        )
+        # Consultas are chained like the API does it, and the rollups match the rows
+        ultima = UltimaConsulta.objects.select_related('consulta').first()
+        self.assertIsNotNone(ultima.consulta.anotacoes_atuais)
+        self.assertEqual(
+            {k: v for k, v in contar().items() if v},
+            {(c.dia, c.metrica, c.profissional_id): c.valor for c in Contador.objects.exclude(valor=0)},
+        )
+
+        agendamentos = Agendamento.objects.count()
+        saida = io.StringIO()
+        call_command('benchmark_suite', repeat=2, warmup=0, json=True, stdout=saida)
+        resultado = json.loads(saida.getvalue())
+        self.assertEqual(resultado['dataset']['pacientes'], 40)
+        for nome in ('pacientes_lista', 'pacientes_busca', 'agendamento_criar', 'cifra_encrypt'):
+            self.assertEqual(resultado['resultados'][nome]['n'], 2)
+        self.assertEqual(Agendamento.objects.count(), agendamentos) # Writes were rolled back
+
+    def test_json_benchmark(self):
+        saida = io.StringIO()
+        call_command('benchmark_json', rows=3, repeat=2, json=True, stdout=saida)
+        resultado = json.loads(saida.getvalue())
+        linhas = {(r['payload'], r['engine']): r for r in resultado['results']}
+        self.assertIn(('consultas', 'stdlib'), linhas)
+        if resultado['orjson']: # Same bytes either way
+            self.assertEqual(linhas[('pacientes', 'orjson')]['bytes'], linhas[('pacientes', 'stdlib')]['bytes'])
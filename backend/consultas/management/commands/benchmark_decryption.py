@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import statistics
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from consultas.models import Consulta
+from core import fields
+
+NOTE_FIELDS = ('anotacoes_anteriores', 'anotacoes_atuais', 'pontos_atencao')
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the decryption of one page of Consulta notes: row by row (as during serialization) "
+        "versus core.fields.batch_decrypt. Works on in-memory instances, no database access."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100, help='Consultas per page.')
+        parser.add_argument('--note-size', type=int, default=10 * 1024, help='Bytes of plaintext per note.')
+        parser.add_argument('--repeat', type=int, default=50, help='Pages decrypted per strategy.')
+        parser.add_argument('--workers', type=int, nargs='*', default=None,
+                            help='Pool sizes to compare (default: 2, 4 and ENCRYPTED_FIELD_DECRYPT_WORKERS).')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        note = os.urandom(options['note_size'] // 2).hex() # Incompressible printable text
+        ciphertexts = {name: Consulta._meta.get_field(name).get_prep_value(note) for name in NOTE_FIELDS}
+
+        worker_counts = options['workers'] or sorted({2, 4, settings.ENCRYPTED_FIELD_DECRYPT_WORKERS})
+        strategies = [('sequential', None)] + [(f'batch x{n}', n) for n in worker_counts]
+
+        results = []
+        for name, workers in strategies:
+            executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+            timings = []
+            with mock.patch.object(settings, 'ENCRYPTED_FIELD_DECRYPT_WORKERS', workers or 1), \
+                    mock.patch.object(fields, '_decrypt_executor', executor):
+                for _ in range(repeat):
+                    page = self._page(rows, ciphertexts)
+                    start = time.perf_counter()
+                    if workers is not None:
+                        fields.batch_decrypt(page)
+                    for consulta in page:
+                        for field_name in NOTE_FIELDS:
+                            getattr(consulta, field_name)
+                    timings.append((time.perf_counter() - start) * 1000)
+            if executor:
+                executor.shutdown()
+            timings.sort()
+            results.append({
+                'strategy': name,
+                'p50_ms': statistics.median(timings),
+                'p99_ms': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+            })
+
+        if options['json']:
+            self.stdout.write(json.dumps({'rows': rows, 'note_size': options['note_size'], 'results': results}, indent=2))
+            return
+        self.stdout.write(f"{rows} consultas x {len(NOTE_FIELDS)} notes of {options['note_size']} bytes, {repeat} pages (ms)")
+        self.stdout.write(f"{'strategy':<14}{'p50':>9}{'p99':>9}")
+        for row in results:
+            self.stdout.write(f"{row['strategy']:<14}{row['p50_ms']:>9.2f}{row['p99_ms']:>9.2f}")
+
+    def _page(self, rows, ciphertexts):
+        # Instances shaped like rows loaded from the database: notes still encrypted.
+        page = []
+        for i in range(rows):
+            consulta = Consulta(id=i + 1, agendamento_id=i + 1, profissional_responsavel_id=1)
+            for name, ciphertext in ciphertexts.items():
+                consulta.__dict__[name] = fields.EncryptedValue(ciphertext)
+            page.append(consulta)
+        return page
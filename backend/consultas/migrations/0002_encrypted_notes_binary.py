@@ -0,0 +1,39 @@
+from django.db import migrations
+
+NOTE_COLUMNS = ('anotacoes_anteriores', 'anotacoes_atuais', 'pontos_atencao')
+
+
+def notes_to_bytea(apps, schema_editor):
+    """
+    EncryptedTextField now uses a binary column. New databases get bytea straight from
+    0001_initial; existing PostgreSQL tables are converted here, keeping the legacy text
+    as its ASCII bytes (still readable, see core.fields.is_legacy_format). SQLite
+    accepts BLOBs in the existing columns as they are.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_name = 'consultas_consulta' AND data_type = 'text'"
+        )
+        text_columns = {row[0] for row in cursor.fetchall()}
+    for column in NOTE_COLUMNS:
+        if column in text_columns:
+            schema_editor.execute(
+                f'ALTER TABLE consultas_consulta ALTER COLUMN {column} TYPE bytea '
+                f"USING convert_to({column}, 'UTF8')"
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultas', '0001_initial'),
+    ]
+
+    operations = [
+        # Converting back is only possible while no row uses the binary format.
+        migrations.RunPython(notes_to_bytea, migrations.RunPython.noop),
+    ]
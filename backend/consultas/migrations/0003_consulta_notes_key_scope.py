@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:52
+
+import core.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultas', '0002_encrypted_notes_binary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='consulta',
+            name='anotacoes_anteriores',
+            field=core.fields.EncryptedTextField(blank=True, key_scope='profissional_responsavel_id', null=True),
+        ),
+        migrations.AlterField(
+            model_name='consulta',
+            name='anotacoes_atuais',
+            field=core.fields.EncryptedTextField(key_scope='profissional_responsavel_id'),
+        ),
+        migrations.AlterField(
+            model_name='consulta',
+            name='pontos_atencao',
+            field=core.fields.EncryptedTextField(blank=True, key_scope='profissional_responsavel_id', null=True),
+        ),
+    ]
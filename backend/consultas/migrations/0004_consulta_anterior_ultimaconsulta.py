@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def backfill_ultima_consulta(apps, schema_editor):
+    """One pass over the consultas, newest first per paciente; the first row of each paciente wins."""
+    Consulta = apps.get_model('consultas', 'Consulta')
+    UltimaConsulta = apps.get_model('consultas', 'UltimaConsulta')
+    rows = Consulta.objects.order_by('agendamento__paciente_id', '-agendamento__data', '-agendamento__hora').values_list(
+        'id', 'agendamento__paciente_id', 'agendamento__data', 'agendamento__hora',
+    )
+    batch, last_paciente_id = [], None
+    for consulta_id, paciente_id, data, hora in rows.iterator(chunk_size=BATCH_SIZE):
+        if paciente_id == last_paciente_id:
+            continue
+        last_paciente_id = paciente_id
+        batch.append(UltimaConsulta(paciente_id=paciente_id, consulta_id=consulta_id, data=data, hora=hora))
+        if len(batch) == BATCH_SIZE:
+            UltimaConsulta.objects.bulk_create(batch)
+            batch = []
+    UltimaConsulta.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultas', '0003_consulta_notes_key_scope'),
+        ('pacientes', '0005_paciente_cpf_digitos_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consulta',
+            name='consulta_anterior',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='consultas.consulta'),
+        ),
+        migrations.CreateModel(
+            name='UltimaConsulta',
+            fields=[
+                ('paciente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='pacientes.paciente')),
+                ('data', models.DateField()),
+                ('hora', models.TimeField()),
+                ('consulta', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='consultas.consulta')),
+            ],
+        ),
+        migrations.RunPython(backfill_ultima_consulta, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
+from django.db.models import Q
 from django.conf import settings
-from pacientes.models import TimeStampedModel
+from pacientes.models import Paciente, TimeStampedModel
 from agendamentos.models import Agendamento
 from core.fields import EncryptedTextField
 
@@ -15,12 +16,83 @@ class Consulta(TimeStampedModel):
         on_delete=models.PROTECT,
         related_name='consultas_realizadas'
     )
-    anotacoes_anteriores = EncryptedTextField(blank=True, null=True)
-    anotacoes_atuais = EncryptedTextField()
-    pontos_atencao = EncryptedTextField(blank=True, null=True)
+    # Previous consultation of the same paciente, whose anotacoes_atuais are shown as the
+    # "anotações anteriores" of this one (see UltimaConsulta for how it is found).
+    consulta_anterior = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    # One data key per professional (see core.keys)
+    # Legacy copy of the previous notes, only set on consultas created before consulta_anterior
+    anotacoes_anteriores = EncryptedTextField(blank=True, null=True, key_scope='profissional_responsavel_id')
+    anotacoes_atuais = EncryptedTextField(key_scope='profissional_responsavel_id')
+    pontos_atencao = EncryptedTextField(blank=True, null=True, key_scope='profissional_responsavel_id')
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            UltimaConsulta.registrar(self)
 
     def __str__(self):
         return f"Consulta para {self.agendamento.paciente.nome} em {self.agendamento.data} por {self.profissional_responsavel.username}"
 
     class Meta:
         ordering = ['-agendamento__data', '-agendamento__hora']
+
+
+class UltimaConsulta(models.Model):
+    """
+    Most recent Consulta of each paciente, by agendamento date and time, so the previous
+    consultation is found with a primary-key lookup instead of an ordered join. Kept up
+    to date by Consulta.save(); a row that goes missing (its consulta was deleted) is
+    rebuilt on the next lookup.
+    """
+    paciente = models.OneToOneField(Paciente, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    consulta = models.OneToOneField(Consulta, on_delete=models.CASCADE, related_name='+')
+    data = models.DateField()
+    hora = models.TimeField()
+
+    @classmethod
+    def registrar(cls, consulta):
+        """Make `consulta` the latest one of its paciente if it is more recent than the current one."""
+        agendamento = consulta.agendamento
+        updated = cls.objects.filter(
+            Q(data__lt=agendamento.data) | Q(data=agendamento.data, hora__lt=agendamento.hora),
+            pk=agendamento.paciente_id,
+        ).update(consulta=consulta, data=agendamento.data, hora=agendamento.hora)
+        if not updated and not cls.objects.filter(pk=agendamento.paciente_id).exists():
+            cls.reconstruir(agendamento.paciente_id)
+
+    @classmethod
+    def reconstruir(cls, paciente_id):
+        """Recompute the row of `paciente_id` from its consultas. Returns it, or None."""
+        latest = Consulta.objects.filter(agendamento__paciente_id=paciente_id).order_by(
+            '-agendamento__data', '-agendamento__hora'
+        ).values_list('id', 'agendamento__data', 'agendamento__hora').first()
+        if latest is None:
+            cls.objects.filter(pk=paciente_id).delete()
+            return None
+        ultima, _ = cls.objects.update_or_create(
+            paciente_id=paciente_id, defaults={'consulta_id': latest[0], 'data': latest[1], 'hora': latest[2]},
+        )
+        return ultima
+
+    @classmethod
+    def consulta_anterior_id(cls, paciente_id, data):
+        """Id of the latest consulta of `paciente_id` on a day before `data`, or None."""
+        ultima = cls.objects.filter(pk=paciente_id).first() or cls.reconstruir(paciente_id)
+        if ultima is None:
+            return None
+        if ultima.data < data:
+            return ultima.consulta_id
+        # A consultation registered for an earlier date than the latest one: ordered lookup.
+        return Consulta.objects.filter(
+            agendamento__paciente_id=paciente_id, agendamento__data__lt=data,
+        ).order_by('-agendamento__data', '-agendamento__hora').values_list('id', flat=True).first()
+
+    def __str__(self):
+        return f"Última consulta de {self.paciente_id}: {self.consulta_id}"
@@ -1,10 +1,51 @@
 from rest_framework import serializers
 from django.db import transaction
-from .models import Consulta
+from .models import Consulta, UltimaConsulta
 from agendamentos.models import Agendamento, AgendamentoStatus
 from usuarios.models import UserRole # For checking role
-
-class ConsultaSerializer(serializers.ModelSerializer):
+from core.fields import batch_decrypt
+from core.fieldsets import SparseFieldsetSerializerMixin
+
+
+class EncryptedNoteField(serializers.CharField):
+    """
+    CharField for the EncryptedTextField notes. Reading goes through the parent's
+    `_handle_decryption_for_output`, which checks access *before* touching the attribute,
+    so notes the user is not allowed to see are never decrypted.
+    """
+
+    def get_attribute(self, instance):
+        return self.parent._handle_decryption_for_output(self.parent._get_request_user(), instance, self.source)
+
+    def to_representation(self, value):
+        return value
+
+
+class ConsultaListSerializer(serializers.ListSerializer):
+    """
+    Decrypts the notes of a whole page in one parallel batch before rendering it,
+    limited to the rows the requesting professional is allowed to read.
+    """
+
+    def to_representation(self, data):
+        instances = list(data.all() if hasattr(data, 'all') else data)
+        user = self.child._get_request_user()
+        # Only the notes the page renders (?fields=/?omit=, see core.fieldsets)
+        notas = [nome for nome in ('anotacoes_anteriores', 'anotacoes_atuais', 'pontos_atencao') if nome in self.child.fields]
+        if user is not None:
+            readable = [i for i in instances if i.profissional_responsavel_id == user.pk]
+            if notas:
+                batch_decrypt(readable, field_names=notas)
+            # Previous notes are read from the previous consulta itself
+            if 'anotacoes_anteriores' in self.child.fields:
+                batch_decrypt(
+                    (i.consulta_anterior for i in readable if i.consulta_anterior_id is not None),
+                    field_names=['anotacoes_atuais'],
+                )
+        return super().to_representation(instances)
+
+
+class ConsultaSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     agendamento_id = serializers.PrimaryKeyRelatedField(
         queryset=Agendamento.objects.filter(status=AgendamentoStatus.EM_ANDAMENTO, consulta__isnull=True),
         source='agendamento', write_only=True, label="ID do Agendamento"
@@ -13,61 +54,57 @@ class ConsultaSerializer(serializers.ModelSerializer):
     data_agendamento = serializers.DateField(source='agendamento.data', read_only=True)
     hora_agendamento = serializers.TimeField(source='agendamento.hora', read_only=True)
     profissional_responsavel_username = serializers.CharField(source='profissional_responsavel.username', read_only=True, allow_null=True)
-    anotacoes_anteriores = serializers.CharField(read_only=True, allow_null=True)
-    anotacoes_atuais = serializers.CharField()
-    pontos_atencao = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    consulta_anterior = serializers.PrimaryKeyRelatedField(read_only=True)
+    anotacoes_anteriores = EncryptedNoteField(read_only=True, allow_null=True)
+    anotacoes_atuais = EncryptedNoteField()
+    pontos_atencao = EncryptedNoteField(required=False, allow_blank=True, allow_null=True)
     concluir_consulta = serializers.BooleanField(write_only=True, default=False, required=False)
     criado_por_username = serializers.CharField(source='criado_por.username', read_only=True, allow_null=True)
     modificado_por_username = serializers.CharField(source='modificado_por.username', read_only=True, allow_null=True)
 
     class Meta:
         model = Consulta
+        list_serializer_class = ConsultaListSerializer
         fields = [
             'id', 'agendamento_id', 'paciente_nome', 'data_agendamento', 'hora_agendamento',
-            'profissional_responsavel_username', 'anotacoes_anteriores', 'anotacoes_atuais',
+            'profissional_responsavel_username', 'consulta_anterior', 'anotacoes_anteriores', 'anotacoes_atuais',
             'pontos_atencao', 'concluir_consulta', 'criado_em', 'atualizado_em',
             'criado_por_username', 'modificado_por_username',
         ]
         read_only_fields = [
             'criado_em', 'atualizado_em', 'profissional_responsavel_username',
-            'anotacoes_anteriores', 'criado_por_username', 'modificado_por_username'
+            'consulta_anterior', 'anotacoes_anteriores', 'criado_por_username', 'modificado_por_username'
+        ]
+        # The list action leaves the notes out unless asked for, so it decrypts nothing (see core.fieldsets)
+        list_fields = [
+            'id', 'paciente_nome', 'data_agendamento', 'hora_agendamento',
+            'profissional_responsavel_username', 'consulta_anterior', 'atualizado_em',
         ]
+        # Access to the notes is checked against profissional_responsavel_id, and the
+        # previous notes are read from the previous consulta
+        required_sources = ['profissional_responsavel', 'consulta_anterior']
+        field_sources = {'anotacoes_anteriores': ['anotacoes_anteriores', 'consulta_anterior__anotacoes_atuais']}
 
     def _get_request_user(self):
         request = self.context.get('request')
         return request.user if request and hasattr(request, 'user') and request.user.is_authenticated else None
 
     def _handle_decryption_for_output(self, user, consulta_instance, field_name):
-        raw_value = getattr(consulta_instance, field_name, None)
-        if raw_value is None: return None
-        if raw_value == "DECRYPTION_ERROR": return "Erro ao decifrar dado."
+        holder = consulta_instance
+        if field_name == 'anotacoes_anteriores' and consulta_instance.consulta_anterior_id is not None:
+            # Shown from the previous consulta, decrypted only here when displayed
+            holder, field_name = consulta_instance.consulta_anterior, 'anotacoes_atuais'
+
+        # Peek at the stored value first: EncryptedTextField only decrypts when the attribute is read
+        if Consulta._meta.get_field(field_name).peek(holder) is None: return None
 
         # Ensure user is the professional responsible for this specific consultation to allow decryption
-        if user and user.is_authenticated and user == consulta_instance.profissional_responsavel:
-            return raw_value # Raw value is already decrypted by the custom field's from_db_value
-        return "ACESSO RESTRITO"
+        if not (user and user.is_authenticated and user.pk == consulta_instance.profissional_responsavel_id):
+            return "ACESSO RESTRITO"
 
-    def to_representation(self, instance):
-        ret = super().to_representation(instance)
-        user = self._get_request_user()
-        # Pass the instance itself to _handle_decryption_for_output
-        ret['anotacoes_anteriores'] = self._handle_decryption_for_output(user, instance, 'anotacoes_anteriores')
-        ret['anotacoes_atuais'] = self._handle_decryption_for_output(user, instance, 'anotacoes_atuais')
-        ret['pontos_atencao'] = self._handle_decryption_for_output(user, instance, 'pontos_atencao')
-        return ret
-
-    def _get_previous_consultation_notes(self, paciente, current_agendamento_date):
-        previous_consulta = Consulta.objects.filter(
-            agendamento__paciente=paciente,
-            agendamento__data__lt=current_agendamento_date,
-        ).order_by('-agendamento__data', '-agendamento__hora').first()
-
-        if previous_consulta:
-            # Accessing the field directly will use the custom field's decryption logic
-            notes = previous_consulta.anotacoes_atuais
-            # The custom field returns "DECRYPTION_ERROR" if it fails, so we check for that
-            return notes if notes != "DECRYPTION_ERROR" else "Erro ao carregar anotações anteriores."
-        return None
+        raw_value = getattr(holder, field_name) # Decrypted here, on first access
+        if raw_value == "DECRYPTION_ERROR": return "Erro ao decifrar dado."
+        return raw_value
 
     @transaction.atomic
     def create(self, validated_data):
@@ -79,9 +116,8 @@ class ConsultaSerializer(serializers.ModelSerializer):
         validated_data['criado_por'] = user
         agendamento = validated_data['agendamento']
 
-        # Fetch previous notes using the custom field's decryption
-        previous_notes = self._get_previous_consultation_notes(agendamento.paciente, agendamento.data)
-        validated_data['anotacoes_anteriores'] = previous_notes
+        # Point at the previous consulta instead of copying its notes: one primary-key lookup
+        validated_data['consulta_anterior_id'] = UltimaConsulta.consulta_anterior_id(agendamento.paciente_id, agendamento.data)
 
         concluir = validated_data.pop('concluir_consulta', False)
         consulta = Consulta.objects.create(**validated_data)
@@ -101,6 +137,7 @@ class ConsultaSerializer(serializers.ModelSerializer):
         validated_data['modificado_por'] = user
         # These fields should not be changed during an update via this serializer
         validated_data.pop('anotacoes_anteriores', None)
+        validated_data.pop('consulta_anterior', None)
         validated_data.pop('profissional_responsavel', None)
         validated_data.pop('agendamento', None) # Agendamento is fixed once consulta is created
 
@@ -1,11 +1,23 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase
-from .models import Consulta
+from rest_framework.test import APIRequestFactory, APITestCase
+from .models import Consulta, UltimaConsulta
+from .serializers import ConsultaSerializer
 from agendamentos.models import Agendamento, AgendamentoStatus
+from core import fields, keys
+from core.ciphers import AESGCMEngine, EnvelopeEngine, FernetEngine, get_engine
+from core.management.commands import migrate_encrypted_fields
+from core.models import DataKey
 from pacientes.models import Paciente, Endereco
 from usuarios.models import CustomUser, UserRole
+from io import StringIO
+from unittest import mock
+import base64
 import datetime
+import os
 
 # Mock settings.FERNET_KEY for tests if it's not already configured robustly for test environment
 # Ensure the key used for tests is consistent if you need to decrypt values manually for asserts.
@@ -69,7 +81,8 @@ class ConsultaAPITests(APITestCase):
         consulta = Consulta.objects.get(agendamento=self.agendamento2_curr)
         self.assertEqual(consulta.profissional_responsavel, self.prof_user1)
         self.assertEqual(consulta.anotacoes_atuais, "Anotações da consulta atual.")
-        self.assertEqual(consulta.anotacoes_anteriores, self.consulta1_prev_notes)
+        self.assertEqual(consulta.consulta_anterior, self.consulta1_prev)
+        self.assertIsNone(consulta.anotacoes_anteriores) # Not copied any more
         self.assertEqual(consulta.criado_por, self.prof_user1)
         self.agendamento2_curr.refresh_from_db()
         self.assertEqual(self.agendamento2_curr.status, AgendamentoStatus.EM_ANDAMENTO)
@@ -78,6 +91,29 @@ class ConsultaAPITests(APITestCase):
         self.assertEqual(response.data['anotacoes_anteriores'], self.consulta1_prev_notes)
 
 
+    def test_previous_consulta_is_found_through_the_latest_consulta_index(self):
+        self.assertEqual(UltimaConsulta.objects.get(pk=self.paciente.pk).consulta, self.consulta1_prev)
+        data = {'agendamento_id': self.agendamento2_curr.pk, 'anotacoes_atuais': "Atual."}
+        # Agendamento, savepoint, UltimaConsulta by pk, data key, insert, dashboard counter (UPDATE,
+        # then savepoint, INSERT, release as it is the day's first), index update, release, then
+        # paciente and previous consulta for the response: no ordered join over the consultas.
+        with self.assertNumQueries(13):
+            response = self.client.post(self.consulta_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response.data['consulta_anterior'], self.consulta1_prev.pk)
+        self.assertEqual(UltimaConsulta.objects.get(pk=self.paciente.pk).consulta_id, response.data['id'])
+
+        # An older consultation registered late still points at the right one
+        agendamento_antigo = Agendamento.objects.create(paciente=self.paciente, data=self.agendamento1_prev_date - datetime.timedelta(days=5), hora='09:00:00')
+        self.assertIsNone(UltimaConsulta.consulta_anterior_id(self.paciente.pk, agendamento_antigo.data))
+        self.assertEqual(UltimaConsulta.consulta_anterior_id(self.paciente.pk, self.agendamento1_prev_date + datetime.timedelta(days=1)), self.consulta1_prev.pk)
+
+        # Deleting the latest consulta drops its index row, rebuilt on the next lookup
+        Consulta.objects.filter(pk=response.data['id']).delete()
+        self.assertFalse(UltimaConsulta.objects.filter(pk=self.paciente.pk).exists())
+        self.assertEqual(UltimaConsulta.consulta_anterior_id(self.paciente.pk, self.agendamento2_curr_date), self.consulta1_prev.pk)
+        self.assertEqual(UltimaConsulta.objects.get(pk=self.paciente.pk).consulta, self.consulta1_prev)
+
     def test_create_consulta_and_conclude_agendamento(self):
         data = {
             'agendamento_id': self.agendamento2_curr.pk,
@@ -116,10 +152,28 @@ class ConsultaAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         expected_count = Consulta.objects.filter(profissional_responsavel=self.prof_user1).count()
-        self.assertEqual(len(response.data), expected_count)
-        for c_data in response.data:
+        self.assertEqual(len(response.data['results']), expected_count)
+        for c_data in response.data['results']:
             self.assertEqual(c_data['profissional_responsavel_username'], self.prof_user1.username)
 
+    def test_sparse_fieldsets(self):
+        atual = Consulta.objects.create(
+            agendamento=self.agendamento2_curr, profissional_responsavel=self.prof_user1,
+            consulta_anterior=self.consulta1_prev, anotacoes_atuais="Atual.",
+        )
+        self.client.force_authenticate(user=self.prof_user1)
+        # The compact list leaves the notes out and decrypts nothing
+        with mock.patch.object(fields, 'decrypt_value', wraps=fields.decrypt_value) as decrypt:
+            response = self.client.get(self.consulta_url)
+        self.assertNotIn('anotacoes_atuais', response.data['results'][0])
+        self.assertEqual(decrypt.call_count, 0)
+
+        # Previous notes asked for: still the page query only, no per-row loads
+        with self.assertNumQueries(1):
+            response = self.client.get(self.consulta_url, {'fields': 'id,anotacoes_anteriores'})
+        notas = {c['id']: c['anotacoes_anteriores'] for c in response.data['results']}
+        self.assertEqual(notas[atual.pk], self.consulta1_prev_notes)
+
     def test_profissional_cannot_see_other_prof_consulta_detail_decrypted(self):
         detail_url = reverse('consulta-detail', kwargs={'pk': self.consulta1_prev.pk}) # Belongs to prof_user1
         self.client.force_authenticate(user=self.prof_user2)
@@ -159,3 +213,171 @@ class ConsultaAPITests(APITestCase):
 
         self.agendamento2_curr.refresh_from_db()
         self.assertEqual(self.agendamento2_curr.status, AgendamentoStatus.CONCLUIDO)
+
+
+class EncryptedTextFieldLazyDecryptionTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.prof_user = CustomUser.objects.create_user(username='prof_lazy', password='password', role=UserRole.PROFISSIONAL_SAUDE)
+        cls.other_prof = CustomUser.objects.create_user(username='prof_lazy2', password='password', role=UserRole.PROFISSIONAL_SAUDE)
+        endereco = Endereco.objects.create(cep='33333-000', uf='MG', cidade='BH', logradouro='Rua Lazy', numero='1', bairro='Centro')
+        paciente = Paciente.objects.create(cpf='555.555.555-55', nome='Paciente Lazy', nascimento='1980-01-01', celular='31999990000', email='lazy@example.com', endereco_residencial=endereco)
+        agendamento = Agendamento.objects.create(paciente=paciente, data=datetime.date.today(), hora='09:00:00')
+        cls.consulta = Consulta.objects.create(
+            agendamento=agendamento, profissional_responsavel=cls.prof_user,
+            anotacoes_atuais="Notas lazy.", pontos_atencao="Ponto lazy.",
+        )
+
+    def test_decrypts_only_on_access(self):
+        with mock.patch.object(fields, 'decrypt_value', wraps=fields.decrypt_value) as decrypt:
+            consulta = Consulta.objects.get(pk=self.consulta.pk)
+            str(consulta.agendamento_id)
+            self.assertEqual(decrypt.call_count, 0)
+            self.assertEqual(consulta.anotacoes_atuais, "Notas lazy.")
+            self.assertEqual(consulta.anotacoes_atuais, "Notas lazy.") # Cached on the instance
+            self.assertEqual(decrypt.call_count, 1)
+
+    def test_peek_loads_deferred_field_without_decrypting(self):
+        consulta = Consulta.objects.defer('anotacoes_atuais').get(pk=self.consulta.pk)
+        field = Consulta._meta.get_field('anotacoes_atuais')
+        with mock.patch.object(fields, 'decrypt_value', wraps=fields.decrypt_value) as decrypt:
+            value = field.peek(consulta)
+            self.assertIsInstance(value, fields.EncryptedValue)
+            self.assertEqual(decrypt.call_count, 0)
+        self.assertEqual(consulta.anotacoes_atuais, "Notas lazy.")
+
+    def test_untouched_notes_are_saved_without_reencrypting(self):
+        stored = Consulta.objects.filter(pk=self.consulta.pk).values_list('anotacoes_atuais', flat=True).get().ciphertext
+        consulta = Consulta.objects.get(pk=self.consulta.pk)
+        with mock.patch.object(fields, 'encrypt_value', wraps=fields.encrypt_value) as encrypt:
+            consulta.save()
+            self.assertEqual(encrypt.call_count, 0)
+        consulta.refresh_from_db()
+        self.assertEqual(Consulta.objects.filter(pk=self.consulta.pk).values_list('anotacoes_atuais', flat=True).get().ciphertext, stored)
+        self.assertEqual(consulta.anotacoes_atuais, "Notas lazy.")
+
+    def test_legacy_values_are_read_and_converted_to_binary(self):
+        stored = lambda: Consulta.objects.filter(pk=self.consulta.pk).values_list('anotacoes_atuais', flat=True).get().ciphertext
+        self.assertEqual(stored()[:1], bytes([get_engine().tag]))
+
+        legacy = base64.urlsafe_b64encode(fields.get_cipher().encrypt("Notas antigas.".encode())).decode()
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE consultas_consulta SET anotacoes_atuais = %s WHERE id = %s", [legacy, self.consulta.pk])
+        self.assertEqual(Consulta.objects.get(pk=self.consulta.pk).anotacoes_atuais, "Notas antigas.")
+
+        call_command('migrate_encrypted_fields', stdout=StringIO())
+        converted = stored()
+        self.assertEqual(converted[:1], bytes([fields.FORMAT_FERNET]))
+        self.assertLess(len(converted), len(legacy))
+        self.assertEqual(Consulta.objects.get(pk=self.consulta.pk).anotacoes_atuais, "Notas antigas.")
+
+        out = StringIO()
+        call_command('migrate_encrypted_fields', stdout=out)
+        self.assertIn("0 values converted", out.getvalue())
+        self.assertEqual(stored(), converted)
+
+    def test_migration_keeps_notes_saved_after_the_batch_was_read(self):
+        legacy = base64.urlsafe_b64encode(fields.get_cipher().encrypt("Notas antigas.".encode())).decode()
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE consultas_consulta SET anotacoes_atuais = %s WHERE id = %s", [legacy, self.consulta.pk])
+
+        def editar_e_converter(stored):
+            # A clinician saves the note between the read of the batch and its UPDATE
+            Consulta.objects.filter(pk=self.consulta.pk).update(anotacoes_atuais="Notas editadas.")
+            return fields.to_current_format(stored)
+
+        with mock.patch.object(migrate_encrypted_fields, 'to_current_format', side_effect=editar_e_converter):
+            call_command('migrate_encrypted_fields', stdout=StringIO())
+        self.assertEqual(Consulta.objects.get(pk=self.consulta.pk).anotacoes_atuais, "Notas editadas.")
+
+    def test_engines_are_tagged_and_can_be_mixed(self):
+        with override_settings(ENCRYPTED_FIELD_ENGINE='fernet'):
+            Consulta.objects.filter(pk=self.consulta.pk).update(anotacoes_atuais="Notas Fernet.")
+        with override_settings(ENCRYPTED_FIELD_ENGINE='aesgcm'):
+            Consulta.objects.filter(pk=self.consulta.pk).update(pontos_atencao="Ponto AES-GCM.")
+
+        notas, ponto = Consulta.objects.filter(pk=self.consulta.pk).values_list('anotacoes_atuais', 'pontos_atencao').get()
+        self.assertEqual(notas.ciphertext[0], FernetEngine.tag)
+        self.assertEqual(ponto.ciphertext[0], AESGCMEngine.tag)
+        consulta = Consulta.objects.get(pk=self.consulta.pk)
+        self.assertEqual((consulta.anotacoes_atuais, consulta.pontos_atencao), ("Notas Fernet.", "Ponto AES-GCM."))
+
+        tampered = bytearray(ponto.ciphertext)
+        tampered[-1] ^= 1
+        self.assertEqual(fields.decrypt_value(bytes(tampered)), "DECRYPTION_ERROR")
+
+    def test_envelope_data_key_per_professional_and_master_key_rotation(self):
+        agendamento = Agendamento.objects.create(paciente=self.consulta.agendamento.paciente, data=datetime.date.today(), hora='10:00:00')
+        other = Consulta.objects.create(agendamento=agendamento, profissional_responsavel=self.other_prof, anotacoes_atuais="Notas outro.")
+
+        stored = dict(Consulta.objects.values_list('id', 'anotacoes_atuais'))
+        self.assertEqual(stored[self.consulta.pk].ciphertext[0], EnvelopeEngine.tag)
+        self.assertEqual(
+            set(DataKey.objects.values_list('scope', flat=True)),
+            {f"consultas.Consulta:profissional_responsavel_id={user.pk}" for user in (self.prof_user, self.other_prof)},
+        )
+
+        new_master = 'v2:' + base64.urlsafe_b64encode(os.urandom(32)).decode()
+        with override_settings(ENCRYPTION_MASTER_KEYS=[new_master]):
+            call_command('rotate_master_key', stdout=StringIO())
+            self.assertEqual(set(DataKey.objects.values_list('master_key_id', flat=True)), {'v2'})
+            self.assertEqual(dict(Consulta.objects.values_list('id', 'anotacoes_atuais')), stored) # Notes untouched
+            keys.get_cache().clear()
+            self.assertEqual(Consulta.objects.get(pk=other.pk).anotacoes_atuais, "Notas outro.")
+            self.assertEqual(Consulta.objects.get(pk=self.consulta.pk).anotacoes_atuais, "Notas lazy.")
+
+    def test_batch_decrypt_unwraps_each_data_key_once(self):
+        paciente = self.consulta.agendamento.paciente
+        for day in range(1, 7):
+            ag = Agendamento.objects.create(paciente=paciente, data=datetime.date.today() + datetime.timedelta(days=day), hora='09:00:00')
+            prof = self.prof_user if day % 2 else self.other_prof
+            Consulta.objects.create(agendamento=ag, profissional_responsavel=prof, anotacoes_atuais=f"Notas {day}.", pontos_atencao="Ponto.")
+
+        page = list(Consulta.objects.all())
+        keys.get_cache().clear()
+        with mock.patch.object(keys, 'unwrap_key', wraps=keys.unwrap_key) as unwrap, self.assertNumQueries(1):
+            fields.batch_decrypt(page)
+        self.assertEqual(unwrap.call_count, 2)
+        self.assertEqual(sorted(c.anotacoes_atuais for c in page)[-1], "Notas lazy.")
+
+    def test_defer_only_and_queryset_update(self):
+        consulta = Consulta.objects.defer('anotacoes_atuais').get(pk=self.consulta.pk)
+        self.assertEqual(consulta.anotacoes_atuais, "Notas lazy.")
+        consulta = Consulta.objects.only('id', 'pontos_atencao').get(pk=self.consulta.pk)
+        self.assertEqual(consulta.pontos_atencao, "Ponto lazy.")
+
+        Consulta.objects.filter(pk=self.consulta.pk).update(pontos_atencao="Ponto atualizado.")
+        self.assertEqual(Consulta.objects.get(pk=self.consulta.pk).pontos_atencao, "Ponto atualizado.")
+
+    def test_restricted_output_never_decrypts(self):
+        request = APIRequestFactory().get('/')
+        request.user = self.other_prof
+        consulta = Consulta.objects.get(pk=self.consulta.pk)
+        with mock.patch.object(fields, 'decrypt_value', wraps=fields.decrypt_value) as decrypt:
+            data = ConsultaSerializer(consulta, context={'request': request}).data
+        self.assertEqual(data['anotacoes_atuais'], "ACESSO RESTRITO")
+        self.assertIsNone(data['anotacoes_anteriores'])
+        self.assertEqual(decrypt.call_count, 0)
+
+    def test_batch_decrypt_page(self):
+        agendamento = self.consulta.agendamento
+        for day in range(1, 5):
+            ag = Agendamento.objects.create(paciente=agendamento.paciente, data=agendamento.data + datetime.timedelta(days=day), hora='09:00:00')
+            Consulta.objects.create(agendamento=ag, profissional_responsavel=self.prof_user, anotacoes_atuais=f"Notas {day}.", pontos_atencao=f"Ponto {day}.")
+
+        page = list(Consulta.objects.all())
+        with override_settings(ENCRYPTED_FIELD_DECRYPT_WORKERS=2):
+            fields.batch_decrypt(page, field_names=['anotacoes_atuais', 'pontos_atencao'])
+        for consulta in page:
+            self.assertTrue(consulta.__dict__['anotacoes_atuais'].is_decrypted)
+            self.assertTrue(consulta.__dict__['pontos_atencao'].is_decrypted)
+        self.assertEqual(sorted(c.anotacoes_atuais for c in page)[0], "Notas 1.")
+
+        # The list endpoint renders decrypted notes for the responsible professional
+        self.client.force_authenticate(user=self.prof_user)
+        response = self.client.get(reverse('consulta-list'), {'fields': 'id,anotacoes_atuais'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertCountEqual(
+            [c['anotacoes_atuais'] for c in response.data['results']],
+            ["Notas lazy.", "Notas 1.", "Notas 2.", "Notas 3.", "Notas 4."],
+        )
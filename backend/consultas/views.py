@@ -3,15 +3,18 @@ from .models import Consulta
 from .serializers import ConsultaSerializer
 from usuarios.permissions import IsProfissionalSaude, IsSecretaria, IsAdminUser
 from usuarios.models import UserRole
+from core.fieldsets import SparseFieldsetMixin
 
-class ConsultaViewSet(viewsets.ModelViewSet):
+class ConsultaViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = ConsultaSerializer
     permission_classes = [IsProfissionalSaude | IsSecretaria | IsAdminUser]
+    ordering = ['-agendamento__data', '-agendamento__hora', '-id'] # Pagination keyset, most recent first
 
     def get_queryset(self):
         user = self.request.user
         base_queryset = Consulta.objects.select_related(
-            'agendamento__paciente', 'profissional_responsavel', 'criado_por', 'modificado_por'
+            'agendamento__paciente', 'profissional_responsavel', 'criado_por', 'modificado_por',
+            'consulta_anterior', # Its notes stay encrypted until displayed
         )
         # Ensure user is authenticated and is a health professional
         if user.is_authenticated and hasattr(user, 'role') and user.role == UserRole.PROFISSIONAL_SAUDE:
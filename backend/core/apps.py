@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'core'
+
+    def ready(self):
+        from . import checks, response_cache # noqa: F401 (checks registers itself)
+        # Cached list/retrieve responses (see core.response_cache)
+        response_cache.conectar()
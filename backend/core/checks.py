@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def check_response_cache(app_configs, **kwargs):
+    """The response cache on a per-process backend serves stale data in multi-worker deployments."""
+    backend = settings.CACHES.get(settings.RESPONSE_CACHE_ALIAS, {}).get('BACKEND')
+    if settings.RESPONSE_CACHE_ENABLED and backend in settings.CACHES_POR_PROCESSO:
+        return [Warning(
+            f"RESPONSE_CACHE_ENABLED with the per-process cache {backend}: with more than one "
+            f"worker, changes made in one are not seen by the others for up to RESPONSE_CACHE_TTL "
+            f"({settings.RESPONSE_CACHE_TTL} s).",
+            hint="Configure a shared cache (CACHE_BACKEND/CACHE_LOCATION) or set RESPONSE_CACHE_ENABLED=False.",
+            id='core.W001',
+        )]
+    return []
+
+
+@register()
+def check_calendario_cache(app_configs, **kwargs):
+    """Same as check_response_cache, for the agenda month view (agendamentos.calendario)."""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if settings.AGENDA_CALENDARIO_CACHE_SEGUNDOS > 0 and backend in settings.CACHES_POR_PROCESSO:
+        return [Warning(
+            f"AGENDA_CALENDARIO_CACHE_SEGUNDOS is set with the per-process cache {backend}: with more "
+            f"than one worker, the month view shows stale counts in the others for up to "
+            f"{settings.AGENDA_CALENDARIO_CACHE_SEGUNDOS} s.",
+            hint="Configure a shared cache (CACHE_BACKEND/CACHE_LOCATION) or set AGENDA_CALENDARIO_CACHE_SEGUNDOS=0.",
+            id='core.W002',
+        )]
+    return []
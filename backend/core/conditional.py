@@ -0,0 +1,104 @@
+"""
+Conditional GET (ETag / Last-Modified) for list and detail endpoints.
+
+The validators come from the rows' `atualizado_em` (and those of related rows whose
+fields are rendered, see `conditional_timestamps`), never from the rendered body, so a
+request whose If-None-Match or If-Modified-Since still holds gets a 304 before the
+serializer runs:
+
+- detail: the object is loaded as usual (same query, same permission checks) and its
+  timestamps are compared;
+- list: one aggregate query, COUNT(*) and MAX() of each timestamp under the active
+  filters and search, fingerprints the whole result. An insert or update moves a MAX,
+  a delete changes the COUNT. The query string (page cursor, page size, ordering) and the
+  user are part of the ETag. Lists carry no Last-Modified: a delete does not move any MAX,
+  so a client revalidating with If-Modified-Since alone would be told a shrunken list is
+  unchanged.
+
+Responses carry Cache-Control: private, no-cache, so browsers keep them but revalidate
+on every use, which is what turns the frontend's repeated fetches into 304s.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def _etag(*parts):
+    digest = hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32]
+    # Weak: equal timestamps mean an equivalent representation, not identical bytes
+    return f'W/"{digest}"'
+
+
+def _lookup(instance, path):
+    for attr in path.split('__'):
+        if instance is None:
+            return None
+        instance = getattr(instance, attr)
+    return instance
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin adding an ETag to list() and ETag/Last-Modified to retrieve(), and
+    answering 304 Not Modified when the client's copy is current. `conditional_timestamps`
+    lists the datetime fields (ORM paths) that change whenever the representation does.
+    """
+    conditional_timestamps = ('atualizado_em',)
+
+    def get_list_validators(self, request, queryset):
+        """ETag fingerprinting `queryset`, one aggregate query."""
+        maximos = {f'max_{i}': Max(campo) for i, campo in enumerate(self.conditional_timestamps)}
+        valores = queryset.order_by().aggregate(total=Count('pk'), **maximos)
+        datas = [valores[f'max_{i}'] for i in range(len(self.conditional_timestamps))]
+        return _etag(
+            request.user.pk, request.get_full_path(), valores['total'],
+            *(data.isoformat() if data else '' for data in datas),
+        )
+
+    def get_object_validators(self, request, instance):
+        """(etag, last_modified) of one object, from its loaded timestamps."""
+        datas = [_lookup(instance, campo) for campo in self.conditional_timestamps]
+        etag = _etag(
+            instance._meta.label, instance.pk, *(data.isoformat() if data else '' for data in datas),
+        )
+        return etag, max((data for data in datas if data), default=None)
+
+    def _not_modified(self, request, etag, last_modified):
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request._request, etag=etag, last_modified=timestamp)
+        if response is not None:
+            self._set_validators(response, etag, last_modified)
+        return response
+
+    def _set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        etag = self.get_list_validators(request, queryset)
+        not_modified = self._not_modified(request, etag, None)
+        if not_modified is not None:
+            return not_modified
+
+        # ListModelMixin.list() on the queryset already filtered above
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        else:
+            response = Response(self.get_serializer(queryset, many=True).data)
+        return self._set_validators(response, etag, None)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag, last_modified = self.get_object_validators(request, instance)
+        not_modified = self._not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return self._set_validators(Response(self.get_serializer(instance).data), etag, last_modified)
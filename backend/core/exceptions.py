@@ -0,0 +1,16 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class Conflict(APIException):
+    """409: the request clashes with the current state of a resource, e.g. a taken slot."""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Conflito com o estado atual do recurso.'
+    default_code = 'conflict'
+
+
+class IdempotencyKeyReused(APIException):
+    """422: an Idempotency-Key already used for a different request."""
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'Esta Idempotency-Key já foi usada com outra requisição.'
+    default_code = 'idempotency_key_reused'
@@ -0,0 +1,108 @@
+"""
+Streaming CSV/NDJSON export for list endpoints.
+
+The rows are read with QuerySet.iterator(chunk_size=EXPORT_CHUNK_SIZE) as plain value
+tuples (no model instances, no serializer) and written to a StreamingHttpResponse one
+chunk at a time, so the memory used does not depend on how many rows are exported.
+CSV text cells that a spreadsheet would evaluate as a formula are prefixed with "'".
+"""
+import csv
+import io
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+
+from core.pagination import KeysetCursorPagination
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+# Text cells starting with these are run as formulas by spreadsheet applications
+INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _celula_csv(valor):
+    if isinstance(valor, str) and valor.startswith(INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def _linhas_csv(cabecalho, linhas):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(cabecalho)
+    for bloco in linhas:
+        writer.writerows([_celula_csv(valor) for valor in linha] for linha in bloco)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _linhas_ndjson(cabecalho, linhas):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for bloco in linhas:
+        yield ''.join(encoder.encode(dict(zip(cabecalho, linha))) + '\n' for linha in bloco)
+
+
+def _em_blocos(iterator, tamanho):
+    # Groups the rows so each write to the response carries a whole chunk, not one row
+    bloco = []
+    for linha in iterator:
+        bloco.append(linha)
+        if len(bloco) == tamanho:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+def exportar(queryset, campos, formato, nome_arquivo, chunk_size=None):
+    """
+    StreamingHttpResponse with the rows of `queryset` in `formato` ('csv' or 'ndjson').
+    `campos` maps each output column to the ORM lookup it is read from.
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    linhas = _em_blocos(queryset.values_list(*campos.values()).iterator(chunk_size=chunk_size), chunk_size)
+    gerar = _linhas_csv if formato == 'csv' else _linhas_ndjson
+    response = StreamingHttpResponse(gerar(list(campos), linhas), content_type=FORMATOS[formato])
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}.{formato}"'
+    return response
+
+
+class ExportMixin:
+    """
+    ViewSet mixin adding GET .../exportar/?formato=csv|ndjson&campos=a,b with the same
+    filters, search and ordering as the list endpoint. `export_fields` maps the columns
+    that can be exported to ORM lookups; all of them are exported unless ?campos= picks some.
+    """
+    export_fields = {}
+    export_filename = 'exportacao'
+
+    def get_export_fields(self, request):
+        pedidos = [c.strip() for c in request.query_params.get('campos', '').split(',') if c.strip()]
+        if not pedidos:
+            return dict(self.export_fields)
+        invalidos = [c for c in pedidos if c not in self.export_fields]
+        if invalidos:
+            raise ValidationError({'campos': [
+                f"Campos desconhecidos: {', '.join(invalidos)}. Disponíveis: {', '.join(self.export_fields)}."
+            ]})
+        return {c: self.export_fields[c] for c in pedidos}
+
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in FORMATOS:
+            raise ValidationError({'formato': [f"Use um de: {', '.join(FORMATOS)}."]})
+        campos = self.get_export_fields(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        # Same row order as the paginated list, search rank included
+        ordering = KeysetCursorPagination().get_ordering(request, queryset, self)
+        return exportar(queryset.order_by(*ordering), campos, formato, self.export_filename)
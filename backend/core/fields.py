@@ -1,38 +1,206 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
 from django.db import models
+from django.db.models.query_utils import DeferredAttribute
 from django.conf import settings
-from cryptography.fernet import Fernet, InvalidToken
+from cryptography.fernet import InvalidToken
 import base64
 
-_cipher = None
-
-def get_cipher():
-    global _cipher
-    if _cipher is None:
-        key = getattr(settings, 'FERNET_KEY', None)
-        if not key:
-            raise ValueError("DJANGO_FERNET_KEY is not set in settings.py.")
-        if isinstance(key, str): # Ensure it's bytes for Fernet
-            key = key.encode('utf-8')
-        try:
-            _cipher = Fernet(key)
-        except Exception as e:
-            raise ValueError(f"Invalid Fernet key: {e}")
-    return _cipher
+from core import perf
+from core.ciphers import ENGINE_TAGS, EnvelopeEngine, FernetEngine, get_cipher, get_engine, get_engine_for_tag
+from core.keys import prefetch_data_keys
+
+# Storage format of EncryptedTextField values. Values are stored as raw bytes behind a
+# one-byte header naming the cipher engine that wrote them (see core.ciphers). Legacy
+# rows hold the Fernet token base64-encoded a second time, as text (or as those same
+# ASCII bytes once the column became binary); they never start with a header byte
+# since base64 is printable.
+
+# Header of legacy values converted by to_current_format(): they are Fernet tokens
+FORMAT_FERNET = FernetEngine.tag
+
+# Below this many pending values the thread pool costs more than it saves.
+PARALLEL_DECRYPT_MIN_BATCH = 8
+
+_decrypt_executor = None
+_decrypt_executor_lock = threading.Lock()
+
+
+def is_legacy_format(stored):
+    """True if `stored` is in the legacy double-base64 text format."""
+    return isinstance(stored, str) or not stored or stored[0] not in ENGINE_TAGS
+
+
+def to_current_format(stored):
+    """
+    Convert a stored value to the current binary format. Legacy values only need their
+    outer base64 layer removed, so this works without the encryption key.
+    """
+    if not is_legacy_format(stored):
+        return stored
+    if isinstance(stored, str):
+        stored = stored.encode('ascii')
+    try:
+        fernet_token = base64.urlsafe_b64decode(stored)
+        return bytes([FORMAT_FERNET]) + base64.urlsafe_b64decode(fernet_token)
+    except ValueError:
+        return stored # Not a valid legacy value either, keep it untouched
+
+
+def encrypt_value(plaintext, scope=None):
+    """
+    Encrypt `plaintext` into the current storage format, with the ENCRYPTED_FIELD_ENGINE
+    engine and, for the envelope engine, the data key of `scope`.
+    """
+    engine = get_engine()
+    perf.count('encrypt')
+    return bytes([engine.tag]) + engine.encrypt(str(plaintext).encode('utf-8'), scope=scope)
+
+
+def decrypt_value(stored):
+    """Decrypt a value as stored in the database, or return the DECRYPTION_ERROR placeholder."""
+    perf.count('decrypt')
+    try:
+        if is_legacy_format(stored):
+            if isinstance(stored, str):
+                stored = stored.encode('ascii')
+            decrypted_bytes = get_cipher().decrypt(base64.urlsafe_b64decode(stored))
+        else:
+            decrypted_bytes = get_engine_for_tag(stored[0]).decrypt(stored[1:])
+        return decrypted_bytes.decode('utf-8')
+    except (InvalidToken, TypeError, ValueError, Exception):
+        # Log the error or handle more gracefully in production
+        # For now, returning a placeholder indicates a decryption issue.
+        return "DECRYPTION_ERROR" # Placeholder for unrecoverable decryption
+
+
+class EncryptedValue:
+    """
+    Ciphertext loaded from the database, decrypted the first time it is needed.
+
+    Model instances keep this wrapper in their __dict__ and EncryptedAttribute unwraps
+    it on attribute access, so rows whose notes are never read never pay for decryption.
+    The plaintext is cached on the wrapper; while the attribute is not reassigned the
+    original ciphertext is written back on save() instead of encrypting again.
+    """
+    __slots__ = ('ciphertext', '_plaintext')
+
+    def __init__(self, ciphertext):
+        self.ciphertext = ciphertext
+        self._plaintext = None
+
+    @property
+    def is_decrypted(self):
+        return self._plaintext is not None
+
+    def decrypt(self):
+        if self._plaintext is None:
+            self._plaintext = decrypt_value(self.ciphertext)
+        return self._plaintext
+
+    def __str__(self):
+        return self.decrypt()
+
+    def __eq__(self, other):
+        if isinstance(other, EncryptedValue):
+            return self.ciphertext == other.ciphertext or self.decrypt() == other.decrypt()
+        return self.decrypt() == other
+
+    def __hash__(self):
+        return hash(self.ciphertext)
+
+    def __repr__(self):
+        return '<EncryptedValue>' # Never leak the plaintext in logs or tracebacks
+
+    def __getstate__(self):
+        # Pickled instances (e.g. in a cache) carry only the ciphertext.
+        return {'ciphertext': self.ciphertext}
+
+    def __setstate__(self, state):
+        self.ciphertext = state['ciphertext']
+        self._plaintext = None
+
+
+class EncryptedAttribute(DeferredAttribute):
+    """
+    Field descriptor that decrypts an EncryptedValue on first access.
+
+    It is a data descriptor (it defines __set__) so that reads always go through
+    __get__, even once the value is in the instance __dict__.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, EncryptedValue):
+            return value.decrypt()
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
 
 class EncryptedTextField(models.TextField):
-    description = "A TextField that stores data encrypted using Fernet."
+    """
+    Text encrypted with the ENCRYPTED_FIELD_ENGINE cipher engine, stored in a binary
+    column (bytea/BLOB) behind the engine's header byte (see the storage format notes at
+    the top of this module). Legacy text values are still read; the
+    `migrate_encrypted_fields` command converts them in place.
+
+    `key_scope` names the attribute whose value selects the envelope data key, e.g.
+    'profissional_responsavel_id' for one key per professional. Without it (and for
+    QuerySet.update(), which has no instance) all values of the model share one key.
+    """
+    description = "A TextField that stores data encrypted using AES-GCM or Fernet."
+    descriptor_class = EncryptedAttribute
+    non_db_attrs = models.TextField.non_db_attrs + ('key_scope',)
+
+    def __init__(self, *args, key_scope=None, **kwargs):
+        self.key_scope = key_scope
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.key_scope is not None:
+            kwargs['key_scope'] = self.key_scope
+        return name, path, args, kwargs
+
+    def get_key_scope(self, model_instance=None):
+        """Name of the data key used for this field's value on `model_instance`."""
+        scope = self.model._meta.label
+        if self.key_scope is not None and model_instance is not None:
+            scope = f"{scope}:{self.key_scope}={getattr(model_instance, self.key_scope)}"
+        return scope
+
+    def get_internal_type(self):
+        return "BinaryField"
+
+    def get_placeholder(self, value, compiler, connection):
+        return connection.ops.binary_placeholder_sql(value)
 
     def from_db_value(self, value, expression, connection):
         if value is None:
             return value
-        try:
-            decoded_value = base64.urlsafe_b64decode(value.encode('utf-8'))
-            decrypted_bytes = get_cipher().decrypt(decoded_value)
-            return decrypted_bytes.decode('utf-8')
-        except (InvalidToken, TypeError, ValueError, Exception):
-            # Log the error or handle more gracefully in production
-            # For now, returning a placeholder indicates a decryption issue.
-            return "DECRYPTION_ERROR" # Placeholder for unrecoverable decryption
+        if isinstance(value, memoryview): # bytea on PostgreSQL
+            value = value.tobytes()
+        # Decryption is deferred until the attribute is actually read.
+        return EncryptedValue(value)
+
+    def peek(self, model_instance):
+        """
+        Return the stored value of this field on `model_instance` without decrypting it:
+        None, an EncryptedValue, or the plain string assigned since it was loaded.
+        """
+        if self.attname not in model_instance.__dict__:
+            # Load a deferred field. Not with getattr() or refresh_from_db(), which go
+            # through EncryptedAttribute and decrypt it.
+            model_instance.__dict__[self.attname] = (
+                type(model_instance)._base_manager.using(model_instance._state.db)
+                .filter(pk=model_instance.pk).values_list(self.attname, flat=True).get()
+            )
+        return model_instance.__dict__[self.attname]
 
     def to_python(self, value):
         # This method is called to convert the value from the database (after from_db_value)
@@ -40,16 +208,104 @@ class EncryptedTextField(models.TextField):
         # If it's already a string (from from_db_value or serializer), keep it.
         if isinstance(value, str) or value is None:
             return value
+        if isinstance(value, EncryptedValue):
+            return value.decrypt()
         # If it's some other type (e.g. bytes from an earlier stage), convert to string.
         return str(value)
 
+    def pre_save(self, model_instance, add):
+        # Read the raw value so an untouched, never-decrypted note is saved as-is.
+        value = self.peek(model_instance)
+        if value is None or isinstance(value, EncryptedValue):
+            return value
+        if value == "DECRYPTION_ERROR":
+            raise ValueError("Attempted to save DECRYPTION_ERROR placeholder.")
+        # Encrypt here, where the instance (and so the key scope) is known, and keep the
+        # result so saving again does not encrypt again.
+        encrypted = EncryptedValue(encrypt_value(value, scope=self.get_key_scope(model_instance)))
+        encrypted._plaintext = str(value)
+        model_instance.__dict__[self.attname] = encrypted
+        return encrypted
+
     def get_prep_value(self, value):
         # This method is called to convert the Python object back into a database-storable format.
         if value is None:
             return None
+        if isinstance(value, EncryptedValue):
+            # Unchanged since it was loaded: no need to encrypt again, just upgrade the format.
+            return to_current_format(value.ciphertext)
         # Prevent saving the placeholder if it was somehow set directly
         if value == "DECRYPTION_ERROR":
             raise ValueError("Attempted to save DECRYPTION_ERROR placeholder.")
+        return encrypt_value(value, scope=self.get_key_scope())
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is not None:
+            return connection.Database.Binary(value)
+        return value
+
+
+def _get_decrypt_executor():
+    # Created lazily so each (possibly forked) worker process gets its own pool.
+    global _decrypt_executor
+    if _decrypt_executor is None:
+        with _decrypt_executor_lock:
+            if _decrypt_executor is None:
+                _decrypt_executor = ThreadPoolExecutor(
+                    max_workers=settings.ENCRYPTED_FIELD_DECRYPT_WORKERS,
+                    thread_name_prefix='encrypted-field-decrypt',
+                )
+    return _decrypt_executor
+
+
+def _decrypt_chunk(values):
+    for value in values:
+        value.decrypt()
+
+
+def batch_decrypt(instances, field_names=None):
+    """
+    Decrypt the EncryptedTextField values of `instances` (e.g. one page of a queryset)
+    up front, spread over a bounded thread pool of ENCRYPTED_FIELD_DECRYPT_WORKERS
+    threads. The AES/HMAC work in `cryptography` releases the GIL, so the page is
+    decrypted in parallel instead of row by row during serialization.
+
+    Only values still encrypted are touched; pass `field_names` to limit the fields.
+    Returns `instances` as a list.
+    """
+    instances = list(instances)
+    pending = []
+    for instance in instances:
+        for field in instance._meta.concrete_fields:
+            if not isinstance(field, EncryptedTextField):
+                continue
+            if field_names is not None and field.name not in field_names:
+                continue
+            value = instance.__dict__.get(field.attname)
+            if isinstance(value, EncryptedValue) and not value.is_decrypted:
+                pending.append(value)
+
+    # Unwrap each envelope data key of the page once, with one query for the keys not
+    # cached yet, so the workers never hit the database.
+    envelope = get_engine(EnvelopeEngine.name)
+    key_ids = [
+        (value, envelope.key_id(value.ciphertext[1:])) for value in pending
+        if not is_legacy_format(value.ciphertext) and value.ciphertext[0] == EnvelopeEngine.tag
+    ]
+    if key_ids:
+        found = prefetch_data_keys({key_id for _, key_id in key_ids})
+        unknown = [value for value, key_id in key_ids if key_id not in found]
+        _decrypt_chunk(unknown) # Fails, but in this thread
+        pending = [value for value in pending if not value.is_decrypted]
 
-        encrypted_bytes = get_cipher().encrypt(str(value).encode('utf-8'))
-        return base64.urlsafe_b64encode(encrypted_bytes).decode('utf-8')
+    workers = settings.ENCRYPTED_FIELD_DECRYPT_WORKERS
+    if workers <= 1 or len(pending) < PARALLEL_DECRYPT_MIN_BATCH:
+        _decrypt_chunk(pending)
+    else:
+        # One task per worker keeps the executor overhead independent of the page size.
+        chunks = [pending[i::workers] for i in range(workers)]
+        list(_get_decrypt_executor().map(_decrypt_chunk, chunks))
+        # The workers do not see this request's core.perf counters
+        perf.count('decrypt', len(pending))
+    return instances
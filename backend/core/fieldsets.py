@@ -0,0 +1,188 @@
+"""
+Sparse fieldsets: `?fields=a,b` or `?omit=a,b` on list and retrieve endpoints.
+
+The client picks which fields of the serializer are rendered, and the queryset is
+narrowed to match: `.only()` on the columns those fields read and select_related() on
+the relations they traverse, so an omitted nested address or username costs neither a
+JOIN nor serialization time. Without either parameter the `list` action renders the
+serializer's `Meta.list_fields`, a compact representation for index pages; retrieve
+renders everything.
+
+The columns come from each field's `source`. Fields computed from the whole object
+(SerializerMethodField, custom fields) declare theirs in `Meta.field_sources`, and
+`Meta.required_sources` lists the columns the serializer itself needs whatever is
+rendered. A selected field whose columns are unknown turns the narrowing off for the
+request, so the result is only ever slower, never wrong.
+"""
+import functools
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import ListSerializer, Serializer
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+# Actions whose responses can be narrowed; writes always render the whole object
+ACOES = ('list', 'retrieve')
+
+
+def _parametro(request, nome):
+    return [c.strip() for c in request.query_params.get(nome, '').split(',') if c.strip()]
+
+
+@functools.lru_cache(maxsize=None)
+def campos_legiveis(serializer_class):
+    """Names of the fields `serializer_class` renders, in order."""
+    return tuple(nome for nome, campo in serializer_class().fields.items() if not campo.write_only)
+
+
+def _resolver(model, caminho):
+    """
+    Relations traversed by the ORM path `caminho` (as paths), or None when it is not a
+    chain of forward foreign keys ending in a concrete field (annotations, reverse relations).
+    """
+    partes = caminho.split('__')
+    relacoes = []
+    for i, parte in enumerate(partes):
+        try:
+            field = model._meta.get_field(parte)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.many_to_many:
+            return None
+        if i < len(partes) - 1:
+            if not field.is_relation:
+                return None
+            relacoes.append('__'.join(partes[:i + 1]))
+            model = field.related_model
+    return relacoes
+
+
+def _caminhos(serializer, nomes, prefixo=''):
+    """ORM paths read by the fields `nomes` of `serializer`, or None if some are unknown."""
+    meta = getattr(serializer, 'Meta', None)
+    declarados = getattr(meta, 'field_sources', {})
+    caminhos = [prefixo + c for c in getattr(meta, 'required_sources', ())]
+    for nome in nomes:
+        campo = serializer.fields[nome]
+        if nome in declarados:
+            caminhos.extend(prefixo + c for c in declarados[nome])
+            continue
+        if not campo.source_attrs: # source='*'
+            return None
+        caminho = prefixo + '__'.join(campo.source_attrs)
+        if isinstance(campo, Serializer):
+            aninhados = _caminhos(campo, [n for n, c in campo.fields.items() if not c.write_only], caminho + '__')
+            if aninhados is None:
+                return None
+            caminhos.append(caminho)
+            caminhos.extend(aninhados)
+        elif isinstance(campo, ListSerializer):
+            return None
+        else:
+            caminhos.append(caminho)
+    return caminhos
+
+
+@functools.lru_cache(maxsize=None)
+def colunas(serializer_class, nomes):
+    """
+    (select_related paths, only() paths) for rendering the fields `nomes` (a frozenset)
+    of `serializer_class`, or None when they cannot be told apart from the whole row.
+    """
+    serializer = serializer_class()
+    model = serializer.Meta.model
+    caminhos = _caminhos(serializer, [n for n in serializer.fields if n in nomes])
+    if caminhos is None:
+        return None
+    relacoes, only = set(), set()
+    for caminho in caminhos:
+        atravessadas = _resolver(model, caminho)
+        if atravessadas is None:
+            return None
+        relacoes.update(atravessadas)
+        only.update(atravessadas)
+        only.add(caminho)
+    return frozenset(relacoes), frozenset(only)
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    ModelSerializer mixin rendering only the fields named in the `sparse_fields` context
+    entry, which SparseFieldsetMixin sets for list and retrieve. Nested serializers are
+    rendered whole.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        nomes = self.context.get('sparse_fields')
+        raiz = self.parent is None or (isinstance(self.parent, ListSerializer) and self.parent.parent is None)
+        if nomes is None or not raiz:
+            return fields
+        return {nome: campo for nome, campo in fields.items() if nome in nomes}
+
+
+class SparseFieldsetMixin:
+    """
+    ViewSet mixin reading ?fields=/?omit= (see the module docstring). The serializer class
+    must use SparseFieldsetSerializerMixin.
+    """
+
+    def get_sparse_fields(self):
+        """The field names to render, or None for all of them."""
+        if self.action not in ACOES:
+            return None
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self._ler_sparse_fields()
+        return self._sparse_fields
+
+    def _ler_sparse_fields(self):
+        disponiveis = campos_legiveis(self.get_serializer_class())
+        pedidos, omitidos = _parametro(self.request, FIELDS_PARAM), _parametro(self.request, OMIT_PARAM)
+        for parametro, nomes in ((FIELDS_PARAM, pedidos), (OMIT_PARAM, omitidos)):
+            invalidos = [c for c in nomes if c not in disponiveis]
+            if invalidos:
+                raise ValidationError({parametro: [
+                    f"Campos desconhecidos: {', '.join(invalidos)}. Disponíveis: {', '.join(disponiveis)}."
+                ]})
+        if pedidos:
+            return frozenset(pedidos) - frozenset(omitidos)
+        if omitidos:
+            return frozenset(disponiveis) - frozenset(omitidos)
+        compactos = getattr(self.get_serializer_class().Meta, 'list_fields', None)
+        if self.action == 'list' and compactos:
+            return frozenset(compactos)
+        return None
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['sparse_fields'] = self.get_sparse_fields()
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        nomes = self.get_sparse_fields()
+        selecao = colunas(self.get_serializer_class(), nomes) if nomes is not None else None
+        if selecao is None:
+            return queryset
+        relacoes, only = selecao
+        # Whatever the list is ordered by (page cursor) and the ETag is computed from
+        extras = [campo.lstrip('-') for campo in self._sparse_ordering(queryset)]
+        extras.extend(getattr(self, 'conditional_timestamps', ()))
+        relacoes, only = set(relacoes), set(only) | {queryset.model._meta.pk.name}
+        for caminho in extras:
+            atravessadas = _resolver(queryset.model, caminho)
+            if atravessadas is not None:
+                relacoes.update(atravessadas)
+                only.update(atravessadas)
+                only.add(caminho)
+        queryset = queryset.select_related(None)
+        if relacoes: # select_related() without arguments would follow every foreign key
+            queryset = queryset.select_related(*sorted(relacoes))
+        return queryset.only(*sorted(only))
+
+    def _sparse_ordering(self, queryset):
+        if self.action != 'list' or not hasattr(self.paginator, 'get_ordering'):
+            return ()
+        return self.paginator.get_ordering(self.request, queryset, self)
@@ -0,0 +1,90 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+The first request with a given key (per user) runs inside a transaction that also
+reserves the key; its successful response is stored and replayed to any retry with the
+same key, so a client can safely resend a request whose response it did not get. A key
+reused for a different request is rejected. Concurrent retries wait on the key's unique
+index and then replay the stored response. Keys older than IDEMPOTENCY_KEY_TTL_HOURS are
+deleted by `manage.py purge_idempotency_keys` (see purge_expired_keys).
+"""
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from core.exceptions import Conflict, IdempotencyKeyReused
+from core.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+def _fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'): # QueryDict from a form or multipart body
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode('utf-8')).hexdigest()
+
+
+def _cutoff():
+    return timezone.now() - datetime.timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+
+
+def purge_expired_keys(batch_size=1000):
+    """Delete the keys older than IDEMPOTENCY_KEY_TTL_HOURS, a batch per transaction; return how many."""
+    cutoff, deleted = _cutoff(), 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(criado_em__lt=cutoff).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
+
+
+def _reserve(user, key, fingerprint):
+    """Return (record, created): a new reservation of `key`, or the record already stored for it."""
+    IdempotencyKey.objects.filter(user=user, key=key, criado_em__lt=_cutoff()).delete()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key, fingerprint=fingerprint), True
+    except IntegrityError:
+        return IdempotencyKey.objects.get(user=user, key=key), False
+
+
+def run_idempotent(request, handler):
+    """Run `handler()` (returning a Response) at most once per Idempotency-Key of the user."""
+    key = request.headers.get(HEADER)
+    if not key or not request.user.is_authenticated:
+        return handler()
+    if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+        raise ValidationError({HEADER: "A Idempotency-Key pode ter no máximo 255 caracteres."})
+
+    fingerprint = _fingerprint(request)
+    with transaction.atomic():
+        record, created = _reserve(request.user, key, fingerprint)
+        if not created:
+            if record.fingerprint != fingerprint:
+                raise IdempotencyKeyReused()
+            if record.status_code is None:
+                raise Conflict("Uma requisição com esta Idempotency-Key ainda está em andamento.")
+            return Response(record.response_body, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+        response = handler()
+        if 200 <= response.status_code < 300:
+            record.status_code, record.response_body = response.status_code, response.data
+            record.save(update_fields=['status_code', 'response_body'])
+        else:
+            record.delete() # Only successes are remembered; a failed request may be retried
+        return response
+
+
+class IdempotentCreateMixin:
+    """ViewSet mixin honouring the Idempotency-Key header on create (POST)."""
+
+    def create(self, request, *args, **kwargs):
+        return run_idempotent(request, lambda: super(IdempotentCreateMixin, self).create(request, *args, **kwargs))
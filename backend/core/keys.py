@@ -0,0 +1,194 @@
+"""
+Key management for envelope encryption (core.ciphers.EnvelopeEngine).
+
+Every value is encrypted with a data key shared by one scope (for example all the notes
+of one professional). Data keys are stored in core.models.DataKey, wrapped with AES-GCM
+by a master key from settings, and kept unwrapped in a small in-process LRU cache with
+a TTL. Rotating the master key re-wraps the DataKey rows; the notes stay untouched.
+"""
+import base64
+import os
+import threading
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.cache import TTLCache
+
+# Master key derived from FERNET_KEY, available when no other master key is configured
+# and kept as a fallback afterwards so keys it wrapped can still be rotated away from it.
+DEFAULT_MASTER_KEY_ID = 'default'
+NONCE_SIZE = 12
+
+_master_keys = None
+_cache = None
+_cache_lock = threading.Lock()
+_uncommitted_scopes = set()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TTLCache(
+                    settings.ENCRYPTION_DATA_KEY_CACHE_SIZE, settings.ENCRYPTION_DATA_KEY_CACHE_TTL,
+                )
+    return _cache
+
+
+def _derive_default_master_key():
+    fernet_key = getattr(settings, 'FERNET_KEY', None)
+    if not fernet_key:
+        raise ValueError("DJANGO_FERNET_KEY is not set in settings.py.")
+    if isinstance(fernet_key, str):
+        fernet_key = fernet_key.encode('utf-8')
+    return HKDF(
+        algorithm=hashes.SHA256(), length=32, salt=None, info=b'EncryptedTextField master key',
+    ).derive(base64.urlsafe_b64decode(fernet_key))
+
+
+def get_master_keys():
+    """
+    Return (active_id, {id: AESGCM}) from ENCRYPTION_MASTER_KEYS, a list of "id:key"
+    entries (key: 32 url-safe base64 bytes) whose first entry wraps new data keys.
+    """
+    global _master_keys
+    if _master_keys is None:
+        keys = {}
+        for entry in settings.ENCRYPTION_MASTER_KEYS:
+            key_id, sep, key = entry.strip().partition(':')
+            try:
+                key = base64.urlsafe_b64decode(key)
+            except ValueError:
+                key = b''
+            if not sep or not key_id or len(key) != 32:
+                raise ValueError(f"Invalid master key entry {key_id!r}: expected id:<32 url-safe base64 bytes>.")
+            keys[key_id] = AESGCM(key)
+        active_id = next(iter(keys), DEFAULT_MASTER_KEY_ID)
+        keys.setdefault(DEFAULT_MASTER_KEY_ID, AESGCM(_derive_default_master_key()))
+        _master_keys = (active_id, keys)
+    return _master_keys
+
+
+def wrap_key(data_key, scope):
+    """Encrypt `data_key` with the active master key. Returns (master_key_id, wrapped_key)."""
+    active_id, keys = get_master_keys()
+    nonce = os.urandom(NONCE_SIZE)
+    # The scope is authenticated, so a wrapped key cannot be moved to another scope.
+    return active_id, nonce + keys[active_id].encrypt(nonce, data_key, scope.encode('utf-8'))
+
+
+def unwrap_key(data_key_row):
+    """Return the plain data key stored in a DataKey row."""
+    _, keys = get_master_keys()
+    master = keys.get(data_key_row.master_key_id)
+    if master is None:
+        raise ValueError(f"Master key {data_key_row.master_key_id!r} is not configured.")
+    wrapped = bytes(data_key_row.wrapped_key)
+    return master.decrypt(wrapped[:NONCE_SIZE], wrapped[NONCE_SIZE:], data_key_row.scope.encode('utf-8'))
+
+
+def get_data_key(key_id):
+    """Return the AESGCM cipher of the data key `key_id` (a UUID), unwrapping it on a cache miss."""
+    aead = get_cache().get(key_id) or prefetch_data_keys([key_id]).get(key_id)
+    if aead is None:
+        raise KeyError(f"Unknown data key {key_id}.")
+    return aead
+
+
+def prefetch_data_keys(key_ids):
+    """
+    Make sure the data keys `key_ids` are in the cache, loading and unwrapping the
+    missing ones with a single query. Returns {key_id: AESGCM} for the keys found.
+    """
+    from core.models import DataKey
+
+    cache = get_cache()
+    found, missing = {}, set()
+    for key_id in key_ids:
+        aead = cache.get(key_id)
+        if aead is None:
+            missing.add(key_id)
+        else:
+            found[key_id] = aead
+    if missing:
+        for row in DataKey.objects.filter(key_id__in=missing):
+            aead = found[row.key_id] = AESGCM(unwrap_key(row))
+            cache.set(row.key_id, aead)
+    return found
+
+
+def get_scope_key(scope):
+    """Return (key_id, AESGCM) of the data key for `scope`, creating the key if needed."""
+    from core.models import DataKey
+
+    cache = get_cache()
+    cached = cache.get(('scope', scope))
+    if cached is not None:
+        return cached
+    row = DataKey.objects.filter(scope=scope).first()
+    created = False
+    if row is None:
+        data_key = AESGCM.generate_key(bit_length=256)
+        master_key_id, wrapped_key = wrap_key(data_key, scope)
+        row, created = DataKey.objects.get_or_create(
+            scope=scope, defaults={'master_key_id': master_key_id, 'wrapped_key': wrapped_key},
+        )
+    result = (row.key_id, cache.get(row.key_id) or AESGCM(unwrap_key(row)))
+    cache.set(row.key_id, result[1]) # Key ids are random, never reused
+    if created or scope in _uncommitted_scopes:
+        # A key created in a transaction that may still roll back must not be
+        # remembered for the scope until that transaction commits.
+        _uncommitted_scopes.add(scope)
+        transaction.on_commit(lambda: _remember_scope_key(scope, result))
+    else:
+        cache.set(('scope', scope), result)
+    return result
+
+
+def _remember_scope_key(scope, result):
+    _uncommitted_scopes.discard(scope)
+    get_cache().set(('scope', scope), result)
+
+
+def rotate_master_key(batch_size=500):
+    """
+    Re-wrap every DataKey not wrapped by the active master key with it. Returns the
+    number of keys re-wrapped. Encrypted values are not touched.
+    """
+    from core.models import DataKey
+
+    active_id, _ = get_master_keys()
+    rotated, last_pk = 0, 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                DataKey.objects.select_for_update().filter(pk__gt=last_pk).exclude(master_key_id=active_id)
+                .order_by('pk')[:batch_size]
+            )
+            if not batch:
+                return rotated
+            now = timezone.now()
+            for row in batch:
+                row.master_key_id, row.wrapped_key = wrap_key(unwrap_key(row), row.scope)
+                row.atualizado_em = now
+            DataKey.objects.bulk_update(batch, ['master_key_id', 'wrapped_key', 'atualizado_em'])
+        rotated += len(batch)
+        last_pk = batch[-1].pk
+
+
+@receiver(setting_changed)
+def _reset_keys(setting, **kwargs):
+    global _master_keys, _cache
+    if setting in ('FERNET_KEY', 'ENCRYPTION_MASTER_KEYS'):
+        _master_keys = None
+    if setting in ('FERNET_KEY', 'ENCRYPTION_MASTER_KEYS', 'ENCRYPTION_DATA_KEY_CACHE_SIZE',
+                   'ENCRYPTION_DATA_KEY_CACHE_TTL'):
+        _cache = None
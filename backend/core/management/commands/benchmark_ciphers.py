@@ -0,0 +1,71 @@
+import json
+import os
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.ciphers import ENGINES, get_engine
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the encrypt and decrypt throughput of the EncryptedTextField cipher engines "
+        "(core.ciphers) for typical note sizes. Apart from the envelope engine's data key, "
+        "created inside a transaction that is rolled back, nothing touches the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='*', default=[1024, 5 * 1024, 10 * 1024, 50 * 1024],
+                            help='Plaintext sizes in bytes.')
+        parser.add_argument('--repeat', type=int, default=500, help='Operations timed per engine and size.')
+        parser.add_argument('--engines', nargs='*', default=list(ENGINES), choices=list(ENGINES))
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            results = self._run(options['sizes'], options['engines'], options['repeat'])
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'repeat': options['repeat'], 'results': results}, indent=2))
+            return
+        self.stdout.write(f"Median of {options['repeat']} operations (us per note, MB/s)")
+        self.stdout.write(
+            f"{'engine':<10}{'size':>8}{'stored':>8}{'enc us':>10}{'enc MB/s':>10}{'dec us':>10}{'dec MB/s':>10}"
+        )
+        for row in results:
+            self.stdout.write(
+                f"{row['engine']:<10}{row['size']:>8}{row['stored_bytes']:>8}"
+                f"{row['encrypt_us']:>10.1f}{row['encrypt_mb_s']:>10.1f}"
+                f"{row['decrypt_us']:>10.1f}{row['decrypt_mb_s']:>10.1f}"
+            )
+
+    def _run(self, sizes, engines, repeat):
+        results = []
+        for size in sizes:
+            plaintext = os.urandom(size // 2).hex().encode() # Incompressible printable text
+            for name in engines:
+                engine = get_engine(name)
+                payload = engine.encrypt(plaintext) # Also loads the envelope data key once
+                encrypt_us = statistics.median(self._time(engine.encrypt, plaintext, repeat))
+                decrypt_us = statistics.median(self._time(engine.decrypt, payload, repeat))
+                results.append({
+                    'engine': name,
+                    'size': size,
+                    'stored_bytes': len(payload) + 1, # Plus the header byte
+                    'encrypt_us': encrypt_us,
+                    'decrypt_us': decrypt_us,
+                    'encrypt_mb_s': size / encrypt_us,
+                    'decrypt_mb_s': size / decrypt_us,
+                })
+        return results
+
+    def _time(self, func, data, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(data)
+            timings.append((time.perf_counter() - start) * 1_000_000)
+        return timings
@@ -0,0 +1,93 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from core.ciphers import get_engine
+from core.fields import EncryptedTextField, EncryptedValue, encrypt_value, is_legacy_format, to_current_format
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite EncryptedTextField values still stored in the legacy double-base64 text "
+        "format into the compact binary format. Works in primary key order, one transaction "
+        "per batch with its rows locked, and only touches legacy values, so it can be stopped "
+        "and run again at any time (use --start-after to skip what is already done). No "
+        "decryption is needed, unless --reencrypt also moves values written by another "
+        "engine to ENCRYPTED_FIELD_ENGINE (e.g. to the envelope engine, before retiring the "
+        "Fernet key)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--start-after', type=int, default=0, help='Resume after this primary key.')
+        parser.add_argument('--model', help='Only this model, as app_label.ModelName.')
+        parser.add_argument('--reencrypt', action='store_true',
+                            help='Also re-encrypt values not written by the ENCRYPTED_FIELD_ENGINE engine.')
+        parser.add_argument('--dry-run', action='store_true', help='Count the values to convert without writing.')
+
+    def handle(self, *args, **options):
+        for model, fields in self._encrypted_models(options['model']):
+            self._migrate_model(model, fields, options)
+
+    def _encrypted_models(self, label):
+        models = [apps.get_model(label)] if label else apps.get_models()
+        for model in models:
+            fields = [f for f in model._meta.concrete_fields if isinstance(f, EncryptedTextField)]
+            if fields:
+                yield model, fields
+
+    def _convert(self, field, instance, value, options):
+        """Return the new stored value for `value`, or None if it is already up to date."""
+        if not isinstance(value, EncryptedValue):
+            return None
+        stored = value.ciphertext
+        if options['reencrypt'] and (is_legacy_format(stored) or stored[0] != get_engine().tag):
+            if options['dry_run']:
+                return value # Counted only; encrypting could create data keys
+            plaintext = value.decrypt()
+            if plaintext == "DECRYPTION_ERROR":
+                self.stderr.write(f"{instance._meta.label} {instance.pk}: {field.name} cannot be decrypted, skipped.")
+                return None
+            return EncryptedValue(encrypt_value(plaintext, scope=field.get_key_scope(instance)))
+        if is_legacy_format(stored):
+            return EncryptedValue(to_current_format(stored))
+        return None
+
+    def _migrate_model(self, model, fields, options):
+        label = model._meta.label
+        last_pk, converted, scanned = options['start_after'], 0, 0
+        while True:
+            with transaction.atomic():
+                # Locked until the UPDATE, so a note saved meanwhile is not overwritten
+                # with the conversion of its previous text.
+                rows = list(
+                    model._base_manager.select_for_update().filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']]
+                )
+                if not rows:
+                    break
+                whens = {field.attname: [] for field in fields}
+                for instance in rows:
+                    for field in fields:
+                        value = field.peek(instance)
+                        new_value = self._convert(field, instance, value, options)
+                        if new_value is not None:
+                            # Also guarded on the value read, for databases without row locks (SQLite)
+                            whens[field.attname].append(When(
+                                pk=instance.pk, **{field.attname: Value(value.ciphertext)},
+                                then=Value(new_value, output_field=field),
+                            ))
+                updates = {
+                    field.attname: Case(*whens[field.attname], default=F(field.attname), output_field=field)
+                    for field in fields if whens[field.attname]
+                }
+                converted += sum(len(cases) for cases in whens.values())
+                if updates and not options['dry_run']:
+                    # One UPDATE per batch; QuerySet.update does not touch auto_now fields such as atualizado_em.
+                    model._base_manager.filter(pk__in=[row.pk for row in rows]).update(**updates)
+            scanned += len(rows)
+            last_pk = rows[-1].pk
+            self.stdout.write(f"{label}: {scanned} rows scanned, {converted} values converted (last pk {last_pk})")
+
+        verb = 'would be converted' if options['dry_run'] else 'converted'
+        self.stdout.write(self.style.SUCCESS(f"{label}: done, {converted} values {verb}."))
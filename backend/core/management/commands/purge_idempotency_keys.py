@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the stored Idempotency-Key responses (core.models.IdempotencyKey) older than "
+        "IDEMPOTENCY_KEY_TTL_HOURS. Expired keys are never replayed, but without this they "
+        "stay in the table; run it periodically (e.g. daily from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{deleted} idempotency keys older than {settings.IDEMPOTENCY_KEY_TTL_HOURS} hours deleted."
+        ))
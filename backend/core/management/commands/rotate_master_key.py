@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core.keys import get_master_keys, rotate_master_key
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-wrap the envelope encryption data keys (core.models.DataKey) with the active "
+        "master key, the first entry of DJANGO_MASTER_KEYS. Only the key table is rewritten; "
+        "encrypted values are not touched. Keep the previous master key configured until "
+        "this has run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        active_id, _ = get_master_keys()
+        rotated = rotate_master_key(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{rotated} data keys re-wrapped with master key {active_id!r}."))
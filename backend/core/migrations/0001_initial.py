@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:52
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('scope', models.CharField(max_length=255, unique=True)),
+                ('wrapped_key', models.BinaryField()),
+                ('master_key_id', models.CharField(db_index=True, max_length=64)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
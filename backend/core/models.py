@@ -0,0 +1,43 @@
+import uuid
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+class DataKey(models.Model):
+    """
+    Data key of the envelope encryption engine (see core.keys). The key itself is only
+    stored wrapped (encrypted) by the master key named in master_key_id, so rotating the
+    master key means re-wrapping these rows, not re-encrypting the data they protect.
+    """
+    key_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    scope = models.CharField(max_length=255, unique=True)
+    wrapped_key = models.BinaryField()
+    master_key_id = models.CharField(max_length=64, db_index=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.scope} ({self.key_id})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a request sent with an Idempotency-Key header (see core.idempotency),
+    replayed when a client retries it instead of running it again.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64) # SHA-256 of method, path and body
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    criado_em = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_user_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.key}"
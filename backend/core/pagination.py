@@ -0,0 +1,144 @@
+import json
+import operator
+from functools import reduce
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination keyed on the *whole* ordering tuple.
+
+    DRF's CursorPagination only stores the first ordering field in the cursor and
+    falls back to OFFSET for ties, which does not work for orderings like
+    ('nome', 'id') or for related lookups such as '-agendamento__data'.
+    Here the cursor carries one value per ordering field and the next page is
+    fetched with a lexicographic "(a, b, c) > (x, y, z)" filter, so every page
+    costs the same index range scan no matter how deep it is.
+
+    Views choose their ordering through the usual `ordering` attribute (or the
+    OrderingFilter, when present); a primary key tie-breaker is appended if the
+    ordering does not already end in one.
+    """
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+    ordering = ('id',)
+
+    def get_ordering(self, request, queryset, view):
+        # The first filter backend that has an opinion wins (e.g. a ranked search
+        # before the OrderingFilter), otherwise the view's own ordering is used.
+        ordering = None
+        for filter_cls in getattr(view, 'filter_backends', []):
+            if hasattr(filter_cls, 'get_ordering'):
+                ordering = filter_cls().get_ordering(request, queryset, view)
+                if ordering:
+                    break
+        if not ordering:
+            ordering = getattr(view, 'ordering', None) or self.ordering
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        ordering = tuple(ordering)
+
+        # Keyset pagination needs a unique ordering, the primary key makes it so.
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            try:
+                queryset = queryset.filter(self._keyset_filter(current_position, reverse))
+            except (ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # Always fetch one extra row to know whether there is a following page.
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _keyset_filter(self, position, reverse):
+        """
+        Build the Q object equivalent to a row-value comparison against `position`,
+        honouring the direction of each ordering field.
+        """
+        try:
+            values = json.loads(position)
+        except ValueError:
+            values = None
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        clauses = []
+        for index, order in enumerate(self.ordering):
+            field = order.lstrip('-')
+            descending = order.startswith('-')
+            lookup = 'lt' if descending != reverse else 'gt'
+            equal_prefix = {
+                self.ordering[i].lstrip('-'): values[i] for i in range(index)
+            }
+            clauses.append(Q(**equal_prefix, **{f'{field}__{lookup}': values[index]}))
+        return reduce(operator.or_, clauses)
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            field_name = order.lstrip('-')
+            if isinstance(instance, dict):
+                attr = instance[field_name]
+            else:
+                attr = instance
+                for part in field_name.split('__'):
+                    attr = getattr(attr, part)
+            values.append(str(attr))
+        return json.dumps(values, separators=(',', ':'))
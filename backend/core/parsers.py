@@ -0,0 +1,27 @@
+"""
+JSON parser backed by orjson, when it is installed (see core.renderers).
+
+Reads the request body in one go and decodes it in C. Bodies in another charset than
+UTF-8, non-strict settings (NaN and Infinity accepted) and installs without orjson are
+parsed by rest_framework's JSONParser. Errors are the same ParseError.
+"""
+import codecs
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser, get_encoding
+
+from .renderers import ORJSONRenderer, orjson
+
+
+class ORJSONParser(JSONParser):
+    """Drop-in replacement for rest_framework.parsers.JSONParser; see the module docstring."""
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = get_encoding(parser_context or {})
+        if orjson is None or not self.strict or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
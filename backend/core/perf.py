@@ -0,0 +1,212 @@
+"""
+Per-request performance instrumentation, on when PERF_ENABLED is set.
+
+PerfMiddleware times every request and keeps the last PERF_WINDOW durations of each
+route (method and URL name) for the p50/p95/p99 served at /api/metricas/. A sample of
+the requests, PERF_SAMPLE_RATE or the route's own rate in PERF_SAMPLE_RATES, is also
+broken down: SQL queries and their time (through a connection execute_wrapper),
+EncryptedTextField encrypt and decrypt calls, and the time spent in DRF serializers
+(validation and .data, SQL run lazily while serializing included). Sampled requests get
+a Server-Timing header and a JSON line on the 'core.perf' logger.
+
+With PERF_ENABLED off the middleware drops out of the stack (MiddlewareNotUsed) and
+the counting hooks cost one ContextVar lookup.
+"""
+from collections import deque
+from contextlib import ExitStack
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('core.perf')
+
+_current = contextvars.ContextVar('perf_request_stats', default=None)
+
+
+class RequestStats:
+    """What one sampled request spent, filled in while it runs."""
+    __slots__ = ('queries', 'sql_ms', 'encrypt', 'decrypt', 'serializer_ms', 'serializer_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.encrypt = 0
+        self.decrypt = 0
+        self.serializer_ms = 0.0
+        self.serializer_depth = 0
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'sql_ms': round(self.sql_ms, 3),
+            'encrypt': self.encrypt,
+            'decrypt': self.decrypt,
+            'serializer_ms': round(self.serializer_ms, 3),
+        }
+
+
+def count(name, n=1):
+    """Add `n` to counter `name` ('encrypt' or 'decrypt') of the sampled request, if any."""
+    stats = _current.get()
+    if stats is not None:
+        setattr(stats, name, getattr(stats, name) + n)
+
+
+def _sql_timer(stats):
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats.queries += 1
+            stats.sql_ms += (time.perf_counter() - start) * 1000
+    return wrapper
+
+
+def _timed(func):
+    # Only the outermost serializer call is timed: nested ones are part of it
+    def wrapper(*args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return func(*args, **kwargs)
+        stats.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.serializer_depth -= 1
+            if not stats.serializer_depth:
+                stats.serializer_ms += (time.perf_counter() - start) * 1000
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def install_serializer_timing():
+    """Time BaseSerializer.is_valid() and .data. Done once, by the first PerfMiddleware."""
+    from rest_framework.serializers import BaseSerializer
+
+    if hasattr(BaseSerializer.is_valid, '__wrapped__'):
+        return
+    BaseSerializer.is_valid = _timed(BaseSerializer.is_valid)
+    BaseSerializer.data = property(_timed(BaseSerializer.data.fget))
+
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class Metrics:
+    """Per-route window of the last `window` request durations and sampled breakdowns."""
+
+    def __init__(self, window):
+        self.window = window
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, total_ms, stats=None):
+        with self._lock:
+            entry = self._routes.get(route)
+            if entry is None:
+                entry = self._routes[route] = {
+                    'requests': 0, 'durations': deque(maxlen=self.window), 'samples': deque(maxlen=self.window),
+                }
+            entry['requests'] += 1
+            entry['durations'].append(total_ms)
+            if stats is not None:
+                entry['samples'].append(stats.as_dict())
+
+    def summary(self):
+        with self._lock:
+            routes = {
+                route: (entry['requests'], sorted(entry['durations']), list(entry['samples']))
+                for route, entry in self._routes.items()
+            }
+        result = {}
+        for route, (requests, durations, samples) in sorted(routes.items()):
+            row = {
+                'requests': requests,
+                'p50_ms': round(_percentile(durations, 0.50), 3),
+                'p95_ms': round(_percentile(durations, 0.95), 3),
+                'p99_ms': round(_percentile(durations, 0.99), 3),
+                'sampled': len(samples),
+            }
+            for key in ('queries', 'sql_ms', 'encrypt', 'decrypt', 'serializer_ms'):
+                row[f'{key}_avg'] = round(sum(s[key] for s in samples) / len(samples), 3) if samples else None
+            result[route] = row
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+metrics = Metrics(window=1000)
+
+
+def enabled():
+    return settings.PERF_ENABLED
+
+
+def _sample_rates():
+    rates = {}
+    for item in settings.PERF_SAMPLE_RATES:
+        name, _, rate = item.partition('=')
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class PerfMiddleware:
+    """Times requests and breaks down a sample of them; see the module docstring."""
+
+    def __init__(self, get_response):
+        if not settings.PERF_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.default_rate = settings.PERF_SAMPLE_RATE
+        self.rates = _sample_rates()
+        metrics.window = settings.PERF_WINDOW
+        install_serializer_timing()
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with ExitStack() as hooks:
+            request._perf = (hooks, None)
+            response = self.get_response(request)
+            stats = request._perf[1]
+        total_ms = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        route = f"{request.method} {match.view_name if match else 'unresolved'}"
+        metrics.record(route, total_ms, stats)
+        if stats is not None:
+            response['Server-Timing'] = ', '.join([
+                f'total;dur={total_ms:.1f}',
+                f'db;dur={stats.sql_ms:.1f};desc="{stats.queries} queries"',
+                f'serializer;dur={stats.serializer_ms:.1f}',
+                f'encrypt;desc="{stats.encrypt}"',
+                f'decrypt;desc="{stats.decrypt}"',
+            ])
+            logger.info(json.dumps({
+                'route': route, 'path': request.path, 'status': response.status_code,
+                'total_ms': round(total_ms, 3), **stats.as_dict(),
+            }))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        rate = self.rates.get(request.resolver_match.view_name, self.default_rate)
+        if rate <= 0 or random.random() >= rate:
+            return None
+        hooks, _ = request._perf
+        stats = RequestStats()
+        request._perf = (hooks, stats)
+        hooks.callback(_current.reset, _current.set(stats))
+        for connection in connections.all():
+            hooks.enter_context(connection.execute_wrapper(_sql_timer(stats)))
+        return None
@@ -0,0 +1,61 @@
+"""
+JSON renderer backed by orjson, when it is installed.
+
+orjson writes UTF-8 bytes straight from the response data, with dates, times, datetimes
+and UUIDs handled in C; the rest (Decimal, timedelta, lazy strings, querysets...) goes
+through DRF's JSONEncoder.default, so the output matches rest_framework's JSONRenderer.
+Requests orjson cannot honour (an indent other than 2, settings asking for ASCII or
+non-compact output, integers above 64 bits, dict keys that are not strings), data
+holding NaN or infinities, which orjson would silently write as null, and installs
+without orjson are rendered by the stdlib JSONRenderer, and so fail the same way. See
+`manage.py benchmark_json` for the difference it makes.
+"""
+import math
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError: # Optional: stdlib json is used instead
+    orjson = None
+
+if orjson is not None:
+    # DRF writes UTC datetimes with a "Z" suffix
+    OPCOES = orjson.OPT_UTC_Z
+
+
+def _nao_finito(data):
+    """True if `data` holds a NaN or infinite float."""
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, dict):
+        return any(_nao_finito(valor) for valor in data.values())
+    if isinstance(data, (list, tuple)):
+        return any(_nao_finito(valor) for valor in data)
+    return False
+
+
+class ORJSONRenderer(JSONRenderer):
+    """Drop-in replacement for rest_framework.renderers.JSONRenderer; see the module docstring."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent not in (None, 2):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=(OPCOES | orjson.OPT_INDENT_2) if indent else OPCOES,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Only output with a null can hide one; the stdlib raises (STRICT_JSON) or writes NaN
+        if b'null' in ret and _nao_finito(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer, so the output stays a strict JavaScript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,155 @@
+"""
+Server-side cache of list and retrieve responses (RESPONSE_CACHE_* settings).
+
+ResponseCacheMixin keeps the serialized data of successful list/retrieve responses in
+the RESPONSE_CACHE_ALIAS cache, keyed by the viewset, the action, the user's role and
+the request's host and full path (query parameters included), so two users only share
+an entry when their role lets them see the same rows. Hits also answer conditional
+requests from the stored ETag/Last-Modified, without touching the database.
+
+Invalidation is by version: every model a viewset renders (`response_cache_models`)
+has a version number in the cache, part of every key, bumped by post_save, post_delete
+and post_bulk_create of that model (see conectar()). Like agendamentos.calendario, the
+bump happens right away and again on commit, so a response read while the write was
+still uncommitted does not outlive it. Entries are only stored from reads made outside
+a transaction, i.e. of committed data. Any cache backend works; with a per-process one
+(locmem) other workers see changes when RESPONSE_CACHE_TTL expires, with a shared one
+(file, Redis, Memcached) right away.
+
+Hits and misses are counted per viewset and shown at /api/metricas/.
+"""
+import collections
+import hashlib
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+from core.signals import post_bulk_create
+
+PREFIX = 'respostas'
+
+# Models whose changes invalidate cached responses; a viewset lists the ones it renders
+MODELOS = ('pacientes.Paciente', 'pacientes.Endereco', 'agendamentos.Agendamento', 'consultas.Consulta')
+
+_contadores = collections.defaultdict(lambda: {'hits': 0, 'misses': 0})
+_contadores_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _chave_versao(label):
+    return f'{PREFIX}:versao:{label}'
+
+
+def versoes(labels):
+    """Current version of each model in `labels`, one cache round trip."""
+    cache = get_cache()
+    chaves = [_chave_versao(label) for label in labels]
+    atuais = cache.get_many(chaves)
+    for chave in chaves:
+        if chave not in atuais:
+            # Never seeded with a constant: a version key evicted by the backend must not
+            # come back as a number that old, still live entries were stored under
+            semente = time.time_ns()
+            cache.add(chave, semente, timeout=None)
+            atuais[chave] = cache.get(chave, semente)
+    return [atuais[chave] for chave in chaves]
+
+
+def _nova_versao(label):
+    try:
+        get_cache().incr(_chave_versao(label))
+    except ValueError: # Not set yet, nothing cached under it
+        pass
+
+
+def invalidar(sender, **kwargs):
+    """Drop every cached response that renders `sender`. A receiver of its write signals."""
+    label = sender._meta.label
+    _nova_versao(label)
+    transaction.on_commit(lambda: _nova_versao(label))
+
+
+def conectar():
+    for label in MODELOS:
+        model = apps.get_model(label)
+        uid = f'response_cache_{label}'
+        post_save.connect(invalidar, sender=model, dispatch_uid=f'{uid}_save')
+        post_delete.connect(invalidar, sender=model, dispatch_uid=f'{uid}_delete')
+        post_bulk_create.connect(invalidar, sender=model, dispatch_uid=f'{uid}_bulk')
+
+
+def _contar(nome, resultado):
+    with _contadores_lock:
+        _contadores[nome][resultado] += 1
+
+
+def contadores():
+    """{viewset: {'hits', 'misses', 'hit_rate'}} since the process started (or reset())."""
+    with _contadores_lock:
+        atuais = {nome: dict(valores) for nome, valores in _contadores.items()}
+    for valores in atuais.values():
+        total = valores['hits'] + valores['misses']
+        valores['hit_rate'] = round(valores['hits'] / total, 3) if total else None
+    return atuais
+
+
+def reset():
+    with _contadores_lock:
+        _contadores.clear()
+
+
+class ResponseCacheMixin:
+    """
+    ViewSet mixin caching list() and retrieve() responses; see the module docstring.
+    `response_cache_models` lists the models (labels from MODELOS) whose rows the
+    responses render. Put it before ConditionalGetMixin so hits skip the ETag query too.
+    """
+    response_cache_models = ()
+
+    def _chave_resposta(self, request):
+        role = getattr(request.user, 'role', None) or 'anonimo'
+        versao = '.'.join(str(v) for v in versoes(self.response_cache_models))
+        pedido = hashlib.sha256(f'{request.get_host()}{request.get_full_path()}'.encode('utf-8')).hexdigest()[:32]
+        return f'{PREFIX}:{self.basename}:{self.action}:{role}:{versao}:{pedido}'
+
+    def _em_cache(self, request, gerar):
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return gerar()
+        cache = get_cache()
+        chave = self._chave_resposta(request)
+        entrada = cache.get(chave)
+        if entrada is None:
+            _contar(self.basename, 'misses')
+            response = gerar()
+            if response.status_code == 200 and not connection.in_atomic_block:
+                cache.set(chave, {
+                    'data': response.data,
+                    'headers': {h: response[h] for h in ('ETag', 'Last-Modified', 'Cache-Control') if h in response},
+                }, settings.RESPONSE_CACHE_TTL)
+            return response
+
+        _contar(self.basename, 'hits')
+        headers = entrada['headers']
+        if 'ETag' in headers:
+            not_modified = get_conditional_response(request._request, etag=headers['ETag'])
+            if not_modified is not None:
+                for header, valor in headers.items():
+                    not_modified[header] = valor
+                return not_modified
+        return Response(entrada['data'], headers=headers)
+
+    def list(self, request, *args, **kwargs):
+        return self._em_cache(request, lambda: super(ResponseCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._em_cache(request, lambda: super(ResponseCacheMixin, self).retrieve(request, *args, **kwargs))
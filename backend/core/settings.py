@@ -2,7 +2,7 @@ import os
 import sys
 from django.core.management.utils import get_random_secret_key
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 from datetime import timedelta
 
 
@@ -55,9 +55,13 @@ INSTALLED_APPS = [
     'agendamentos.apps.AgendamentosConfig',
     'consultas.apps.ConsultasConfig',
     'usuarios.apps.UsuariosConfig',
+    'dashboard.apps.DashboardConfig',
+    'benchmark.apps.BenchmarkConfig',
 ]
 
 MIDDLEWARE = [
+    # Primeiro, para medir o tempo total da requisição (ver core.perf)
+    'core.perf.PerfMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -165,17 +169,113 @@ SIMPLE_JWT = {
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Inclui o perfil (role) do usuário nos tokens (ver usuarios.authentication)
+    'TOKEN_OBTAIN_SERIALIZER': 'usuarios.authentication.RoleTokenObtainPairSerializer',
 }
 
+# Cache em processo dos usuários autenticados por JWT (ver usuarios.authentication): evita
+# uma consulta ao banco por requisição. Alterações no usuário invalidam o cache do processo
+# em que foram feitas; nos demais valem após AUTH_USER_CACHE_TTL segundos.
+AUTH_USER_CACHE_SIZE = config('AUTH_USER_CACHE_SIZE', default=1024, cast=int)
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=60, cast=int)
+
+# Paginação das listas da API (keyset/cursor, ver core.pagination)
+# API_PAGE_SIZE é o tamanho padrão; o cliente pode pedir ?page_size= até API_MAX_PAGE_SIZE.
+API_PAGE_SIZE = config('API_PAGE_SIZE', default=50, cast=int)
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=200, cast=int)
+
+# Exportação CSV/NDJSON (ver core.exportacao): linhas lidas do banco por vez
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Busca de pacientes (ver pacientes.search): número máximo de candidatos lidos do
+# índice de busca por consulta, o que mantém o tempo de resposta limitado.
+PACIENTE_SEARCH_MAX_CANDIDATES = config('PACIENTE_SEARCH_MAX_CANDIDATES', default=1000, cast=int)
+
+# Importação de pacientes em lote (ver pacientes.importacao): linhas validadas e gravadas
+# por transação, e quantos erros por linha entram no relatório (os demais só são contados).
+PACIENTE_IMPORT_BATCH_SIZE = config('PACIENTE_IMPORT_BATCH_SIZE', default=1000, cast=int)
+PACIENTE_IMPORT_MAX_ERRORS = config('PACIENTE_IMPORT_MAX_ERRORS', default=1000, cast=int)
+
+# Agenda (ver agendamentos.disponibilidade): horário de atendimento (AGENDA_HORA_FIM é o
+# último horário que pode ser agendado), granularidade dos horários em minutos, dias da
+# semana com atendimento (0 = segunda-feira) e feriados em formato ISO (ex.: 2026-12-25).
+AGENDA_HORA_INICIO = config('AGENDA_HORA_INICIO', default='08:00')
+AGENDA_HORA_FIM = config('AGENDA_HORA_FIM', default='17:00')
+AGENDA_GRANULARIDADE_MINUTOS = config('AGENDA_GRANULARIDADE_MINUTOS', default=30, cast=int)
+AGENDA_DIAS_SEMANA = config('AGENDA_DIAS_SEMANA', default='0,1,2,3,4', cast=Csv(int))
+AGENDA_FERIADOS = config('AGENDA_FERIADOS', default='', cast=Csv())
+# Maior intervalo, em dias, aceito por /api/agendamentos/disponibilidade/
+AGENDA_DISPONIBILIDADE_MAX_DIAS = config('AGENDA_DISPONIBILIDADE_MAX_DIAS', default=90, cast=int)
+
+# Por quantas horas a resposta de uma requisição com Idempotency-Key é guardada (ver core.idempotency)
+# As expiradas são apagadas por `manage.py purge_idempotency_keys`, a ser agendado (ex.: cron diário).
+IDEMPOTENCY_KEY_TTL_HOURS = config('IDEMPOTENCY_KEY_TTL_HOURS', default=24, cast=int)
+
+# Instrumentação de desempenho por requisição (ver core.perf): tempo total por rota para os
+# percentis de /api/metricas/ e, numa amostra das requisições, consultas SQL, tempo dos
+# serializers e cifragens, no cabeçalho Server-Timing e no logger 'core.perf'.
+# PERF_SAMPLE_RATES ajusta a amostragem por rota, ex.: "paciente-list=1,consulta-detail=0.5".
+# PERF_WINDOW é quantas requisições por rota entram nos percentis.
+PERF_ENABLED = config('PERF_ENABLED', default=False, cast=bool)
+PERF_SAMPLE_RATE = config('PERF_SAMPLE_RATE', default=0.1, cast=float)
+PERF_SAMPLE_RATES = config('PERF_SAMPLE_RATES', default='', cast=Csv())
+PERF_WINDOW = config('PERF_WINDOW', default=1000, cast=int)
+
+# Cache do Django. Sem configuração é um cache local por processo (locmem); use, por exemplo,
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache e CACHE_LOCATION=/var/tmp/clinica
+# para um cache compartilhado entre os workers de uma máquina.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# Caches locais a cada processo: o que um worker invalida continua valendo nos demais
+CACHES_POR_PROCESSO = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Cache das respostas de listagem e detalhe de pacientes e agendamentos (ver core.response_cache).
+# As entradas são invalidadas a cada alteração dos modelos, o que só chega aos outros workers
+# com um cache compartilhado: por isso vem desligado com um cache por processo (há um aviso
+# do `manage.py check` se for ligado assim). RESPONSE_CACHE_TTL (segundos) é a validade das entradas.
+RESPONSE_CACHE_ALIAS = config('RESPONSE_CACHE_ALIAS', default='default')
+RESPONSE_CACHE_ENABLED = config(
+    'RESPONSE_CACHE_ENABLED', default=CACHES[RESPONSE_CACHE_ALIAS]['BACKEND'] not in CACHES_POR_PROCESSO, cast=bool,
+)
+RESPONSE_CACHE_TTL = config('RESPONSE_CACHE_TTL', default=300, cast=int)
+
+# Por quantos segundos o resumo mensal de /api/agendamentos/calendario/ fica no cache padrão
+# (0 desliga). Cada alteração de agendamento invalida o cache, mas com um cache por processo
+# os outros workers só veriam a mudança quando o prazo expirasse: por isso vem desligado
+# nesse caso (há um aviso do `manage.py check` se for ligado assim).
+AGENDA_CALENDARIO_CACHE_SEGUNDOS = config(
+    'AGENDA_CALENDARIO_CACHE_SEGUNDOS', default=0 if CACHES['default']['BACKEND'] in CACHES_POR_PROCESSO else 300, cast=int,
+)
+
 # Basic DRF settings from script
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'usuarios.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetCursorPagination',
+    'PAGE_SIZE': API_PAGE_SIZE,
+    # JSON encoded/decoded by orjson when installed, by the stdlib otherwise (core.renderers, core.parsers)
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 
@@ -185,6 +285,25 @@ DEFAULT_FERNET_KEY_BYTES = 'DoDOnwOMoURGhGUfE87fgBEtXgLo6ObG84l_us9fGT4=' # gene
 FERNET_KEY = config('DJANGO_FERNET_KEY', default='DoDOnwOMoURGhGUfE87fgBEtXgLo6ObG84l_us9fGT4=').encode('utf-8')
 if isinstance(FERNET_KEY, str): FERNET_KEY = FERNET_KEY.encode('utf-8') # This ensures it becomes bytes
 
+# Cipher engine for newly written EncryptedTextField values (see core.ciphers): 'envelope'
+# (AES-256-GCM with data keys wrapped by a master key, see core.keys), 'aesgcm' (AES-256-GCM)
+# or 'fernet' (legacy). Existing values keep decrypting with the engine that wrote them.
+ENCRYPTED_FIELD_ENGINE = config('ENCRYPTED_FIELD_ENGINE', default='envelope')
+# AES-256-GCM key as 32 url-safe base64 bytes; when empty it is derived from FERNET_KEY with HKDF.
+ENCRYPTED_FIELD_AESGCM_KEY = config('DJANGO_AESGCM_KEY', default='')
+
+# Master keys of the envelope engine as "id:key" entries (32 url-safe base64 bytes), comma
+# separated. The first one wraps new data keys; keep the previous ones listed until
+# `rotate_master_key` has re-wrapped everything. A key derived from FERNET_KEY is always
+# available under the id "default" and is used when the list is empty.
+ENCRYPTION_MASTER_KEYS = config('DJANGO_MASTER_KEYS', default='', cast=Csv())
+# Unwrapped data keys kept in memory per process, and for how long (seconds).
+ENCRYPTION_DATA_KEY_CACHE_SIZE = config('ENCRYPTION_DATA_KEY_CACHE_SIZE', default=1024, cast=int)
+ENCRYPTION_DATA_KEY_CACHE_TTL = config('ENCRYPTION_DATA_KEY_CACHE_TTL', default=300, cast=int)
+
+# Threads used by core.fields.batch_decrypt to decrypt a page of notes in parallel (1 disables the pool)
+ENCRYPTED_FIELD_DECRYPT_WORKERS = config('ENCRYPTED_FIELD_DECRYPT_WORKERS', default=4, cast=int)
+
 # Frontend
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # Frontend Vite React
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent after QuerySet.bulk_create() of rows that other apps keep derived data for (bulk
+# inserts send no post_save). Arguments: sender (the model) and instances (the created
+# objects, primary keys set).
+post_bulk_create = Signal()
@@ -0,0 +1,210 @@
+import datetime
+import decimal
+import re
+import shutil
+import tempfile
+import uuid
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from agendamentos.models import Agendamento
+from consultas.models import Consulta
+from core import perf, renderers, response_cache
+from core.checks import check_calendario_cache, check_response_cache
+from core.models import IdempotencyKey
+from pacientes.models import Endereco, Paciente
+from usuarios.models import CustomUser, UserRole
+
+
+@override_settings(PERF_ENABLED=True, PERF_SAMPLE_RATE=0.0, PERF_SAMPLE_RATES=['consulta-list=1'])
+class PerfMiddlewareTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.prof_user = CustomUser.objects.create_user(username='prof_perf', password='password', role=UserRole.PROFISSIONAL_SAUDE)
+        cls.admin_user = CustomUser.objects.create_user(username='admin_perf', password='password', role=UserRole.ADMIN)
+        endereco = Endereco.objects.create(cep='11111-000', uf='SP', cidade='Cidade', logradouro='Rua', numero='1', bairro='Centro')
+        paciente = Paciente.objects.create(
+            cpf='123.456.789-00', nome='Paciente Perf', nascimento='1980-01-01',
+            celular='11999990000', email='perf@example.com', endereco_residencial=endereco,
+        )
+        agendamento = Agendamento.objects.create(paciente=paciente, data=datetime.date.today(), hora='09:00:00')
+        Consulta.objects.create(
+            agendamento=agendamento, profissional_responsavel=cls.prof_user,
+            anotacoes_atuais="Notas.", pontos_atencao="Ponto.",
+        )
+
+    def setUp(self):
+        perf.metrics.reset()
+
+    def test_sampled_request_gets_server_timing(self):
+        self.client.force_authenticate(user=self.prof_user)
+        response = self.client.get(reverse('consulta-list'), {'fields': 'anotacoes_atuais,pontos_atencao'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'total;dur=[\d.]+')
+        queries = int(re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', timing).group(1))
+        self.assertGreater(queries, 0)
+        self.assertIn('decrypt;desc="2"', timing)
+
+        # Routes outside PERF_SAMPLE_RATES are timed but not broken down
+        response = self.client.get(reverse('paciente-list'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_metrics_endpoint(self):
+        self.client.force_authenticate(user=self.prof_user)
+        for _ in range(3):
+            self.client.get(reverse('consulta-list'), {'fields': 'anotacoes_atuais,pontos_atencao'})
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin_user)
+        rotas = self.client.get(reverse('metricas')).data['rotas']
+        rota = rotas['GET consulta-list']
+        self.assertEqual(rota['requests'], 3)
+        self.assertEqual(rota['sampled'], 3)
+        self.assertLessEqual(rota['p50_ms'], rota['p99_ms'])
+        self.assertEqual(rota['decrypt_avg'], 2)
+
+    @override_settings(PERF_ENABLED=False)
+    def test_disabled(self):
+        self.client.force_authenticate(user=self.prof_user)
+        response = self.client.get(reverse('consulta-list'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(perf.metrics.summary(), {})
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTests(APITransactionTestCase):
+    """Outside a TestCase transaction: entries are only stored from committed reads."""
+
+    def setUp(self):
+        response_cache.get_cache().clear()
+        response_cache.reset()
+        self.secretaria = CustomUser.objects.create_user(username='sec_cache', password='password', role=UserRole.SECRETARIA)
+        self.profissional = CustomUser.objects.create_user(username='prof_cache', password='password', role=UserRole.PROFISSIONAL_SAUDE)
+        self.endereco = Endereco.objects.create(cep='11111-000', uf='SP', cidade='Cidade', logradouro='Rua', numero='1', bairro='Centro')
+        self.paciente = Paciente.objects.create(
+            cpf='123.456.789-00', nome='Paciente Cache', nascimento='1980-01-01',
+            celular='11999990000', email='cache@example.com', endereco_residencial=self.endereco,
+        )
+
+    def _hits_and_invalidation(self):
+        url = reverse('paciente-list') + '?fields=nome,endereco_residencial'
+        self.client.force_authenticate(user=self.secretaria)
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['nome'], 'Paciente Cache')
+        with self.assertNumQueries(0): # Conditional request answered from the entry
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.client.get(url, {'search': 'cache'}) # Other query parameters, other entry
+
+        # Other role, other entry
+        self.client.force_authenticate(user=self.profissional)
+        self.client.get(url)
+        self.assertEqual(response_cache.contadores()['paciente'], {'hits': 2, 'misses': 3, 'hit_rate': 0.4})
+
+        # Writes to the paciente or its address drop the entries
+        self.endereco.bairro = 'Novo Bairro'
+        self.endereco.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['endereco_residencial']['bairro'], 'Novo Bairro')
+        self.paciente.delete()
+        self.assertEqual(self.client.get(url).data['results'], [])
+
+        # Agendamentos are not touched by an Endereco change
+        agendamentos_url = reverse('agendamento-list')
+        self.client.get(agendamentos_url, {'paciente__id': 1})
+        Endereco.objects.create(cep='22222-000', uf='RJ', cidade='Rio', logradouro='Av', numero='2', bairro='Centro').save()
+        with self.assertNumQueries(0):
+            self.client.get(agendamentos_url, {'paciente__id': 1})
+
+    def test_locmem_backend(self):
+        self._hits_and_invalidation()
+
+    def test_file_backend(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}
+        with self.settings(CACHES=caches):
+            self._hits_and_invalidation()
+
+
+    def test_evicted_version_does_not_revive_entries(self):
+        url = reverse('paciente-list')
+        self.client.force_authenticate(user=self.secretaria)
+        self.client.get(url)
+        # A change the signals do not see, then the backend drops the version key
+        Paciente.objects.filter(pk=self.paciente.pk).update(nome='Paciente Renomeado')
+        response_cache.get_cache().delete('respostas:versao:pacientes.Paciente')
+        self.assertEqual(self.client.get(url).data['results'][0]['nome'], 'Paciente Renomeado')
+
+    def test_check_warns_on_per_process_cache(self):
+        self.assertEqual([w.id for w in check_response_cache(None)], ['core.W001'])
+        with self.settings(RESPONSE_CACHE_ENABLED=False):
+            self.assertEqual(check_response_cache(None), [])
+        with self.settings(AGENDA_CALENDARIO_CACHE_SEGUNDOS=300):
+            self.assertEqual([w.id for w in check_calendario_cache(None)], ['core.W002'])
+        with self.settings(AGENDA_CALENDARIO_CACHE_SEGUNDOS=0):
+            self.assertEqual(check_calendario_cache(None), [])
+
+
+class JSONEngineTests(APITestCase):
+    def test_renderer_matches_stdlib(self):
+        data = {
+            'data': datetime.date(2026, 10, 18), 'hora': datetime.time(9, 30),
+            'em': datetime.datetime(2026, 10, 18, 12, 0, 0, 123456, tzinfo=datetime.timezone.utc),
+            'valor': decimal.Decimal('12.50'), 'id': uuid.UUID(int=1), 'rotulo': gettext_lazy('Paciente'),
+            'lista': [1, 2.5, None, True, 'Conceição\u2028'], 'aninhado': {'a': {'b': []}},
+        }
+        esperado = JSONRenderer().render(data)
+        self.assertEqual(renderers.ORJSONRenderer().render(data), esperado)
+        # Indents orjson does not write go through the stdlib, and so does an install without orjson
+        self.assertEqual(
+            renderers.ORJSONRenderer().render(data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4'),
+        )
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(renderers.ORJSONRenderer().render(data), esperado)
+
+    def test_renderer_fails_like_stdlib(self):
+        for valor in (float('nan'), float('inf'), float('-inf')):
+            with self.assertRaisesMessage(ValueError, 'Out of range float values are not JSON compliant'):
+                renderers.ORJSONRenderer().render({'lista': [None, {'valor': valor}]})
+        with self.assertRaises(TypeError):
+            renderers.ORJSONRenderer().render({datetime.date(2026, 10, 18): 1})
+        # Keys the stdlib accepts are written the same way
+        data = {1: 'um', True: None, 'x': 2.5}
+        self.assertEqual(renderers.ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parser(self):
+        user = CustomUser.objects.create_user(username='sec_json', password='password', role=UserRole.SECRETARIA)
+        self.client.force_authenticate(user=user)
+        response = self.client.post(reverse('agendamento-list'), '{"paciente_id": ', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('JSON parse error', response.data['detail'])
+        response = self.client.post(reverse('agendamento-list'), '{"hora": "09:00"}', content_type='application/json')
+        self.assertIn('paciente_id', response.data) # Parsed, then validated
+
+
+class IdempotencyKeyPurgeTests(APITestCase):
+    def test_purge_deletes_only_expired_keys(self):
+        user = CustomUser.objects.create_user(username='sec_idem', password='password', role=UserRole.SECRETARIA)
+        for i in range(5):
+            IdempotencyKey.objects.create(user=user, key=f'chave-{i}', fingerprint='x', status_code=201)
+        IdempotencyKey.objects.filter(key__in=['chave-0', 'chave-1', 'chave-2']).update(
+            criado_em=timezone.now() - datetime.timedelta(hours=25),
+        )
+        out = StringIO()
+        with override_settings(IDEMPOTENCY_KEY_TTL_HOURS=24):
+            call_command('purge_idempotency_keys', '--batch-size=2', stdout=out)
+        self.assertIn("3 idempotency keys older than 24 hours deleted.", out.getvalue())
+        self.assertEqual(sorted(IdempotencyKey.objects.values_list('key', flat=True)), ['chave-3', 'chave-4'])
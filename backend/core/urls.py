@@ -5,6 +5,7 @@ from rest_framework.routers import DefaultRouter
 from pacientes.views import PacienteViewSet
 from agendamentos.views import AgendamentoViewSet
 from consultas.views import ConsultaViewSet
+from core.views import MetricasView
 
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
@@ -27,6 +28,8 @@ urlpatterns = [
 
     # Views que não usam ViewSet (usuários)
     path('api/usuarios/', include('usuarios.urls')),
+    path('api/dashboard/', include('dashboard.urls')),
+    path('api/metricas/', MetricasView.as_view(), name='metricas'),
 
     # Todas as rotas de pacientes, agendamentos e consultas via ViewSet
     path('api/', include(router.urls)),
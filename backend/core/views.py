@@ -0,0 +1,27 @@
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from usuarios.permissions import IsAdminUser
+from . import perf, response_cache
+
+
+class MetricasView(APIView):
+    """
+    Latency percentiles and sampled SQL/serializer/encryption figures per route, for the
+    requests this process has served (see core.perf), and the response cache hit/miss
+    counters (see core.response_cache). DELETE starts both over.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'habilitado': perf.enabled(),
+            'janela': perf.metrics.window,
+            'rotas': perf.metrics.summary(),
+            'cache_respostas': response_cache.contadores(),
+        })
+
+    def delete(self, request):
+        perf.metrics.reset()
+        response_cache.reset()
+        return Response(status=204)
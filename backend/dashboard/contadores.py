@@ -0,0 +1,192 @@
+"""
+Incremental upkeep of the dashboard counters (dashboard.models.Contador).
+
+Each counted model has a rule (REGRAS) mapping one of its rows to the counters the row
+adds one to. When a row is saved, what it counted before (read back in pre_save, only
+for updates of rules that can change) is subtracted and what it counts now is added;
+when it is deleted, what it counts is subtracted. Each counter that changes costs one
+UPDATE ... SET valor = valor + n, plus an INSERT the first time a counter is touched.
+
+bulk_create sends no post_save, so code bulk-creating counted rows sends
+core.signals.post_bulk_create, handled here with one UPDATE per counter for the batch.
+"""
+import collections
+import datetime
+import functools
+import operator
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from core.signals import post_bulk_create
+from .models import Contador, Metrica
+
+
+def dia(value):
+    """Local calendar day of a date, datetime or ISO string."""
+    if isinstance(value, datetime.datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10])
+    return value
+
+
+class Regra:
+    """
+    `chaves(*valores)` lists the (dia, metrica, profissional_id) counters a row counts in,
+    from the values of the `campos` lookups. `valores(instance, antes)` gives the same
+    values for an instance in memory, `antes` being those read before the save. With
+    `campos=None` the counted values never change after creation, and updates are ignored.
+    """
+
+    def __init__(self, campos, valores, chaves):
+        self.campos = campos
+        self.valores = valores
+        self.chaves = chaves
+
+
+def _chaves_agendamento(data, status, profissional_consulta):
+    chaves = [(dia(data), f'AGENDAMENTOS_{status}', None)]
+    if profissional_consulta:
+        # A consulta counts on its agendamento's day, which moves with it
+        chaves.append((dia(data), Metrica.CONSULTAS, profissional_consulta))
+    return chaves
+
+
+REGRAS = {
+    'pacientes.Paciente': Regra(
+        None,
+        lambda paciente, antes: (paciente.criado_em,),
+        lambda criado_em: [(dia(criado_em), Metrica.PACIENTES_NOVOS, None)],
+    ),
+    'agendamentos.Agendamento': Regra(
+        ('data', 'status', 'consulta__profissional_responsavel_id'),
+        # Saving the agendamento does not touch its consulta
+        lambda agendamento, antes: (agendamento.data, agendamento.status, antes[2] if antes else None),
+        _chaves_agendamento,
+    ),
+    'consultas.Consulta': Regra(
+        ('agendamento__data', 'profissional_responsavel_id'),
+        lambda consulta, antes: (consulta.agendamento.data, consulta.profissional_responsavel_id),
+        lambda data, profissional_id: [(dia(data), Metrica.CONSULTAS, profissional_id)],
+    ),
+}
+
+
+# Counters updated per UPDATE when several change at once (e.g. a bulk_create over many
+# days); keeps the WHERE clause well under SQLite's expression depth limit.
+LOTE_UPDATE = 200
+
+
+def _filtro(chaves):
+    return functools.reduce(operator.or_, (
+        Q(dia=dia_, metrica=metrica, profissional_id=profissional_id) for dia_, metrica, profissional_id in chaves
+    ))
+
+
+def aplicar(deltas):
+    """Add each {(dia, metrica, profissional_id): n} of `deltas` to its counter."""
+    deltas = {chave: n for chave, n in deltas.items() if n}
+    if len(deltas) == 1:
+        # The common case, one save: a single UPDATE once the counter exists
+        [((dia_, metrica, profissional_id), n)] = deltas.items()
+        contador = Contador.objects.filter(dia=dia_, metrica=metrica, profissional_id=profissional_id)
+        if contador.update(valor=F('valor') + n):
+            return
+        try:
+            with transaction.atomic():
+                Contador.objects.create(dia=dia_, metrica=metrica, profissional_id=profissional_id, valor=n)
+        except IntegrityError: # Created concurrently: it exists now
+            contador.update(valor=F('valor') + n)
+        return
+    # Several counters: create the missing ones at zero, then one UPDATE per distinct delta
+    Contador.objects.bulk_create(
+        [Contador(dia=dia_, metrica=metrica, profissional_id=profissional_id, valor=0)
+         for dia_, metrica, profissional_id in deltas],
+        ignore_conflicts=True,
+    )
+    por_delta = collections.defaultdict(list)
+    for chave, n in deltas.items():
+        por_delta[n].append(chave)
+    for n, chaves in por_delta.items():
+        for inicio in range(0, len(chaves), LOTE_UPDATE):
+            Contador.objects.filter(_filtro(chaves[inicio:inicio + LOTE_UPDATE])).update(valor=F('valor') + n)
+
+
+def _regra(sender):
+    return REGRAS[sender._meta.label]
+
+
+def _antes_de_salvar(sender, instance, raw=False, **kwargs):
+    regra = _regra(sender)
+    instance._contadores_antes = None
+    if raw or regra.campos is None or instance._state.adding or instance.pk is None:
+        return
+    instance._contadores_antes = (
+        sender._base_manager.filter(pk=instance.pk).values_list(*regra.campos).first()
+    )
+
+
+def _depois_de_salvar(sender, instance, created, raw=False, **kwargs):
+    regra = _regra(sender)
+    if raw or (regra.campos is None and not created):
+        return
+    antes = getattr(instance, '_contadores_antes', None)
+    deltas = collections.Counter()
+    if antes:
+        for chave in regra.chaves(*antes):
+            deltas[chave] -= 1
+    for chave in regra.chaves(*regra.valores(instance, antes)):
+        deltas[chave] += 1
+    aplicar(deltas)
+
+
+def _depois_de_apagar(sender, instance, **kwargs):
+    regra = _regra(sender)
+    aplicar(collections.Counter({chave: -1 for chave in regra.chaves(*regra.valores(instance, None))}))
+
+
+def _depois_de_criar_em_lote(sender, instances, **kwargs):
+    if sender._meta.label not in REGRAS:
+        return
+    regra = _regra(sender)
+    deltas = collections.Counter()
+    for instance in instances:
+        for chave in regra.chaves(*regra.valores(instance, None)):
+            deltas[chave] += 1
+    aplicar(deltas)
+
+
+def conectar():
+    for label in REGRAS:
+        model = global_apps.get_model(label)
+        uid = f'dashboard_contadores_{label}'
+        pre_save.connect(_antes_de_salvar, sender=model, dispatch_uid=f'{uid}_pre_save')
+        post_save.connect(_depois_de_salvar, sender=model, dispatch_uid=f'{uid}_post_save')
+        post_delete.connect(_depois_de_apagar, sender=model, dispatch_uid=f'{uid}_post_delete')
+    post_bulk_create.connect(_depois_de_criar_em_lote, dispatch_uid='dashboard_contadores_bulk')
+
+
+def contar(apps=global_apps):
+    """
+    {(dia, metrica, profissional_id): valor} computed from scratch with one GROUP BY per
+    counted model, for reconstruir_contadores and the initial migration (which passes its
+    historical `apps`).
+    """
+    Paciente = apps.get_model('pacientes.Paciente')
+    Agendamento = apps.get_model('agendamentos.Agendamento')
+    Consulta = apps.get_model('consultas.Consulta')
+    totais = {}
+    pacientes = Paciente.objects.annotate(dia=TruncDate('criado_em')).values_list('dia').annotate(n=Count('*')).order_by()
+    for dia_, n in pacientes:
+        totais[(dia_, Metrica.PACIENTES_NOVOS, None)] = n
+    for data, status, n in Agendamento.objects.values_list('data', 'status').annotate(n=Count('*')).order_by():
+        totais[(data, f'AGENDAMENTOS_{status}', None)] = n
+    consultas = Consulta.objects.values_list('agendamento__data', 'profissional_responsavel_id').annotate(n=Count('*')).order_by()
+    for data, profissional_id, n in consultas:
+        totais[(data, Metrica.CONSULTAS, profissional_id)] = n
+    return totais
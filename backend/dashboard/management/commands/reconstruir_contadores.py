@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dashboard.contadores import contar
+from dashboard.models import Contador
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the dashboard counters from pacientes, agendamentos and consultas, e.g. "
+        "after rows were changed without signals (QuerySet.update(), raw SQL, fixtures)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the counters that are off.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            esperados = {chave: valor for chave, valor in contar().items() if valor}
+            atuais = {
+                (dia, metrica, profissional_id): valor
+                for dia, metrica, profissional_id, valor in Contador.objects.select_for_update()
+                .exclude(valor=0).values_list('dia', 'metrica', 'profissional_id', 'valor')
+            }
+            divergentes = sorted(
+                (chave for chave in esperados.keys() | atuais.keys() if esperados.get(chave) != atuais.get(chave)),
+                key=lambda chave: (chave[0], chave[1], chave[2] or 0),
+            )
+            for dia, metrica, profissional_id in divergentes:
+                chave = (dia, metrica, profissional_id)
+                self.stdout.write(
+                    f"{dia} {metrica} {profissional_id or '-'}: {atuais.get(chave, 0)} -> {esperados.get(chave, 0)}"
+                )
+            if not options['dry_run']:
+                Contador.objects.all().delete()
+                Contador.objects.bulk_create(
+                    Contador(dia=dia, metrica=metrica, profissional_id=profissional_id, valor=valor)
+                    for (dia, metrica, profissional_id), valor in esperados.items()
+                )
+        verbo = 'found' if options['dry_run'] else 'fixed'
+        self.stdout.write(f"{len(esperados)} counters, {len(divergentes)} {verbo}")
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def backfill_contadores(apps, schema_editor):
+    from dashboard.contadores import contar
+    Contador = apps.get_model('dashboard', 'Contador')
+    Contador.objects.bulk_create(
+        (Contador(dia=dia, metrica=metrica, profissional_id=profissional_id, valor=valor)
+         for (dia, metrica, profissional_id), valor in contar(apps).items()),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('agendamentos', '0002_agendamento_data_status_idx'),
+        ('consultas', '0004_consulta_anterior_ultimaconsulta'),
+        ('pacientes', '0005_paciente_cpf_digitos_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Contador',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('metrica', models.CharField(choices=[('PACIENTES_NOVOS', 'Pacientes cadastrados'), ('AGENDAMENTOS_EM_ANDAMENTO', 'Agendamentos em andamento'), ('AGENDAMENTOS_CONCLUIDO', 'Agendamentos concluídos'), ('AGENDAMENTOS_CANCELADO', 'Agendamentos cancelados'), ('CONSULTAS', 'Consultas')], max_length=40)),
+                ('valor', models.IntegerField(default=0)),
+                ('profissional', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('profissional__isnull', False)), fields=('dia', 'metrica', 'profissional'), name='contador_dia_metrica_profissional_uniq'), models.UniqueConstraint(condition=models.Q(('profissional__isnull', True)), fields=('dia', 'metrica'), name='contador_dia_metrica_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_contadores, migrations.RunPython.noop),
+    ]
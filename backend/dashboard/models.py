@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import models
+
+
+class Metrica(models.TextChoices):
+    PACIENTES_NOVOS = 'PACIENTES_NOVOS', 'Pacientes cadastrados'
+    AGENDAMENTOS_EM_ANDAMENTO = 'AGENDAMENTOS_EM_ANDAMENTO', 'Agendamentos em andamento'
+    AGENDAMENTOS_CONCLUIDO = 'AGENDAMENTOS_CONCLUIDO', 'Agendamentos concluídos'
+    AGENDAMENTOS_CANCELADO = 'AGENDAMENTOS_CANCELADO', 'Agendamentos cancelados'
+    CONSULTAS = 'CONSULTAS', 'Consultas'
+
+
+class Contador(models.Model):
+    """
+    Rollup of one dashboard figure for one day, and for one professional when the figure
+    is per professional (consultas). Kept up to date by dashboard.contadores as the
+    counted rows are saved and deleted; `reconstruir_contadores` recomputes it.
+    """
+    dia = models.DateField()
+    metrica = models.CharField(max_length=40, choices=Metrica.choices)
+    profissional = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='+'
+    )
+    valor = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # NULLs never clash in a unique index, hence a separate one for the clinic-wide rows
+            models.UniqueConstraint(
+                fields=['dia', 'metrica', 'profissional'], name='contador_dia_metrica_profissional_uniq',
+                condition=models.Q(profissional__isnull=False),
+            ),
+            models.UniqueConstraint(
+                fields=['dia', 'metrica'], name='contador_dia_metrica_uniq',
+                condition=models.Q(profissional__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} {self.metrica}: {self.valor}"
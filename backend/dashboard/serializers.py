@@ -0,0 +1,12 @@
+import datetime
+
+from rest_framework import serializers
+
+
+class DashboardQuerySerializer(serializers.Serializer):
+    """Query parameters of the dashboard: the day shown (?data=, default today)."""
+    data = serializers.DateField(required=False)
+
+    def validate(self, data):
+        data.setdefault('data', datetime.date.today())
+        return data
@@ -0,0 +1,107 @@
+import datetime
+import io
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from agendamentos.models import Agendamento, AgendamentoStatus
+from consultas.models import Consulta
+from pacientes.models import Endereco, Paciente
+from usuarios.models import CustomUser, UserRole
+from .contadores import contar
+from .models import Contador
+
+
+class DashboardTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.secretaria = CustomUser.objects.create_user(username='dash_sec', password='password', role=UserRole.SECRETARIA)
+        cls.prof1 = CustomUser.objects.create_user(username='dash_prof1', password='password', role=UserRole.PROFISSIONAL_SAUDE)
+        cls.prof2 = CustomUser.objects.create_user(username='dash_prof2', password='password', role=UserRole.PROFISSIONAL_SAUDE)
+        cls.endereco = Endereco.objects.create(cep='12345-001', uf='SP', cidade='Cidade', logradouro='Rua', bairro='Bairro')
+        cls.url = reverse('dashboard')
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.secretaria)
+
+    def _paciente(self, i):
+        return Paciente.objects.create(
+            cpf=f'100.000.000-{i:02d}', nome=f'Paciente {i}', nascimento='1990-01-01', celular='11900000000',
+            email=f'dash{i}@example.com', endereco_residencial=self.endereco,
+        )
+
+    def test_counters_follow_saves_deletes_and_bulk_creates(self):
+        hoje = timezone.localdate()
+        amanha = hoje + datetime.timedelta(days=1)
+        p1, p2 = self._paciente(1), self._paciente(2)
+        a1 = Agendamento.objects.create(paciente=p1, data=hoje, hora='08:00')
+        a2 = Agendamento.objects.create(paciente=p2, data=hoje.isoformat(), hora='09:00')
+        a3 = Agendamento.objects.create(paciente=p2, data=amanha, hora='10:00')
+        Consulta.objects.create(agendamento=a1, profissional_responsavel=self.prof1, anotacoes_atuais='Notas.')
+        Consulta.objects.create(agendamento=a2, profissional_responsavel=self.prof2, anotacoes_atuais='Notas.')
+        # Status change and a consulta's agendamento moving to another day
+        a2.status = AgendamentoStatus.CONCLUIDO
+        a2.save()
+        a1.data = amanha
+        a1.save()
+        a3.delete()
+        # bulk_create paths: recurring series and import
+        segunda = hoje + datetime.timedelta(days=28 - hoje.weekday())
+        response = self.client.post(reverse('agendamento-serie'), {
+            'paciente_id': p1.pk, 'data_inicio': segunda.isoformat(), 'hora': '11:00', 'quantidade': 4,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        csv = 'cpf,nome,nascimento,celular,email,cep,uf,cidade,logradouro,bairro\n' \
+              '300.000.000-01,Importado,1990-01-01,11900000000,imp@example.com,01000-000,SP,SP,Rua,Centro\n'
+        response = self.client.post(reverse('paciente-importar'), {
+            'arquivo': SimpleUploadedFile('pacientes.csv', csv.encode()),
+        }, format='multipart')
+        self.assertEqual(response.data['importados'], 1)
+
+        esperados = {chave: valor for chave, valor in contar().items() if valor}
+        atuais = {
+            (dia, metrica, profissional_id): valor
+            for dia, metrica, profissional_id, valor in Contador.objects.values_list('dia', 'metrica', 'profissional_id', 'valor')
+            if valor
+        }
+        self.assertEqual(atuais, esperados)
+        self.assertEqual(esperados[(hoje, 'PACIENTES_NOVOS', None)], 3)
+        self.assertEqual(esperados[(amanha, 'CONSULTAS', self.prof1.pk)], 1)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'data': hoje.isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['dia']['PACIENTES_NOVOS'], 3)
+        self.assertEqual(response.data['mes']['AGENDAMENTOS_EM_ANDAMENTO'], Agendamento.objects.filter(
+            data__year=hoje.year, data__month=hoje.month, status=AgendamentoStatus.EM_ANDAMENTO).count())
+        self.assertEqual(response.data['dia']['AGENDAMENTOS_CONCLUIDO'], 1)
+        self.assertEqual(response.data['dia']['AGENDAMENTOS_EM_ANDAMENTO'], 0)
+        self.assertEqual(response.data['dia']['CONSULTAS'], 1)
+
+        # A professional only counts their own consultas
+        self.client.force_authenticate(user=self.prof1)
+        response = self.client.get(self.url, {'data': hoje.isoformat()})
+        self.assertEqual(response.data['dia']['CONSULTAS'], 0)
+        self.assertEqual(response.data['dia']['PACIENTES_NOVOS'], 3)
+
+    def test_rebuild_command_repairs_counters(self):
+        paciente = self._paciente(1)
+        Agendamento.objects.create(paciente=paciente, data='2024-03-04', hora='08:00')
+        # Changes that bypass the signals
+        Agendamento.objects.update(status=AgendamentoStatus.CANCELADO)
+        Contador.objects.filter(metrica='PACIENTES_NOVOS').update(valor=5)
+
+        saida = io.StringIO()
+        call_command('reconstruir_contadores', '--dry-run', stdout=saida)
+        self.assertIn('3 found', saida.getvalue())
+        self.assertEqual(Contador.objects.get(metrica='PACIENTES_NOVOS').valor, 5)
+
+        call_command('reconstruir_contadores', stdout=io.StringIO())
+        self.assertEqual(
+            set(Contador.objects.values_list('dia', 'metrica', 'valor')),
+            {(timezone.localdate(), 'PACIENTES_NOVOS', 1), (datetime.date(2024, 3, 4), 'AGENDAMENTOS_CANCELADO', 1)},
+        )
@@ -0,0 +1,39 @@
+import calendar
+
+from django.db.models import Q, Sum
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from usuarios.models import UserRole
+from usuarios.permissions import IsAdminUser, IsProfissionalSaude, IsSecretaria
+from .models import Contador, Metrica
+from .serializers import DashboardQuerySerializer
+
+
+class DashboardView(APIView):
+    """
+    Figures of the day and of its month, read from the counters rollup (dashboard.models.
+    Contador) with one query over at most a month of rows. A PROFISSIONAL_SAUDE sees
+    only their own consultas.
+    """
+    permission_classes = [IsSecretaria | IsProfissionalSaude | IsAdminUser]
+
+    def get(self, request):
+        params = DashboardQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data['data']
+        inicio_mes = data.replace(day=1)
+        fim_mes = data.replace(day=calendar.monthrange(data.year, data.month)[1])
+
+        contadores = Contador.objects.filter(dia__range=(inicio_mes, fim_mes))
+        if request.user.role == UserRole.PROFISSIONAL_SAUDE:
+            contadores = contadores.filter(Q(profissional__isnull=True) | Q(profissional=request.user))
+        totais = (
+            contadores.values_list('metrica')
+            .annotate(dia=Sum('valor', filter=Q(dia=data)), mes=Sum('valor'))
+            .order_by()
+        )
+        dia, mes = dict.fromkeys(Metrica.values, 0), dict.fromkeys(Metrica.values, 0)
+        for metrica, total_dia, total_mes in totais:
+            dia[metrica], mes[metrica] = total_dia or 0, total_mes or 0
+        return Response({'data': data, 'dia': dia, 'mes': mes})
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, post_save
+
+
+def _ensure_search_index(sender, using, **kwargs):
+    from django.db import connections
+    from .search import ensure_sqlite_search_index
+    ensure_sqlite_search_index(connections[using])
 
 
 class PacientesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pacientes'
+
+    def ready(self):
+        # SQLite loses the FTS5 sync triggers when a migration rebuilds the table
+        post_migrate.connect(_ensure_search_index, sender=self)
+
+        from .models import Endereco, tocar_pacientes_do_endereco
+        post_save.connect(tocar_pacientes_do_endereco, sender=Endereco, dispatch_uid='pacientes_endereco_atualizado')
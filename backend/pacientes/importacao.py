@@ -0,0 +1,276 @@
+"""
+Bulk import of pacientes from CSV or JSON.
+
+The file is read row by row and handled in chunks of PACIENTE_IMPORT_BATCH_SIZE rows: each
+chunk is validated, checked for CPFs and e-mails already taken with one query, and saved
+with one bulk INSERT for the addresses and one for the pacientes inside a transaction. Only
+one chunk is held in memory, so the file size does not matter.
+
+CSV files have one column per Paciente field (cpf, nome, nascimento, celular, whatsapp,
+email, repetir_endereco_cobranca), the residential address in cep, uf, cidade, logradouro,
+numero and bairro, and the billing address, when different, in the same columns prefixed
+with cobranca_. JSON files are either an array or one object per line (NDJSON), each
+object shaped like a POST /api/pacientes/ body.
+"""
+import csv
+import itertools
+import json
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from rest_framework import serializers
+
+from core.signals import post_bulk_create
+from .models import Endereco, Paciente, normalize_cpf, normalize_phone
+from .search import build_search_document
+from .serializers import PacienteImportSerializer
+
+FORMATOS = ('csv', 'json')
+
+ENDERECO_CAMPOS = ('cep', 'uf', 'cidade', 'logradouro', 'numero', 'bairro')
+PREFIXO_COBRANCA = 'cobranca_'
+
+# Characters read from a JSON array at a time
+TAMANHO_BLOCO_JSON = 64 * 1024
+# Largest JSON object (or NDJSON line), in characters: a malformed file is not buffered whole
+TAMANHO_MAXIMO_OBJETO_JSON = 1024 * 1024
+
+
+def detectar_formato(nome_arquivo):
+    """'csv' or 'json' from the file extension, or None."""
+    extensao = nome_arquivo.rsplit('.', 1)[-1].lower() if '.' in (nome_arquivo or '') else ''
+    if extensao == 'csv':
+        return 'csv'
+    if extensao in ('json', 'ndjson', 'jsonl'):
+        return 'json'
+    return None
+
+
+def _linha_csv(row):
+    # Empty cells are left out, so optional columns fall back to their defaults
+    valores = {k.strip(): v.strip() for k, v in row.items() if k and v and v.strip()}
+    dados = {k: v for k, v in valores.items() if k not in ENDERECO_CAMPOS and not k.startswith(PREFIXO_COBRANCA)}
+    dados['endereco_residencial'] = {c: valores[c] for c in ENDERECO_CAMPOS if c in valores}
+    cobranca = {c: valores[PREFIXO_COBRANCA + c] for c in ENDERECO_CAMPOS if PREFIXO_COBRANCA + c in valores}
+    if cobranca:
+        dados['endereco_cobranca'] = cobranca
+    return dados
+
+
+def ler_csv(arquivo):
+    """Yield (line number, row) from a CSV text stream with a header line."""
+    reader = csv.DictReader(arquivo)
+    for row in reader:
+        yield reader.line_num, _linha_csv(row)
+
+
+def _truncado(exc, buffer):
+    # More input can only fix an error at the end of the buffer (a number or literal cut
+    # short, like '-Infinity', is reported where it starts) or a string that runs past it
+    return exc.pos >= len(buffer) - len('-Infinity') or exc.msg.startswith('Unterminated string')
+
+
+def _objeto_grande(posicao):
+    return ValueError(f"Objeto JSON {posicao} maior que {TAMANHO_MAXIMO_OBJETO_JSON} caracteres.")
+
+
+def ler_json(arquivo):
+    """
+    Yield (position, object) from a JSON array or NDJSON text stream, decoding one object
+    at a time. Raises ValueError if the file is not valid JSON or an object is longer than
+    TAMANHO_MAXIMO_OBJETO_JSON.
+    """
+    decoder = json.JSONDecoder()
+    buffer = arquivo.read(TAMANHO_BLOCO_JSON).lstrip()
+    if not buffer.startswith('['):
+        # NDJSON: complete the first, partially read line and go on line by line
+        linhas = itertools.chain(
+            (buffer + arquivo.readline(TAMANHO_MAXIMO_OBJETO_JSON)).splitlines(),
+            iter(lambda: arquivo.readline(TAMANHO_MAXIMO_OBJETO_JSON + 1), ''),
+        )
+        posicao = 0
+        for linha in linhas:
+            if linha.strip():
+                posicao += 1
+                if len(linha.rstrip('\r\n')) > TAMANHO_MAXIMO_OBJETO_JSON:
+                    raise _objeto_grande(posicao)
+                yield posicao, json.loads(linha)
+        return
+
+    pos, posicao = 1, 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buffer):
+            buffer, pos = arquivo.read(TAMANHO_BLOCO_JSON), 0
+            if not buffer:
+                raise ValueError("JSON incompleto: falta o ']' final.")
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            objeto, fim = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as exc:
+            if not _truncado(exc, buffer):
+                raise
+            # The object goes on in the next block
+            if len(buffer) - pos > TAMANHO_MAXIMO_OBJETO_JSON:
+                raise _objeto_grande(posicao + 1)
+            bloco = arquivo.read(TAMANHO_BLOCO_JSON)
+            if not bloco:
+                raise
+            buffer, pos = buffer[pos:] + bloco, 0
+            continue
+        posicao += 1
+        yield posicao, objeto
+        pos = fim
+        if pos > TAMANHO_BLOCO_JSON:
+            buffer, pos = buffer[pos:], 0
+
+
+def ler_arquivo(arquivo, formato):
+    """Yield (line or position, row data) from a text stream in `formato`."""
+    if formato == 'csv':
+        return ler_csv(arquivo)
+    if formato == 'json':
+        return ler_json(arquivo)
+    raise ValueError(f"Formato desconhecido: {formato!r}. Use um de: {', '.join(FORMATOS)}.")
+
+
+class ImportacaoPacientes:
+    """
+    Import rows of pacientes chunk by chunk. `importar()` returns the report:
+    total rows, rows imported, rows with errors and the errors of the first
+    PACIENTE_IMPORT_MAX_ERRORS of them as [{'linha': ..., 'erros': {field: [messages]}}].
+    """
+
+    def __init__(self, criado_por=None, tamanho_lote=None, max_erros=None):
+        self.criado_por = criado_por
+        self.tamanho_lote = tamanho_lote or settings.PACIENTE_IMPORT_BATCH_SIZE
+        self.max_erros = settings.PACIENTE_IMPORT_MAX_ERRORS if max_erros is None else max_erros
+        # One serializer validates every row: building its fields once per row would cost
+        # more than the validation itself.
+        self.serializer = PacienteImportSerializer()
+        self.total = 0
+        self.importados = 0
+        self.com_erro = 0
+        self.erros = []
+
+    def importar(self, linhas):
+        inicio = time.perf_counter()
+        linhas = iter(linhas)
+        while True:
+            lote = list(itertools.islice(linhas, self.tamanho_lote))
+            if not lote:
+                break
+            self.total += len(lote)
+            self._importar_lote(lote)
+        segundos = time.perf_counter() - inicio
+        return {
+            'total': self.total,
+            'importados': self.importados,
+            'com_erro': self.com_erro,
+            'erros': self.erros,
+            'segundos': round(segundos, 3),
+            'linhas_por_segundo': round(self.total / segundos) if segundos else None,
+        }
+
+    def _erro(self, linha, erros):
+        self.com_erro += 1
+        if len(self.erros) < self.max_erros:
+            self.erros.append({'linha': linha, 'erros': erros})
+
+    def _validar(self, lote):
+        validos = []
+        for linha, dados in lote:
+            try:
+                validos.append((linha, self.serializer.run_validation(dados)))
+            except serializers.ValidationError as exc:
+                self._erro(linha, exc.detail)
+        return validos
+
+    def _sem_duplicados(self, validos):
+        # One query for the CPFs and e-mails of the whole chunk already in the database;
+        # repeats within the chunk are caught by adding each accepted row to the same sets.
+        cpfs = {dados['cpf'] for _, dados in validos}
+        digitos = {normalize_cpf(cpf) for cpf in cpfs} - {None}
+        emails = {dados['email'] for _, dados in validos}
+        usados_cpf, usados_email = set(), set()
+        for cpf, cpf_digitos, email in Paciente.objects.filter(
+            Q(cpf__in=cpfs) | Q(cpf_digitos__in=digitos) | Q(email__in=emails)
+        ).values_list('cpf', 'cpf_digitos', 'email'):
+            usados_cpf.update((cpf, cpf_digitos))
+            usados_email.add(email)
+
+        aceitos = []
+        for linha, dados in validos:
+            cpf_digitos = normalize_cpf(dados['cpf'])
+            erros = {}
+            if dados['cpf'] in usados_cpf or (cpf_digitos and cpf_digitos in usados_cpf):
+                erros['cpf'] = ["Já existe um paciente com este CPF."]
+            if dados['email'] in usados_email:
+                erros['email'] = ["Já existe um paciente com este e-mail."]
+            if erros:
+                self._erro(linha, erros)
+                continue
+            usados_cpf.update((dados['cpf'], cpf_digitos))
+            usados_email.add(dados['email'])
+            aceitos.append((linha, dados))
+        return aceitos
+
+    def _montar(self, dados):
+        """Unsaved (paciente, its new addresses) for one validated row."""
+        dados = dict(dados)
+        residencial = Endereco(**dados.pop('endereco_residencial'))
+        enderecos = [residencial]
+        cobranca_dados = dados.pop('endereco_cobranca', None)
+        if dados.pop('repetir_endereco_cobranca', False):
+            cobranca = residencial
+        elif cobranca_dados:
+            cobranca = Endereco(**cobranca_dados)
+            enderecos.append(cobranca)
+        else:
+            cobranca = None
+        paciente = Paciente(
+            endereco_residencial=residencial, endereco_cobranca=cobranca, criado_por=self.criado_por, **dados
+        )
+        # bulk_create skips Paciente.save(), which keeps these in sync
+        paciente.cpf_digitos = normalize_cpf(paciente.cpf)
+        paciente.busca = build_search_document(paciente.nome, paciente.cpf, paciente.email)
+        paciente.whatsapp_e164 = normalize_phone(paciente.whatsapp)
+        paciente.celular_e164 = normalize_phone(paciente.celular)
+        return paciente, enderecos
+
+    def _importar_lote(self, lote):
+        aceitos = self._sem_duplicados(self._validar(lote))
+        if not aceitos:
+            return
+        try:
+            with transaction.atomic():
+                montados = [self._montar(dados) for _, dados in aceitos]
+                # The addresses get their PKs back from the INSERT, and bulk_create copies
+                # them to the pacientes' FK columns.
+                Endereco.objects.bulk_create([e for _, enderecos in montados for e in enderecos])
+                pacientes = Paciente.objects.bulk_create([paciente for paciente, _ in montados])
+                post_bulk_create.send(sender=Paciente, instances=pacientes)
+        except IntegrityError:
+            # A CPF or e-mail was taken after the duplicate check (a concurrent import or
+            # POST): save this chunk row by row to tell which rows are affected.
+            self._importar_linha_a_linha(aceitos)
+            return
+        self.importados += len(aceitos)
+
+    def _importar_linha_a_linha(self, aceitos):
+        for linha, dados in aceitos:
+            paciente, enderecos = self._montar(dados)
+            try:
+                with transaction.atomic():
+                    for endereco in enderecos:
+                        endereco.save()
+                    paciente.save()
+            except IntegrityError:
+                self._erro(linha, {'non_field_errors': ["Já existe um paciente com este CPF ou e-mail."]})
+            else:
+                self.importados += 1
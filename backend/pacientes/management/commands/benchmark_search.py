@@ -0,0 +1,92 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework import filters
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from pacientes.models import Endereco, Paciente
+from pacientes.search import PacienteSearchFilter, build_search_document
+from pacientes.views import PacienteViewSet
+
+FIRST_NAMES = ['José', 'Maria', 'João', 'Ana', 'Antônio', 'Francisca', 'Luís', 'Márcia', 'Sebastião', 'Lúcia']
+LAST_NAMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Conceição', 'Gonçalves', 'Araújo', 'Simões', 'Magalhães', 'Brandão']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare PacienteSearchFilter (search index) with DRF's SearchFilter (ILIKE) on a "
+        "synthetic set of pacientes. All rows are created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help='Number of synthetic pacientes.')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per search term.')
+        parser.add_argument('--page-size', type=int, default=50, help='Rows fetched per search, like one API page.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._seed(options['rows'])
+            results = self._run(options['repeat'], options['page_size'])
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'rows': options['rows'], 'results': results}, indent=2))
+            return
+        self.stdout.write(f"{options['rows']} pacientes, {options['repeat']} runs per term (ms)")
+        self.stdout.write(f"{'term':<14}{'backend':<12}{'p50':>9}{'p95':>9}{'matches':>9}")
+        for row in results:
+            self.stdout.write(
+                f"{row['term']:<14}{row['backend']:<12}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['matches']:>9}"
+            )
+
+    def _seed(self, rows):
+        rng = random.Random(42)
+        endereco = Endereco.objects.create(cep='00000-000', uf='SP', cidade='Benchmark', logradouro='Rua Benchmark', bairro='Centro')
+        batch = []
+        for i in range(rows):
+            nome = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}"
+            cpf = f"{i:011d}"
+            cpf = f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+            email = f"bench{i}@example.com"
+            batch.append(Paciente(
+                cpf=cpf, nome=nome, nascimento='1990-01-01', celular='11900000000', email=email,
+                endereco_residencial=endereco, busca=build_search_document(nome, cpf, email),
+            ))
+            if len(batch) == 1000:
+                Paciente.objects.bulk_create(batch)
+                batch = []
+        Paciente.objects.bulk_create(batch)
+
+    def _run(self, repeat, page_size):
+        factory = APIRequestFactory()
+        view = PacienteViewSet()
+        baseline, indexed = filters.SearchFilter(), PacienteSearchFilter()
+        terms = ['silva', 'conceicao', 'Conceição', 'magalhães bra', '00000012345', 'an']
+        results = []
+        for term in terms:
+            request = Request(factory.get('/api/pacientes/', {'search': term}))
+            for name, backend, ordering in (
+                ('SearchFilter', baseline, ('nome', 'id')),
+                ('indexed', indexed, ('-busca_rank', 'nome', 'id')),
+            ):
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    queryset = backend.filter_queryset(request, Paciente.objects.all(), view)
+                    page = list(queryset.order_by(*ordering)[:page_size])
+                    timings.append((time.perf_counter() - start) * 1000)
+                timings.sort()
+                results.append({
+                    'term': term,
+                    'backend': name,
+                    'p50_ms': statistics.median(timings),
+                    'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+                    'matches': len(page),
+                })
+        return results
@@ -0,0 +1,59 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pacientes.importacao import FORMATOS, ImportacaoPacientes, detectar_formato, ler_arquivo
+from usuarios.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Import pacientes from a CSV or JSON file (see pacientes.importacao for the layout), "
+        "in chunks with one bulk INSERT per table, and report the rows that were rejected."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help="File to import, or - for standard input.")
+        parser.add_argument('--formato', choices=FORMATOS, help='Defaults to the file extension.')
+        parser.add_argument('--lote', type=int, help='Rows per transaction (PACIENTE_IMPORT_BATCH_SIZE).')
+        parser.add_argument('--usuario', help='Username recorded as criado_por.')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or detectar_formato(options['arquivo'])
+        if formato is None:
+            raise CommandError(f"Use --formato ({', '.join(FORMATOS)}) for this file.")
+        criado_por = None
+        if options['usuario']:
+            try:
+                criado_por = CustomUser.objects.get(username=options['usuario'])
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"Usuário {options['usuario']!r} não encontrado.")
+
+        importacao = ImportacaoPacientes(criado_por=criado_por, tamanho_lote=options['lote'])
+        if options['arquivo'] == '-':
+            relatorio = self._importar(importacao, sys.stdin, formato)
+        else:
+            with open(options['arquivo'], encoding='utf-8-sig', newline='') as arquivo:
+                relatorio = self._importar(importacao, arquivo, formato)
+
+        if options['json']:
+            self.stdout.write(json.dumps(relatorio, indent=2, ensure_ascii=False))
+            return
+        for erro in relatorio['erros']:
+            self.stdout.write(f"line {erro['linha']}: {json.dumps(erro['erros'], ensure_ascii=False)}")
+        if relatorio['com_erro'] > len(relatorio['erros']):
+            self.stdout.write(f"... and {relatorio['com_erro'] - len(relatorio['erros'])} more rejected rows")
+        self.stdout.write(
+            f"{relatorio['importados']} of {relatorio['total']} pacientes imported in {relatorio['segundos']:.1f} s "
+            f"({relatorio['linhas_por_segundo'] or 0} rows/s), {relatorio['com_erro']} rejected"
+        )
+
+    def _importar(self, importacao, arquivo, formato):
+        try:
+            return importacao.importar(ler_arquivo(arquivo, formato))
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise CommandError(
+                f"Arquivo inválido: {exc} ({importacao.importados} pacientes já importados)"
+            )
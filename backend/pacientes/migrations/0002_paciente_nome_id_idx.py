@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['nome', 'id'], name='paciente_nome_id_idx'),
+        ),
+    ]
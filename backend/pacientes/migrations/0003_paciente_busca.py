@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:37
+
+from django.db import migrations, models
+
+from pacientes.search import FTS_TABLE, build_search_document, ensure_sqlite_search_index
+
+BATCH_SIZE = 2000
+
+
+def backfill_busca(apps, schema_editor):
+    Paciente = apps.get_model('pacientes', 'Paciente')
+    last_id = 0
+    while True:
+        batch = list(
+            Paciente.objects.filter(id__gt=last_id).order_by('id').only('id', 'nome', 'cpf', 'email')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for paciente in batch:
+            paciente.busca = build_search_document(paciente.nome, paciente.cpf, paciente.email)
+        Paciente.objects.bulk_update(batch, ['busca'])
+        last_id = batch[-1].id
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX paciente_busca_trgm_idx ON pacientes_paciente USING gin (busca gin_trgm_ops)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX paciente_busca_prefix_idx ON pacientes_paciente (busca text_pattern_ops)'
+        )
+    elif vendor == 'sqlite':
+        ensure_sqlite_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS paciente_busca_prefix_idx')
+        schema_editor.execute('DROP INDEX IF EXISTS paciente_busca_trgm_idx')
+    elif vendor == 'sqlite':
+        for trigger in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0002_paciente_nome_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='busca',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill_busca, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
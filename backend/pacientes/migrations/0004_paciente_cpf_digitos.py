@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:40
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def normalize_cpf(value):
+    # Frozen copy of pacientes.models.normalize_cpf as of this migration
+    digits = ''.join(filter(str.isdigit, value or ''))
+    return digits or None
+
+
+def backfill_cpf_digitos(apps, schema_editor):
+    """
+    Fill cpf_digitos in batches. If two existing rows turn out to be the same CPF typed
+    differently, the migration stops (and is rolled back) listing them: they must be
+    merged by hand first, since the unique index of 0005 could not hold them and
+    Paciente.save() would fail on every later save of the duplicates.
+    """
+    Paciente = apps.get_model('pacientes', 'Paciente')
+    first_id = {}
+    duplicates = {}
+    last_id = 0
+    while True:
+        batch = list(Paciente.objects.filter(id__gt=last_id).order_by('id').only('id', 'cpf')[:BATCH_SIZE])
+        if not batch:
+            break
+        for paciente in batch:
+            digits = normalize_cpf(paciente.cpf)
+            if digits in first_id:
+                duplicates.setdefault(digits, [first_id[digits]]).append(paciente.id)
+            elif digits:
+                first_id[digits] = paciente.id
+            paciente.cpf_digitos = digits
+        if not duplicates:
+            Paciente.objects.bulk_update(batch, ['cpf_digitos'])
+        last_id = batch[-1].id
+    if duplicates:
+        grupos = '; '.join(f"{digits}: {ids}" for digits, ids in sorted(duplicates.items()))
+        raise RuntimeError(
+            f"Pacientes with the same CPF typed differently (CPF digits: paciente ids): {grupos}. "
+            "Merge them, then run the migration again."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0003_paciente_busca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='cpf_digitos',
+            field=models.CharField(editable=False, max_length=14, null=True),
+        ),
+        migrations.RunPython(backfill_cpf_digitos, migrations.RunPython.noop),
+    ]
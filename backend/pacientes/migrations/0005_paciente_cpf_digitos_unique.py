@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0004_paciente_cpf_digitos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paciente',
+            name='cpf_digitos',
+            field=models.CharField(editable=False, max_length=14, null=True, unique=True),
+        ),
+    ]
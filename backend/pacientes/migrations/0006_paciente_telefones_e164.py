@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def normalize_phone(value):
+    # Frozen copy of pacientes.models.normalize_phone as of this migration
+    value = (value or '').strip()
+    digits = ''.join(filter(str.isdigit, value))
+    if not value.startswith('+'):
+        digits = digits.lstrip('0')
+        if len(digits) in (10, 11):
+            digits = '55' + digits
+        elif not (digits.startswith('55') and len(digits) in (12, 13)):
+            return None
+    if not 8 <= len(digits) <= 15:
+        return None
+    return '+' + digits
+
+
+def backfill_telefones_e164(apps, schema_editor):
+    Paciente = apps.get_model('pacientes', 'Paciente')
+    last_id = 0
+    while True:
+        batch = list(
+            Paciente.objects.filter(id__gt=last_id).order_by('id').only('id', 'whatsapp', 'celular')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for paciente in batch:
+            paciente.whatsapp_e164 = normalize_phone(paciente.whatsapp)
+            paciente.celular_e164 = normalize_phone(paciente.celular)
+        Paciente.objects.bulk_update(batch, ['whatsapp_e164', 'celular_e164'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0005_paciente_cpf_digitos_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='celular_e164',
+            field=models.CharField(editable=False, max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='whatsapp_e164',
+            field=models.CharField(editable=False, max_length=16, null=True),
+        ),
+        migrations.RunPython(backfill_telefones_e164, migrations.RunPython.noop),
+        # Indexed after the backfill, so the UPDATEs do not maintain them
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['whatsapp_e164'], name='paciente_whatsapp_e164_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['celular_e164'], name='paciente_celular_e164_idx'),
+        ),
+    ]
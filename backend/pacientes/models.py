@@ -1,6 +1,35 @@
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 from django.conf import settings # To link to CustomUser for audit fields
 from usuarios.models import CustomUser # Explicit import for clarity
+from .search import build_search_document
+
+def normalize_cpf(value):
+    """Digits-only form of a CPF ("123.456.789-00" -> "12345678900"), or None if it has no digits."""
+    digits = ''.join(filter(str.isdigit, value or ''))
+    return digits or None
+
+# Country code assumed for numbers typed without one
+DDI_PADRAO = '55'
+
+def normalize_phone(value):
+    """
+    E.164 form of a phone number ("(11) 98888-7777" -> "+5511988887777"), or None if it
+    cannot be told apart. A number with a leading '+' keeps its country code; one with a
+    DDD (10 or 11 digits, after any leading zeros) gets DDI_PADRAO.
+    """
+    value = (value or '').strip()
+    digits = ''.join(filter(str.isdigit, value))
+    if not value.startswith('+'):
+        digits = digits.lstrip('0') # Trunk (0 + DDD) and international (00) prefixes
+        if len(digits) in (10, 11):
+            digits = DDI_PADRAO + digits
+        elif not (digits.startswith(DDI_PADRAO) and len(digits) in (12, 13)):
+            return None
+    if not 8 <= len(digits) <= 15:
+        return None
+    return '+' + digits
 
 # It's good practice to have a base model for audit fields
 class TimeStampedModel(models.Model):
@@ -37,6 +66,9 @@ class Endereco(models.Model): # Not inheriting TimeStampedModel as it's part of
 
 class Paciente(TimeStampedModel):
     cpf = models.CharField(max_length=14, unique=True) # Formato XXX.XXX.XXX-XX
+    # Digits-only CPF, kept in sync on save. Its unique index catches the same CPF typed
+    # with and without punctuation and serves the exact lookup at /pacientes/by-cpf/<digits>/.
+    cpf_digitos = models.CharField(max_length=14, unique=True, null=True, editable=False)
     nome = models.CharField(max_length=255)
     nascimento = models.DateField()
 
@@ -56,8 +88,24 @@ class Paciente(TimeStampedModel):
 
     whatsapp = models.CharField(max_length=20, blank=True) # e.g., +55119XXXXXXXX
     celular = models.CharField(max_length=20) # Obrigatório
+    # E.164 forms of the two numbers, kept in sync on save. They render the WhatsApp link
+    # and serve the lookup at /pacientes/by-phone/<number>/ (e.g. the sender of a message).
+    whatsapp_e164 = models.CharField(max_length=16, null=True, editable=False)
+    celular_e164 = models.CharField(max_length=16, null=True, editable=False)
     email = models.EmailField(unique=True)
 
+    # Accent-folded nome/cpf/email, kept up to date on save and indexed for search
+    # (pg_trgm GIN on PostgreSQL, FTS5 shadow table on SQLite; see pacientes.search).
+    busca = models.TextField(blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            # Backs the default list ordering and its keyset pagination
+            models.Index(fields=['nome', 'id'], name='paciente_nome_id_idx'),
+            models.Index(fields=['whatsapp_e164'], name='paciente_whatsapp_e164_idx'),
+            models.Index(fields=['celular_e164'], name='paciente_celular_e164_idx'),
+        ]
+
     def __str__(self):
         return self.nome
 
@@ -72,4 +120,26 @@ class Paciente(TimeStampedModel):
         # to the billing address fields OR we handle it here by creating a new Endereco instance.
         # For now, the model allows endereco_cobranca to be null, or point to a different Endereco.
         # If it should be a distinct copy, the creation logic is in the serializer/view.
+        self.cpf_digitos = normalize_cpf(self.cpf)
+        self.busca = build_search_document(self.nome, self.cpf, self.email)
+        self.whatsapp_e164 = normalize_phone(self.whatsapp)
+        self.celular_e164 = normalize_phone(self.celular)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'nome', 'cpf', 'email'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'cpf_digitos', 'busca'}
+        if update_fields is not None and {'whatsapp', 'celular'} & set(kwargs['update_fields']):
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'whatsapp_e164', 'celular_e164'}
         super().save(*args, **kwargs)
+
+
+def tocar_pacientes_do_endereco(sender, instance, created, raw=False, **kwargs):
+    """
+    post_save receiver for Endereco: an address edited on its own (e.g. through an
+    agendamento) changes how its pacientes are rendered, so their atualizado_em, which
+    the conditional GET validators rely on, moves too.
+    """
+    if created or raw:
+        return
+    Paciente.objects.filter(
+        Q(endereco_residencial=instance) | Q(endereco_cobranca=instance)
+    ).update(atualizado_em=timezone.now())
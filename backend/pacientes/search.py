@@ -0,0 +1,171 @@
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+# Name of the SQLite FTS5 shadow table kept in sync with pacientes_paciente by triggers
+# (see migration 0003_paciente_busca). On PostgreSQL the same column is covered by a
+# pg_trgm GIN index instead.
+FTS_TABLE = 'pacientes_paciente_busca'
+
+# Trigram indexes cannot help with terms shorter than a trigram.
+MIN_TRIGRAM_TERM = 3
+
+
+def fold_text(value):
+    """
+    Lowercase `value` and strip its accents, so "José" and "jose" compare equal.
+    """
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(value))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+def build_search_document(nome, cpf, email):
+    """
+    Build the text stored in Paciente.busca: folded name, CPF as typed and as digits, and e-mail.
+    """
+    cpf = cpf or ''
+    cpf_digits = ''.join(filter(str.isdigit, cpf))
+    return ' '.join(part for part in (fold_text(nome), cpf, cpf_digits, fold_text(email)) if part)
+
+
+_SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_ai': (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON pacientes_paciente BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, busca) VALUES (new.id, new.busca); END"
+    ),
+    f'{FTS_TABLE}_ad': (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON pacientes_paciente BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, busca) VALUES ('delete', old.id, old.busca); END"
+    ),
+    f'{FTS_TABLE}_au': (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF busca ON pacientes_paciente BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, busca) VALUES ('delete', old.id, old.busca); "
+        f"INSERT INTO {FTS_TABLE}(rowid, busca) VALUES (new.id, new.busca); END"
+    ),
+}
+
+
+def ensure_sqlite_search_index(conn):
+    """
+    Create the FTS5 shadow table and its sync triggers on SQLite if they are missing.
+
+    SQLite drops triggers whenever Django rebuilds pacientes_paciente during a migration,
+    so this runs after every migrate (see PacientesConfig.ready) and rebuilds the index
+    when triggers had to be recreated.
+    """
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        if 'pacientes_paciente' not in conn.introspection.table_names(cursor):
+            return
+        columns = {col.name for col in conn.introspection.get_table_description(cursor, 'pacientes_paciente')}
+        if 'busca' not in columns:
+            return
+        names = [FTS_TABLE, *_SQLITE_TRIGGERS]
+        cursor.execute(
+            f"SELECT name FROM sqlite_master WHERE name IN ({', '.join(['%s'] * len(names))})", names
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if FTS_TABLE not in existing:
+            # External-content table: the text lives in pacientes_paciente.busca and the
+            # virtual table only holds the trigram index.
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                f"busca, content='pacientes_paciente', content_rowid='id', tokenize='trigram')"
+            )
+        missing = [sql for name, sql in _SQLITE_TRIGGERS.items() if name not in existing]
+        for sql in missing:
+            cursor.execute(sql)
+        if missing:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def _fts_available():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def search_pacientes(queryset, term):
+    """
+    Filter `queryset` to pacientes matching `term` using the search index of the current
+    database, annotating each row with `busca_rank` (higher is more similar): trigram
+    word similarity on PostgreSQL, how early the term appears on SQLite.
+
+    The index is only asked for PACIENTE_SEARCH_MAX_CANDIDATES rows, so a very common
+    term costs the same as a rare one; ranking happens within those candidates.
+    """
+    term = fold_text(term)
+    if not term:
+        return queryset
+    max_candidates = settings.PACIENTE_SEARCH_MAX_CANDIDATES
+
+    if len(term) < MIN_TRIGRAM_TERM:
+        # Too short for trigrams: match the beginning of the name instead.
+        return queryset.filter(busca__startswith=term).annotate(
+            busca_rank=Value(1.0, output_field=FloatField())
+        )
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        candidates = RawSQL(
+            'SELECT id FROM pacientes_paciente WHERE busca LIKE %s LIMIT %s',
+            ['%' + _escape_like(term) + '%', max_candidates],
+        )
+        # Cast to double precision so the rank round-trips exactly through the cursor.
+        return queryset.filter(id__in=candidates).annotate(
+            busca_rank=Cast(TrigramWordSimilarity(Value(term), 'busca'), FloatField())
+        )
+
+    if connection.vendor == 'sqlite' and _fts_available():
+        match = '"' + term.replace('"', '""') + '"'
+        candidates = RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s',
+            [match, max_candidates],
+        )
+        # Rank by how early the term appears in the document (the name comes first).
+        rank = RawSQL(
+            'CAST(1.0 / instr(pacientes_paciente.busca, %s) AS REAL)', [term], output_field=FloatField()
+        )
+        return queryset.filter(id__in=candidates).annotate(busca_rank=rank)
+
+    # No index available for this database, fall back to a plain substring match.
+    return queryset.filter(busca__contains=term).annotate(
+        busca_rank=Value(1.0, output_field=FloatField())
+    )
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class PacienteSearchFilter(filters.SearchFilter):
+    """
+    Indexed, accent-insensitive replacement for SearchFilter on PacienteViewSet.
+
+    Uses the same `?search=` parameter. Matches are ordered by similarity unless the
+    client asks for an explicit `?ordering=`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        term = ' '.join(self.get_search_terms(request))
+        if not term:
+            return queryset
+        return search_pacientes(queryset, term)
+
+    def get_ordering(self, request, queryset, view):
+        # Picked up by KeysetCursorPagination so results page by rank.
+        if not self.get_search_terms(request):
+            return None
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            return None
+        return ('-busca_rank', 'nome', 'id')
@@ -1,6 +1,7 @@
 from rest_framework import serializers
-from .models import Endereco, Paciente
+from .models import Endereco, Paciente, normalize_cpf
 from django.db import transaction
+from core.fieldsets import SparseFieldsetSerializerMixin
 
 class EnderecoSerializer(serializers.ModelSerializer):
     class Meta:
@@ -26,7 +27,7 @@ class EnderecoSerializer(serializers.ModelSerializer):
             validated_data['uf'] = "MK"
         return super().create(validated_data)
 
-class PacienteSerializer(serializers.ModelSerializer):
+class PacienteSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     endereco_residencial = EnderecoSerializer()
     endereco_cobranca = EnderecoSerializer(required=False, allow_null=True)
     whatsapp_link = serializers.SerializerMethodField()
@@ -45,22 +46,16 @@ class PacienteSerializer(serializers.ModelSerializer):
             'criado_em', 'atualizado_em', 'criado_por', 'modificado_por'
         ]
         read_only_fields = ['criado_em', 'atualizado_em', 'criado_por', 'modificado_por']
+        # What the patient list shows, the default of the list action (see core.fieldsets)
+        list_fields = ['id', 'nome', 'cpf', 'celular', 'whatsapp', 'whatsapp_link']
+        field_sources = {'whatsapp_link': ['whatsapp_e164']}
 
     # Virtual field to control address repetition
     repetir_endereco_cobranca = serializers.BooleanField(write_only=True, required=False, default=False)
 
     def get_whatsapp_link(self, obj):
-        if obj.whatsapp:
-            # Remove non-digits and add country code if missing (assuming Brazil +55)
-            phone = ''.join(filter(str.isdigit, obj.whatsapp))
-            if not phone.startswith('55') and len(phone) >= 10: # Basic check
-                 # This logic might need refinement based on common input formats
-                if len(phone) == 11: # Common mobile format like 119XXXXXXXX
-                    phone = '55' + phone
-                elif len(phone) == 10: # Common fixed line like 11XXXXXXXX
-                     phone = '55' + phone # Or add DDD if it's missing
-            return f"https://wa.me/{phone}"
-        return None
+        # whatsapp_e164 is normalized on save (see pacientes.models.normalize_phone)
+        return f"https://wa.me/{obj.whatsapp_e164[1:]}" if obj.whatsapp_e164 else None
 
     # Mock city filtering based on UF
     # def get_cidade_choices(self, obj):
@@ -82,9 +77,13 @@ class PacienteSerializer(serializers.ModelSerializer):
             # raise serializers.ValidationError("CPF deve conter 11 dígitos.")
             pass # Allowing flexibility for now
 
-        # Check uniqueness, DRF UniqueValidator handles this if field is unique=True
-        # but if we clean the CPF, we might need explicit check if format varies
-        # For now, assuming model's unique=True is sufficient with raw input.
+        # DRF's UniqueValidator only compares the raw input, so "123.456.789-00" and
+        # "12345678900" would both pass. Check the normalized digits (unique index probe).
+        duplicates = Paciente.objects.filter(cpf_digitos=normalize_cpf(value))
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if cleaned_cpf and duplicates.exists():
+            raise serializers.ValidationError("Já existe um paciente com este CPF.")
         return value
 
     def create(self, validated_data):
@@ -181,3 +180,22 @@ class PacienteSerializer(serializers.ModelSerializer):
 
             instance.save()
             return instance
+
+
+class PacienteImportSerializer(serializers.ModelSerializer):
+    """
+    One row of a bulk import (see pacientes.importacao). Only validates: the importer saves
+    the rows with bulk_create and checks CPF and e-mail uniqueness once per chunk, so the
+    per-row unique validators are dropped.
+    """
+    endereco_residencial = EnderecoSerializer()
+    endereco_cobranca = EnderecoSerializer(required=False, allow_null=True)
+    repetir_endereco_cobranca = serializers.BooleanField(required=False, default=False)
+
+    class Meta:
+        model = Paciente
+        fields = [
+            'cpf', 'nome', 'nascimento', 'endereco_residencial', 'endereco_cobranca',
+            'repetir_endereco_cobranca', 'whatsapp', 'celular', 'email',
+        ]
+        extra_kwargs = {'cpf': {'validators': []}, 'email': {'validators': []}}
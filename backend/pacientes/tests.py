@@ -1,9 +1,20 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import http_date
 from rest_framework import status
 from rest_framework.test import APITestCase
-from .models import Paciente, Endereco
+from . import importacao
+from .models import Paciente, Endereco, normalize_phone
+from core.pagination import KeysetCursorPagination
 from usuarios.models import CustomUser, UserRole
+import base64
 import datetime
+import io
+import json
+import time
+from unittest import mock
 
 class PacienteAPITests(APITestCase):
     @classmethod
@@ -113,10 +124,10 @@ class PacienteAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Ensure there are enough patients to test ordering
-        self.assertTrue(len(response.data) >= 2)
+        self.assertTrue(len(response.data['results']) >= 2)
 
         # Extract names from response data
-        names = [p['nome'] for p in response.data]
+        names = [p['nome'] for p in response.data['results']]
         # Check if 'Alpha' comes before 'Zulu' in the list
         # This depends on the number of pre-existing patients and their names.
         # A more robust test would be to ensure the list is sorted.
@@ -124,3 +135,339 @@ class PacienteAPITests(APITestCase):
         # If specifically want to check Alpha then Zulu (assuming these are the only two or first two after sorting)
         if 'Alpha' in names and 'Zulu' in names:
              self.assertLess(names.index('Alpha'), names.index('Zulu'))
+
+    def test_list_pacientes_keyset_pagination(self):
+        # Duplicate names make sure the 'id' tie-breaker is part of the cursor
+        for i, nome in enumerate(['Beta', 'Alpha', 'Beta', 'Gama', 'Beta']):
+            Paciente.objects.create(cpf=f'000.000.000-0{i}', nome=nome, nascimento='2000-01-01', celular='11900000000', email=f'pag{i}@example.com', endereco_residencial=self.endereco1)
+        expected = list(Paciente.objects.order_by('nome', 'id').values_list('id', flat=True))
+
+        seen = []
+        url = f"{self.paciente_url}?page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(p['id'] for p in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+        # Walking back from the last page returns the previous one
+        response = self.client.get(f"{self.paciente_url}?page_size=2")
+        second = self.client.get(response.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual([p['id'] for p in back.data['results']], expected[:2])
+
+    def test_list_pacientes_page_size_is_capped(self):
+        for i in range(3):
+            Paciente.objects.create(cpf=f'000.000.001-0{i}', nome=f'Cap {i}', nascimento='2000-01-01', celular='11900000000', email=f'cap{i}@example.com', endereco_residencial=self.endereco1)
+        with mock.patch.object(KeysetCursorPagination, 'max_page_size', 2):
+            response = self.client.get(f"{self.paciente_url}?page_size=100000")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_list_pacientes_invalid_cursor(self):
+        cursor = base64.b64encode(b'p=not-json').decode('ascii')
+        response = self.client.get(self.paciente_url, {'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search_is_accent_insensitive_and_ranked(self):
+        Paciente.objects.create(cpf='123.456.789-00', nome='José Antônio', nascimento='1980-01-01', celular='11900000000', email='jose@example.com', endereco_residencial=self.endereco1)
+        Paciente.objects.create(cpf='123.456.789-01', nome='Maria Josefina Jose', nascimento='1980-01-01', celular='11900000000', email='maria@example.com', endereco_residencial=self.endereco1)
+        Paciente.objects.create(cpf='123.456.789-02', nome='Carlos', nascimento='1980-01-01', celular='11900000000', email='carlos@example.com', endereco_residencial=self.endereco1)
+
+        response = self.client.get(self.paciente_url, {'search': 'jose'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [p['nome'] for p in response.data['results']]
+        self.assertCountEqual(names, ['José Antônio', 'Maria Josefina Jose'])
+
+        # Ranked results page through the same keyset cursor
+        paged = []
+        url = f"{self.paciente_url}?search=jose&page_size=1"
+        while url:
+            page = self.client.get(url)
+            paged.extend(p['nome'] for p in page.data['results'])
+            url = page.data['next']
+        self.assertEqual(paged, names)
+
+        response = self.client.get(self.paciente_url, {'search': 'ANTÓNIO'})
+        self.assertEqual([p['nome'] for p in response.data['results']], ['José Antônio'])
+
+        # CPF can be searched with or without punctuation
+        response = self.client.get(self.paciente_url, {'search': '12345678902'})
+        self.assertEqual([p['nome'] for p in response.data['results']], ['Carlos'])
+
+    def test_search_index_follows_updates_and_deletes(self):
+        paciente = Paciente.objects.create(cpf='123.456.789-03', nome='Renata', nascimento='1980-01-01', celular='11900000000', email='renata@example.com', endereco_residencial=self.endereco1)
+        paciente.nome = 'Renata Gonçalves'
+        paciente.save()
+        response = self.client.get(self.paciente_url, {'search': 'goncalves'})
+        self.assertEqual([p['id'] for p in response.data['results']], [paciente.id])
+
+        paciente.delete()
+        response = self.client.get(self.paciente_url, {'search': 'goncalves'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_cpf_digitos_kept_in_sync_and_unique(self):
+        paciente = Paciente.objects.create(cpf='321.654.987-00', nome='Paciente CPF', nascimento='1990-01-01', celular='11900000000', email='cpf@example.com', endereco_residencial=self.endereco1)
+        self.assertEqual(paciente.cpf_digitos, '32165498700')
+
+        paciente_data = {
+            'cpf': '32165498700', # Same CPF without punctuation
+            'nome': 'Outro Paciente',
+            'nascimento': '1990-01-01',
+            'celular': '11900000000',
+            'email': 'outro.cpf@example.com',
+            'endereco_residencial': self.endereco_data1,
+        }
+        response = self.client.post(self.paciente_url, paciente_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('cpf', response.data)
+
+    def test_lookup_paciente_by_cpf(self):
+        paciente = Paciente.objects.create(cpf='321.654.987-11', nome='Paciente Balcão', nascimento='1990-01-01', celular='11900000000', email='balcao@example.com', endereco_residencial=self.endereco1)
+        url = reverse('paciente-by-cpf', kwargs={'digits': '32165498711'})
+        with self.assertNumQueries(1): # Index probe on cpf_digitos, addresses joined
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], paciente.id)
+
+        response = self.client.get(reverse('paciente-by-cpf', kwargs={'digits': '99999999999'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_lookup_paciente_by_phone(self):
+        self.assertEqual(normalize_phone('(11) 98888-7777'), '+5511988887777')
+        self.assertEqual(normalize_phone('0 11 3333-4444'), '+551133334444')
+        self.assertEqual(normalize_phone('55 11 98888-7777'), '+5511988887777')
+        self.assertEqual(normalize_phone('+1 212 555 0100'), '+12125550100')
+        self.assertIsNone(normalize_phone('98888-7777')) # No DDD
+        self.assertIsNone(normalize_phone(''))
+
+        paciente = Paciente.objects.create(cpf='321.654.987-12', nome='Paciente Zap', nascimento='1990-01-01', celular='(11) 3333-4444', whatsapp='11 98888-7777', email='zap@example.com', endereco_residencial=self.endereco1)
+        self.assertEqual((paciente.whatsapp_e164, paciente.celular_e164), ('+5511988887777', '+551133334444'))
+        paciente.whatsapp = '21 97777-6666'
+        paciente.save(update_fields=['whatsapp'])
+        paciente.refresh_from_db()
+        self.assertEqual(paciente.whatsapp_e164, '+5521977776666')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('paciente-by-phone', kwargs={'numero': '5521977776666'}))
+        self.assertEqual([p['id'] for p in response.data], [paciente.id])
+        self.assertEqual(response.data[0]['whatsapp_link'], 'https://wa.me/5521977776666')
+        response = self.client.get(reverse('paciente-by-phone', kwargs={'numero': '+551133334444'}))
+        self.assertEqual([p['id'] for p in response.data], [paciente.id]) # The mobile column too
+        self.assertEqual(self.client.get(reverse('paciente-by-phone', kwargs={'numero': '1133335555'})).data, [])
+        response = self.client.get(reverse('paciente-by-phone', kwargs={'numero': '123'}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def _create_pacientes_with_addresses(self, count, prefix):
+        for i in range(count):
+            cobranca = Endereco.objects.create(**{**self.endereco_data1, 'logradouro': f'Rua Cobrança {i}'})
+            Paciente.objects.create(
+                cpf=f'{prefix}.000.000-{i:02d}', nome=f'Paciente {prefix} {i}', nascimento='1990-01-01',
+                celular='11900000000', email=f'{prefix}.{i}@example.com', endereco_residencial=self.endereco1,
+                endereco_cobranca=cobranca, criado_por=self.secretaria_user, modificado_por=self.profissional_user,
+            )
+
+    def test_list_pacientes_constant_number_of_queries(self):
+        self._create_pacientes_with_addresses(2, '555')
+        with self.assertNumQueries(2): # ETag fingerprint, then the page
+            response = self.client.get(self.paciente_url)
+        self.assertEqual(len(response.data['results']), 2)
+
+        self._create_pacientes_with_addresses(10, '666')
+        with self.assertNumQueries(2):
+            response = self.client.get(self.paciente_url, {'page_size': 12, 'omit': 'whatsapp_link'})
+        self.assertEqual(len(response.data['results']), 12)
+        self.assertIsNotNone(response.data['results'][0]['endereco_cobranca'])
+
+    def test_retrieve_paciente_single_query(self):
+        self._create_pacientes_with_addresses(1, '777')
+        paciente = Paciente.objects.get(cpf='777.000.000-00')
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('paciente-detail', kwargs={'pk': paciente.pk}))
+        self.assertEqual(response.data['endereco_cobranca']['logradouro'], 'Rua Cobrança 0')
+        self.assertEqual(response.data['criado_por'], self.secretaria_user.pk)
+
+    def test_conditional_get(self):
+        self._create_pacientes_with_addresses(2, '888')
+        paciente = Paciente.objects.get(cpf='888.000.000-00')
+        detail_url = reverse('paciente-detail', kwargs={'pk': paciente.pk})
+
+        response = self.client.get(detail_url)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        with self.assertNumQueries(1): # The object only, no serialization
+            response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        list_etag = self.client.get(self.paciente_url)['ETag']
+        with self.assertNumQueries(1): # The fingerprint only
+            response = self.client.get(self.paciente_url, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        list_etag = self.client.get(self.paciente_url, {'search': '888'})['ETag']
+        response = self.client.get(self.paciente_url, {'search': '888'}, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotEqual(self.client.get(self.paciente_url)['ETag'], list_etag) # Other filters
+
+        # Editing the address alone is a change of the paciente too
+        paciente.endereco_cobranca.numero = '999'
+        paciente.endereco_cobranca.save()
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['endereco_cobranca']['numero'], '999')
+        response = self.client.get(self.paciente_url, {'search': '888'}, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # So is a deletion, which moves no timestamp: lists are validated by their ETag only
+        list_etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+        Paciente.objects.get(cpf='888.000.000-01').delete()
+        response = self.client.get(self.paciente_url, {'search': '888'}, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(len(response.data['results']), 1)
+        response = self.client.get(
+            self.paciente_url, {'search': '888'}, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60),
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_sparse_fieldsets(self):
+        self._create_pacientes_with_addresses(2, '999')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.paciente_url)
+        # Compact list by default: no addresses, so no joins and no address columns read
+        self.assertEqual(list(response.data['results'][0]), ['id', 'cpf', 'nome', 'whatsapp', 'celular', 'whatsapp_link'])
+        self.assertNotIn('JOIN', queries[-1]['sql'])
+        self.assertNotIn('"email"', queries[-1]['sql'])
+
+        response = self.client.get(self.paciente_url, {'fields': 'nome,endereco_cobranca'})
+        self.assertEqual(list(response.data['results'][0]), ['nome', 'endereco_cobranca'])
+        self.assertEqual(response.data['results'][0]['endereco_cobranca']['logradouro'], 'Rua Cobrança 0')
+
+        paciente = Paciente.objects.get(cpf='999.000.000-00')
+        response = self.client.get(reverse('paciente-detail', kwargs={'pk': paciente.pk}), {'omit': 'endereco_residencial,endereco_cobranca'})
+        self.assertNotIn('endereco_residencial', response.data)
+        self.assertEqual(response.data['email'], paciente.email)
+
+        response = self.client.get(self.paciente_url, {'fields': 'nome,senha'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('senha', response.data['fields'][0])
+
+    def test_export_pacientes_follows_search_ranking(self):
+        for i, nome in enumerate(['Outro Exporta', 'Exporta Dois', 'Exporta Um', 'Nada']):
+            Paciente.objects.create(
+                cpf=f'321.000.000-{i:02d}', nome=nome, nascimento='1990-01-01', celular='11900000000',
+                email=f'exp{i}@example.com', endereco_residencial=self.endereco1,
+            )
+        response = self.client.get(reverse('paciente-exportar'), {'search': 'exporta', 'campos': 'nome,cidade'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        linhas = b''.join(response.streaming_content).decode().splitlines()
+        # Names starting with the term rank first, as in the list endpoint
+        self.assertEqual(linhas, ['nome,cidade', 'Exporta Dois,Cidade Teste1', 'Exporta Um,Cidade Teste1', 'Outro Exporta,Cidade Teste1'])
+
+    def test_export_csv_escapes_formulas(self):
+        for i, nome in enumerate(['=HYPERLINK("http://x")', '@SUM(A1)', 'Exporta-Hifen']):
+            Paciente.objects.create(
+                cpf=f'322.000.000-{i:02d}', nome=nome, nascimento='1990-01-01', celular='11900000000',
+                email=f'formula{i}@example.com', endereco_residencial=self.endereco1,
+            )
+        url = reverse('paciente-exportar')
+        response = self.client.get(url, {'search': '322.000.000', 'campos': 'nome'})
+        linhas = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(sorted(linhas[1:]), ['"\'=HYPERLINK(""http://x"")"', "'@SUM(A1)", 'Exporta-Hifen'])
+        # NDJSON is data, not a spreadsheet: left as is
+        response = self.client.get(url, {'search': '322.000.000', 'campos': 'nome', 'formato': 'ndjson'})
+        nomes = [json.loads(linha)['nome'] for linha in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertIn('@SUM(A1)', nomes)
+
+
+class PacienteImportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.secretaria_user = CustomUser.objects.create_user(username='importsecretaria', password='password', role=UserRole.SECRETARIA)
+        endereco = Endereco.objects.create(cep='12345-001', uf='SP', cidade='Cidade', logradouro='Rua', bairro='Bairro')
+        Paciente.objects.create(
+            cpf='999.999.999-99', nome='Existente', nascimento='1990-01-01', celular='11900000000',
+            email='existente@example.com', endereco_residencial=endereco,
+        )
+        cls.importar_url = reverse('paciente-importar')
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.secretaria_user)
+
+    def _upload(self, nome, conteudo, **extra):
+        arquivo = SimpleUploadedFile(nome, conteudo.encode('utf-8'))
+        return self.client.post(self.importar_url, {'arquivo': arquivo, **extra}, format='multipart')
+
+    def test_import_csv_in_chunks_with_error_report(self):
+        linhas = [
+            'cpf,nome,nascimento,celular,email,cep,uf,cidade,logradouro,bairro,repetir_endereco_cobranca,cobranca_cep,cobranca_uf,cobranca_cidade,cobranca_logradouro,cobranca_bairro',
+            '111.111.111-11,José Importado,1980-05-01,11911111111,jose@example.com,01000-000,SP,São Paulo,Rua A,Centro,true,,,,,',
+            '222.222.222-22,Maria,1981-05-01,11922222222,maria@example.com,01000-000,SP,São Paulo,Rua B,Centro,,20000-000,RJ,Rio,Rua C,Centro',
+            '99999999999,Repetido no banco,1982-05-01,11933333333,outro@example.com,01000-000,SP,São Paulo,Rua D,Centro,,,,,,',
+            '11111111111,Repetido no arquivo,1983-05-01,11944444444,novo@example.com,01000-000,SP,São Paulo,Rua E,Centro,,,,,,',
+            '333.333.333-33,Sem data,,11955555555,nao-e-email,01000-000,SP,São Paulo,Rua F,Centro,,,,,,',
+            '444.444.444-44,Ana,1984-05-01,11966666666,ana@example.com,01000-000,SP,São Paulo,Rua G,Centro,,,,,,',
+        ]
+        # Chunks of 2 rows: 3 transactions, with a duplicate spanning chunks
+        with self.settings(PACIENTE_IMPORT_BATCH_SIZE=2):
+            response = self._upload('pacientes.csv', '\n'.join(linhas) + '\n')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual((response.data['total'], response.data['importados'], response.data['com_erro']), (6, 3, 3))
+        erros = {erro['linha']: erro['erros'] for erro in response.data['erros']}
+        self.assertEqual(sorted(erros), [4, 5, 6])
+        self.assertIn('cpf', erros[4])
+        self.assertIn('cpf', erros[5])
+        self.assertEqual(set(erros[6]), {'nascimento', 'email'})
+
+        jose = Paciente.objects.get(email='jose@example.com')
+        self.assertEqual(jose.cpf_digitos, '11111111111')
+        self.assertEqual(jose.busca, 'jose importado 111.111.111-11 11111111111 jose@example.com')
+        self.assertEqual(jose.endereco_cobranca_id, jose.endereco_residencial_id)
+        self.assertEqual(jose.criado_por, self.secretaria_user)
+        maria = Paciente.objects.get(email='maria@example.com')
+        self.assertEqual(maria.endereco_cobranca.uf, 'RJ')
+        self.assertIsNone(Paciente.objects.get(email='ana@example.com').endereco_cobranca)
+        # Imported rows are found by the search index like any other
+        response = self.client.get(reverse('paciente-list'), {'search': 'jose', 'fields': 'email'})
+        self.assertEqual([p['email'] for p in response.data['results']], ['jose@example.com'])
+
+    def test_import_json_array_and_ndjson_streamed(self):
+        endereco = {'cep': '01000-000', 'uf': 'SP', 'cidade': 'São Paulo', 'logradouro': 'Rua', 'bairro': 'Centro'}
+        pacientes = [
+            {'cpf': f'555.555.555-{i:02d}', 'nome': f'Paciente {i}', 'nascimento': '1990-01-01',
+             'celular': '11999999999', 'email': f'json{i}@example.com', 'endereco_residencial': endereco}
+            for i in range(5)
+        ]
+        # Blocks much smaller than an object, so every object spans several reads
+        with mock.patch.object(importacao, 'TAMANHO_BLOCO_JSON', 16):
+            response = self._upload('pacientes.json', json.dumps(pacientes[:3] + ['não é objeto']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual((response.data['importados'], response.data['com_erro']), (3, 1))
+        self.assertEqual(response.data['erros'][0]['linha'], 4)
+
+        ndjson = '\n'.join(json.dumps(p) for p in pacientes[3:])
+        response = self._upload('pacientes.txt', ndjson, formato='json')
+        self.assertEqual(response.data['importados'], 2, response.data)
+        self.assertEqual(Paciente.objects.filter(email__startswith='json').count(), 5)
+
+        response = self._upload('pacientes.json', '[{"cpf": "1"')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('arquivo', response.data)
+
+    def test_import_json_malformed_fails_without_buffering_the_file(self):
+        arquivo = io.StringIO('[{"cpf": x}, ' + '{"nome": "resto do arquivo"}, ' * 1000 + ']')
+        with mock.patch.object(importacao, 'TAMANHO_BLOCO_JSON', 16):
+            with self.assertRaises(json.JSONDecodeError):
+                list(importacao.ler_json(arquivo))
+        self.assertLessEqual(arquivo.tell(), 32) # Not read to the end
+
+        # Well-formed, but one object longer than the limit
+        grande = '[{"nome": "' + 'a' * 200 + '"}]'
+        with mock.patch.object(importacao, 'TAMANHO_BLOCO_JSON', 16), \
+                mock.patch.object(importacao, 'TAMANHO_MAXIMO_OBJETO_JSON', 100):
+            with self.assertRaisesMessage(ValueError, 'Objeto JSON 1 maior que 100 caracteres.'):
+                list(importacao.ler_json(io.StringIO(grande)))
+            with self.assertRaisesMessage(ValueError, 'Objeto JSON 2 maior que 100 caracteres.'):
+                list(importacao.ler_json(io.StringIO('{"nome": "b"}\n' + grande[1:-1] + '\n')))
@@ -1,20 +1,62 @@
-from rest_framework import viewsets, permissions, filters
-from .models import Paciente
+import io
+
+from rest_framework import viewsets, permissions, filters, status
+from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.response import Response
+from django.shortcuts import get_object_or_404
+from django.db.models import Q
+from .models import Paciente, normalize_cpf, normalize_phone
 from .serializers import PacienteSerializer
+from .importacao import FORMATOS, ImportacaoPacientes, detectar_formato, ler_arquivo
+from .search import PacienteSearchFilter
 from usuarios.permissions import IsSecretaria, IsProfissionalSaude
 from django_filters.rest_framework import DjangoFilterBackend # For more advanced filtering if needed
+from core.conditional import ConditionalGetMixin
+from core.exportacao import ExportMixin
+from core.fieldsets import SparseFieldsetMixin
+from core.response_cache import ResponseCacheMixin
 
-class PacienteViewSet(viewsets.ModelViewSet):
-    queryset = Paciente.objects.all().order_by('nome') # Ordem alfabética
+class PacienteViewSet(ResponseCacheMixin, ConditionalGetMixin, SparseFieldsetMixin, ExportMixin, viewsets.ModelViewSet):
+    # Both addresses are nested in the serializer, so join them here instead of one query
+    # per patient. criado_por/modificado_por are rendered as PKs straight from the *_id columns.
+    # ?fields=/?omit= and the compact list drop the joins they do not render (core.fieldsets).
+    queryset = Paciente.objects.select_related(
+        'endereco_residencial', 'endereco_cobranca'
+    ).order_by('nome', 'id') # Ordem alfabética
     serializer_class = PacienteSerializer
     # Permissions: SECRETARIA or PROFISSIONAL_SAUDE
     permission_classes = [permissions.IsAuthenticated, (IsSecretaria | IsProfissionalSaude)]
 
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # PacienteSearchFilter uses the search index on Paciente.busca (nome, cpf, email)
+    filter_backends = [DjangoFilterBackend, PacienteSearchFilter, filters.OrderingFilter]
     search_fields = ['nome', 'cpf', 'email'] # Fields for search
     ordering_fields = ['nome', 'criado_em'] # Fields available for ordering
+    ordering = ['nome', 'id'] # Default ordering, also the pagination keyset
+    # Cached list/retrieve responses render the pacientes and their addresses (see core.response_cache)
+    response_cache_models = ('pacientes.Paciente', 'pacientes.Endereco')
     # filterset_fields = ['endereco_residencial__cidade', 'endereco_residencial__uf'] # Example for DjangoFilterBackend
 
+    # Columns of /api/pacientes/exportar/ (see core.exportacao)
+    export_filename = 'pacientes'
+    export_fields = {
+        'id': 'id',
+        'cpf': 'cpf',
+        'nome': 'nome',
+        'nascimento': 'nascimento',
+        'celular': 'celular',
+        'whatsapp': 'whatsapp',
+        'email': 'email',
+        'cep': 'endereco_residencial__cep',
+        'uf': 'endereco_residencial__uf',
+        'cidade': 'endereco_residencial__cidade',
+        'logradouro': 'endereco_residencial__logradouro',
+        'numero': 'endereco_residencial__numero',
+        'bairro': 'endereco_residencial__bairro',
+        'criado_em': 'criado_em',
+        'atualizado_em': 'atualizado_em',
+    }
+
     # To automatically set criado_por/modificado_por
     def perform_create(self, serializer):
         serializer.save(criado_por=self.request.user)
@@ -22,6 +64,49 @@ class PacienteViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         serializer.save(modificado_por=self.request.user)
 
+    @action(detail=False, methods=['get'], url_path=r'by-cpf/(?P<digits>\d+)')
+    def by_cpf(self, request, digits=None):
+        # Exact lookup on the unique cpf_digitos index, e.g. /api/pacientes/by-cpf/12345678900/
+        paciente = get_object_or_404(self.get_queryset(), cpf_digitos=normalize_cpf(digits))
+        self.check_object_permissions(request, paciente)
+        return Response(self.get_serializer(paciente).data)
+
+    @action(detail=False, methods=['get'], url_path=r'by-phone/(?P<numero>\+?\d+)')
+    def by_phone(self, request, numero=None):
+        # Pacientes whose WhatsApp or mobile is this number, in any format normalize_phone
+        # reads (e.g. the sender of an incoming message, /api/pacientes/by-phone/5511988887777/).
+        # One probe on each E.164 index; a number can be shared, so this is a list.
+        e164 = normalize_phone(numero)
+        if e164 is None:
+            return Response({'numero': ["Número de telefone inválido."]}, status=status.HTTP_400_BAD_REQUEST)
+        pacientes = self.get_queryset().filter(Q(whatsapp_e164=e164) | Q(celular_e164=e164))
+        return Response(self.get_serializer(pacientes, many=True).data)
+
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser, FormParser])
+    def importar(self, request):
+        # Bulk import from a CSV or JSON upload in the 'arquivo' field; the format comes from
+        # the file extension unless 'formato' is given. See pacientes.importacao.
+        arquivo = request.FILES.get('arquivo')
+        if arquivo is None:
+            return Response({'arquivo': ["Envie o arquivo a importar."]}, status=status.HTTP_400_BAD_REQUEST)
+        formato = request.data.get('formato') or detectar_formato(arquivo.name)
+        if formato not in FORMATOS:
+            return Response(
+                {'formato': [f"Informe o formato do arquivo: {', '.join(FORMATOS)}."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are already on disk; either way the
+        # file is decoded and read as a stream.
+        texto = io.TextIOWrapper(arquivo.file, encoding='utf-8-sig', newline='')
+        try:
+            relatorio = ImportacaoPacientes(criado_por=request.user).importar(ler_arquivo(texto, formato))
+        except (ValueError, UnicodeDecodeError) as exc:
+            # Malformed file: chunks before the error stay imported
+            return Response({'arquivo': [f"Arquivo inválido: {exc}"]}, status=status.HTTP_400_BAD_REQUEST)
+        finally:
+            texto.detach()
+        return Response(relatorio)
+
     # Mock city filtering based on UF (could be a separate endpoint or action)
     # This is just a conceptual placeholder.
     # A real implementation might be a GET request to /api/v1/enderecos/cidades/?uf=SP
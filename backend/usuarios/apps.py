@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class UsuariosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'usuarios'
+
+    def ready(self):
+        from .authentication import invalidate_user
+        from .models import CustomUser
+        # Users cached by CachedJWTAuthentication
+        post_save.connect(invalidate_user, sender=CustomUser, dispatch_uid='usuarios_user_cache_save')
+        post_delete.connect(invalidate_user, sender=CustomUser, dispatch_uid='usuarios_user_cache_delete')
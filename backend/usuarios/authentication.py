@@ -0,0 +1,90 @@
+"""
+JWT authentication without a database query per request.
+
+Access tokens carry the user's role (ROLE_CLAIM), and the users they point to are kept in
+a small in-process cache for AUTH_USER_CACHE_TTL seconds, dropped when the CustomUser is
+saved or deleted (see UsuariosConfig.ready). That only clears the cache of the process
+that made the change: the other workers keep the old user until the entry expires. A
+token whose role no longer matches the user's is rejected, so once a worker has loaded
+the new role, tokens issued with the old one stop working there. A role change (or
+deactivation) therefore takes up to AUTH_USER_CACHE_TTL seconds to reach every worker,
+and meanwhile a worker with the old user cached still accepts tokens with the old role.
+"""
+import copy
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from core.cache import TTLCache
+
+ROLE_CLAIM = 'role'
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TTLCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL)
+    return _cache
+
+
+def invalidate_user(sender, instance, **kwargs):
+    """post_save/post_delete receiver for CustomUser."""
+    get_user_cache().delete(str(instance.pk))
+
+
+@receiver(setting_changed)
+def _reset_user_cache(setting, **kwargs):
+    global _cache
+    if setting in ('AUTH_USER_CACHE_SIZE', 'AUTH_USER_CACHE_TTL'):
+        _cache = None
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """/api/token/: the refresh token, and every access token made from it, carry the role."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[ROLE_CLAIM] = user.role
+        return token
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication reading the user from get_user_cache(), and the database on a miss."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError as e:
+            raise InvalidToken("Token contained no recognizable user identification") from e
+
+        cache = get_user_cache()
+        user = cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token) # Also checks is_active and revocation
+            cache.set(user_id, user)
+        else:
+            if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+                raise AuthenticationFailed("User is inactive", code="user_inactive")
+            if api_settings.CHECK_REVOKE_TOKEN and (
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+            ):
+                raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+
+        role = validated_token.get(ROLE_CLAIM)
+        if role is not None and role != user.role:
+            raise AuthenticationFailed("O perfil do usuário mudou. Faça login novamente.", code="role_changed")
+        # Each request gets its own copy: views may set attributes on request.user
+        return copy.copy(user)
@@ -1,6 +1,8 @@
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from .authentication import get_user_cache
 from .models import CustomUser, UserRole
 from django.contrib.auth.hashers import check_password
 
@@ -64,7 +66,7 @@ class UserAuthTests(APITestCase):
         self.client.force_authenticate(user=self.admin_user)
         response = self.client.get(self.users_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertTrue(len(response.data) >= 3) # admin, secretaria, profissional
+        self.assertTrue(len(response.data['results']) >= 3) # admin, secretaria, profissional
 
     def test_list_users_as_secretaria(self):
         # Assuming IsAdminUser permission on UserListView or similar protection
@@ -72,6 +74,30 @@ class UserAuthTests(APITestCase):
         response = self.client.get(self.users_list_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_jwt_carries_role_and_user_is_cached(self):
+        get_user_cache().clear()
+        self.addCleanup(get_user_cache().clear) # Rolled-back users are not invalidated
+
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'secretaria_user', 'password': 'password123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(AccessToken(response.data['access'])['role'], UserRole.SECRETARIA)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        detail_url = reverse('user-detail', kwargs={'pk': self.admin_user.pk})
+
+        with self.assertNumQueries(2): # The user, then the view's own query
+            self.assertEqual(self.client.get(detail_url).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(1): # Cached: only the view's query
+            self.assertEqual(self.client.get(detail_url).status_code, status.HTTP_200_OK)
+
+        # Saving the user drops it from the cache; a token for another role is refused
+        self.secretaria_user.role = UserRole.PROFISSIONAL_SAUDE
+        self.secretaria_user.save()
+        self.assertEqual(self.client.get(detail_url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.secretaria_user.is_active = False
+        self.secretaria_user.role = UserRole.SECRETARIA
+        self.secretaria_user.save()
+        self.assertEqual(self.client.get(detail_url).status_code, status.HTTP_401_UNAUTHORIZED)
+
     # Test permissions classes directly
     def test_permission_classes(self):
         from usuarios.permissions import IsSecretaria, IsProfissionalSaude, IsAdminUser
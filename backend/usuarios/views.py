@@ -4,8 +4,9 @@ from .serializers import UserSerializer, RegisterSerializer
 from .permissions import IsAdminUser # Import the custom permission
 
 class UserListView(generics.ListAPIView):
-    queryset = CustomUser.objects.all()
+    queryset = CustomUser.objects.all().order_by('id')
     serializer_class = UserSerializer
+    ordering = ['id'] # Pagination keyset
     permission_classes = [permissions.IsAuthenticated] # Use the custom admin role permission
 
 class UserDetailView(generics.RetrieveAPIView):
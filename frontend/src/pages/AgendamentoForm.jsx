@@ -1,22 +1,35 @@
 import { useForm } from "react-hook-form";
 import { useNavigate, useParams } from "react-router-dom";
-import { useEffect } from "react";
+import { useEffect, useState } from "react";
 import api from "../services/api";
 
 export default function AgendamentoForm() {
   const { id } = useParams();
   const navigate = useNavigate();
-  const { register, handleSubmit, setValue } = useForm();
+  const { register, handleSubmit, setValue, watch } = useForm();
+  const [livres, setLivres] = useState(null);
+  const [erro, setErro] = useState(null);
+  // One key per form: resubmitting after a network error cannot book twice
+  const [idempotencyKey] = useState(() => crypto.randomUUID());
+  const dataSelecionada = watch("data");
 
   const isEdit = window.location.pathname.includes("/editar");
 
   const onSubmit = async (data) => {
-    if (isEdit) {
-      await api.patch(`/agendamentos/${id}/`, data);
-    } else {
-      await api.post("/agendamentos/", { ...data, paciente_id: id });
+    try {
+      if (isEdit) {
+        await api.patch(`/agendamentos/${id}/`, data);
+      } else {
+        await api.post("/agendamentos/", { ...data, paciente_id: id }, { headers: { "Idempotency-Key": idempotencyKey } });
+      }
+      navigate(`/pacientes/${id}/agendamentos`);
+    } catch (err) {
+      if (err.response?.status === 409) {
+        setErro(err.response.data.detail);
+        return;
+      }
+      throw err;
     }
-    navigate(`/pacientes/${id}/agendamentos`);
   };
 
   const fetchData = async () => {
@@ -35,12 +48,26 @@ export default function AgendamentoForm() {
     }
   }, [id]);
 
+  // Free slots of the chosen day, so the user picks one instead of guessing
+  useEffect(() => {
+    if (!dataSelecionada) return;
+    api
+      .get("/agendamentos/disponibilidade/", { params: { inicio: dataSelecionada, fim: dataSelecionada } })
+      .then((res) => setLivres(res.data.dias[0]?.livres ?? []))
+      .catch(() => setLivres(null));
+  }, [dataSelecionada]);
+
   return (
     <div className="p-8">
       <h1 className="text-3xl mb-4">{isEdit ? "Editar" : "Novo"} Agendamento</h1>
       <form onSubmit={handleSubmit(onSubmit)} className="space-y-4">
         <input {...register("data")} type="date" className="input input-bordered w-full" required />
-        <input {...register("hora")} type="time" className="input input-bordered w-full" required />
+        <input {...register("hora")} type="time" list="horarios-livres" className="input input-bordered w-full" required />
+        <datalist id="horarios-livres">
+          {livres?.map((hora) => <option key={hora} value={hora} />)}
+        </datalist>
+        {erro && <p className="text-sm text-error">{erro}</p>}
+        {livres && livres.length === 0 && <p className="text-sm text-error">Nenhum horário livre nesta data.</p>}
         <textarea {...register("observacoes")} placeholder="Observações" className="textarea textarea-bordered w-full" />
         <button className="btn btn-primary w-full">Salvar</button>
       </form>
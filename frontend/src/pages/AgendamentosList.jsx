@@ -6,10 +6,13 @@ export default function AgendamentosList() {
   const { id } = useParams();
   const navigate = useNavigate();
   const [agendamentos, setAgendamentos] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
 
-  const fetchAgendamentos = async () => {
-    const res = await api.get(`/agendamentos/?paciente__id=${id}`);
-    setAgendamentos(res.data);
+  // A API devolve páginas com cursor: { next, previous, results }
+  const fetchAgendamentos = async (url) => {
+    const res = await api.get(url || `/agendamentos/?paciente__id=${id}`);
+    setAgendamentos((atual) => (url ? [...atual, ...res.data.results] : res.data.results));
+    setNextPage(res.data.next);
   };
 
   useEffect(() => {
@@ -63,6 +66,12 @@ export default function AgendamentosList() {
           </tbody>
         </table>
       </div>
+
+      {nextPage && (
+        <button onClick={() => fetchAgendamentos(nextPage)} className="btn btn-outline mt-4">
+          Carregar mais
+        </button>
+      )}
     </div>
   );
 }
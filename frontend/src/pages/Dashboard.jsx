@@ -1,16 +1,43 @@
+import { useEffect, useState } from "react";
 import { useAuth } from "../contexts/AuthContext";
 import { useNavigate } from "react-router-dom";
+import api from "../services/api";
+
+const INDICADORES = [
+  ["AGENDAMENTOS_EM_ANDAMENTO", "Agendamentos em andamento hoje", "dia"],
+  ["AGENDAMENTOS_CONCLUIDO", "Agendamentos concluídos hoje", "dia"],
+  ["CONSULTAS", "Consultas no mês", "mes"],
+  ["PACIENTES_NOVOS", "Pacientes novos no mês", "mes"],
+];
 
 export default function Dashboard() {
   const { user, logout } = useAuth();
   const navigate = useNavigate();
 
+  const [resumo, setResumo] = useState(null);
+
+  useEffect(() => {
+    // Counters rollup: a handful of rows, no matter how large the tables are
+    api.get("/dashboard/").then((res) => setResumo(res.data)).catch(() => setResumo(null));
+  }, []);
+
   const handleNavigate = (path) => navigate(path);
 
   return (
     <div className="p-8 space-y-4">
       <h1 className="text-3xl font-bold">Bem-vindo, {user?.username}</h1>
 
+      {resumo && (
+        <div className="stats shadow">
+          {INDICADORES.map(([metrica, titulo, periodo]) => (
+            <div key={metrica} className="stat">
+              <div className="stat-title">{titulo}</div>
+              <div className="stat-value">{resumo[periodo][metrica]}</div>
+            </div>
+          ))}
+        </div>
+      )}
+
       <div className="grid grid-cols-1 md:grid-cols-3 gap-5">
         <div className="card bg-base-100 shadow-xl">
           <div className="card-body">
@@ -4,11 +4,14 @@ import { useNavigate } from "react-router-dom";
 
 export default function PacientesList() {
   const [pacientes, setPacientes] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const navigate = useNavigate();
 
-  const fetchPacientes = async () => {
-    const res = await api.get("/pacientes/");
-    setPacientes(res.data);
+  // A API devolve páginas com cursor: { next, previous, results }
+  const fetchPacientes = async (url = "/pacientes/") => {
+    const res = await api.get(url);
+    setPacientes((atual) => (url === "/pacientes/" ? res.data.results : [...atual, ...res.data.results]));
+    setNextPage(res.data.next);
   };
 
   useEffect(() => {
@@ -68,6 +71,12 @@ export default function PacientesList() {
           </tbody>
         </table>
       </div>
+
+      {nextPage && (
+        <button onClick={() => fetchPacientes(nextPage)} className="btn btn-outline mt-4">
+          Carregar mais
+        </button>
+      )}
     </div>
   );
 }